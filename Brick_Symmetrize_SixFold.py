@@ -0,0 +1,37 @@
+### Brick_Symmetrize_SixFold.py
+###
+### This function applies six fold symmetrization to every layer of
+### the current volume data (intended to be a stack of FFTs, e.g. QPI)
+###
+### USING PYGWY REQUIRES 32 BIT GWYDDION AND 32 BIT PYTHON 2.7
+###
+### All layers share one set of rotation maps from gwyscripts.symmetrize
+### and are processed in batches spread over a few threads.
+
+import gwy
+import os
+import sys
+
+try:
+	_plugin_dir=os.path.dirname(os.path.abspath(__file__))
+except NameError:
+	_plugin_dir=os.path.join(os.path.expanduser('~'),'gwyddion' if os.name=='nt' else '.gwyddion','pygwy')
+if _plugin_dir not in sys.path:
+	sys.path.insert(0,_plugin_dir)
+
+plugin_menu="/Symmetrize/Volume/Six Fold Symmetrization"
+plugin_type="PROCESS"
+
+def run():
+	from gwyscripts import symmetrize
+	
+	### get the current volume data
+	
+	brick=gwy.gwy_app_data_browser_get_current(gwy.APP_BRICK)
+	if brick is None:
+		return
+	
+	### average every layer with its rotations by multiples of 60 degrees
+	symmetrize.symmetrize_brick(brick,6)
+	
+	brick.data_changed()
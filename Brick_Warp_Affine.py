@@ -0,0 +1,89 @@
+### Brick_Warp_Affine.py
+###
+### This function applies one affine warp (e.g. a drift or piezo
+### distortion correction) to every layer of the current volume data
+###
+### USING PYGWY REQUIRES 32 BIT GWYDDION AND 32 BIT PYTHON 2.7
+###
+### The transform is kept in the Gwyddion settings, set it once from the
+### pygwy console with
+###
+###   import Brick_Warp_Affine
+###   Brick_Warp_Affine.set_transform([[1.0,0.02],[0.0,1.0]],(0.5,0.0))
+###
+### Until a transform is set the menu entry only says how to set one.
+###
+### Every pixel of a layer then samples the original layer at
+### matrix . (pixel - center) + center + offset, in pixels from the
+### center of the layer. All layers share one set of sampling maps from
+### gwyscripts.warp and are processed in batches spread over a few threads.
+
+import gwy
+import os
+import sys
+
+try:
+	_plugin_dir=os.path.dirname(os.path.abspath(__file__))
+except NameError:
+	_plugin_dir=os.path.join(os.path.expanduser('~'),'gwyddion' if os.name=='nt' else '.gwyddion','pygwy')
+if _plugin_dir not in sys.path:
+	sys.path.insert(0,_plugin_dir)
+
+plugin_menu="/Symmetrize/Volume/Affine Warp"
+plugin_type="PROCESS"
+
+_settings_prefix="/module/brick_warp_affine/"
+_settings_keys=("xx","xy","yx","yy","x_offset","y_offset")
+
+### Store the transform used by the menu entry
+def set_transform(matrix, offset=(0.0,0.0)):
+	settings=gwy.gwy_app_settings_get()
+	values=[matrix[0][0],matrix[0][1],matrix[1][0],matrix[1][1],offset[0],offset[1]]
+	for key,value in zip(_settings_keys,values):
+		settings.set_double_by_name(_settings_prefix+key,float(value))
+
+### True once set_transform has stored a transform
+def has_transform():
+	settings=gwy.gwy_app_settings_get()
+	return any(settings.contains_by_name(_settings_prefix+key) for key in _settings_keys)
+
+### Read the stored transform, the identity if none was set
+def get_transform():
+	settings=gwy.gwy_app_settings_get()
+	values=[1.0,0.0,0.0,1.0,0.0,0.0]
+	for i,key in enumerate(_settings_keys):
+		if settings.contains_by_name(_settings_prefix+key):
+			values[i]=settings.get_double_by_name(_settings_prefix+key)
+	return [values[0:2],values[2:4]],tuple(values[4:6])
+
+### Tell the user in a dialog, or on the console without GTK
+def show_message(text):
+	try:
+		import gtk
+	except ImportError:
+		print(text)
+		return
+	dialog=gtk.MessageDialog(None,gtk.DIALOG_MODAL,gtk.MESSAGE_INFO,gtk.BUTTONS_OK,text)
+	dialog.run()
+	dialog.destroy()
+
+def run():
+	### get the current volume data
+
+	brick=gwy.gwy_app_data_browser_get_current(gwy.APP_BRICK)
+	if brick is None:
+		return
+
+	### warping with the identity would only cost time
+	if not has_transform():
+		show_message("No affine warp has been set. Set one from the pygwy console with\n\n"
+			"import Brick_Warp_Affine\nBrick_Warp_Affine.set_transform(matrix,offset)")
+		return
+
+	from gwyscripts import warp
+
+	### warp every layer with the same sampling maps
+	matrix,offset=get_transform()
+	warp.warp_brick(brick,matrix,offset)
+
+	brick.data_changed()
@@ -0,0 +1,39 @@
+### DataField_Symmetrize_SixFold.py
+###
+### This function allows quick six fold symmetrization of an image
+### (intended to be of a FFT)
+###
+### USING PYGWY REQUIRES 32 BIT GWYDDION AND 32 BIT PYTHON 2.7
+###
+### The averaging itself is done by gwyscripts.symmetrize, which caches
+### the rotation maps so repeated use on same sized images is fast.
+
+import gwy
+import os
+import sys
+
+try:
+	_plugin_dir=os.path.dirname(os.path.abspath(__file__))
+except NameError:
+	_plugin_dir=os.path.join(os.path.expanduser('~'),'gwyddion' if os.name=='nt' else '.gwyddion','pygwy')
+if _plugin_dir not in sys.path:
+	sys.path.insert(0,_plugin_dir)
+
+plugin_menu="/Symmetrize/Six Fold Symmetrization"
+plugin_type="PROCESS"
+
+def run():
+	from gwyscripts import symmetrize
+	
+	### Create undo point
+	#key=gwy.gwy_app_data_browser_get_current(gwy.APP_DATA_FIELD_KEY)
+	#gwy.gwy_app_undo_checkpoint(gwy.data, [key])
+	
+	### get Data Field
+	
+	originalDField=gwy.gwy_app_data_browser_get_current(gwy.APP_DATA_FIELD)
+	
+	### average with the rotations by multiples of 60 degrees
+	symmetrize.symmetrize_datafield(originalDField,6)
+	
+	originalDField.data_changed()
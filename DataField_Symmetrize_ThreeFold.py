@@ -5,16 +5,26 @@
 ###
 ### USING PYGWY REQUIRES 32 BIT GWYDDION AND 32 BIT PYTHON 2.7
 ###
-###
+### The averaging itself is done by gwyscripts.symmetrize, which caches
+### the rotation maps so repeated use on same sized images is fast.
 
 import gwy
+import os
+import sys
+
+try:
+	_plugin_dir=os.path.dirname(os.path.abspath(__file__))
+except NameError:
+	_plugin_dir=os.path.join(os.path.expanduser('~'),'gwyddion' if os.name=='nt' else '.gwyddion','pygwy')
+if _plugin_dir not in sys.path:
+	sys.path.insert(0,_plugin_dir)
 
 plugin_menu="/Symmetrize/Three Fold Symmetrization"
 plugin_type="PROCESS"
 
-PI=3.14159265359
-
 def run():
+	from gwyscripts import symmetrize
+	
 	### Create undo point
 	#key=gwy.gwy_app_data_browser_get_current(gwy.APP_DATA_FIELD_KEY)
 	#gwy.gwy_app_undo_checkpoint(gwy.data, [key])
@@ -22,14 +32,8 @@ def run():
 	### get Data Field
 	
 	originalDField=gwy.gwy_app_data_browser_get_current(gwy.APP_DATA_FIELD)
-	dummyDF=originalDField.new_alike()
-	
-	sixtyDegreeField=originalDField.new_rotated(dummyDF,60.*(PI/180.),gwy.INTERPOLATION_LINEAR,gwy.ROTATE_RESIZE_SAME_SIZE)
-	
-	onetwentyDegreeField=originalDField.new_rotated(dummyDF,120.*(PI/180.),gwy.INTERPOLATION_LINEAR,gwy.ROTATE_RESIZE_SAME_SIZE)
 	
-	originalDField.sum_fields(originalDField,sixtyDegreeField)
-	originalDField.sum_fields(originalDField,onetwentyDegreeField)
-	originalDField.multiply(1./3.)
+	### average with the rotations by multiples of 120 degrees
+	symmetrize.symmetrize_datafield(originalDField,3)
 	
 	originalDField.data_changed()
@@ -4,8 +4,9 @@
 ### 
 ### USING PYGWY REQUIRES 32 BIT GWYDDION AND 32 BIT PYTHON 2.7
 ### 
-### This program will utilize the nanonispy (made for Python 3.x) library by copying the necessary
-### parts into this program (directory?) and changing them for Python 2.7
+### The parsing itself lives in gwyscripts/nanonis.py, which utilizes the nanonispy
+### (made for Python 3.x) library by copying the necessary parts and changing them
+### for Python 2.7
 
 
 
@@ -15,425 +16,13 @@ import gwy #pygwy modules and functions
 
 import os
 import sys
-import numpy as np
 
-### CREATE INTERFACE TO LOAD load 3ds
-#########################################################
-_end_tags = dict(grid=':HEADER_END:', scan='SCANIT_END', spec='[DATA]')
-
-class NanonisFile(object):
-
-    """
-    Base class for Nanonis data files (grid, scan, point spectroscopy).
-
-    Handles methods and parsing tasks common to all Nanonis files.
-
-    Parameters
-    ----------
-    fname : str
-        Name of Nanonis file.
-
-    Attributes
-    ----------
-    datadir : str
-        Directory path for Nanonis file.
-    basename : str
-        Just the filename, no path.
-    fname : str
-        Full path of Nanonis file.
-    filetype : str
-        filetype corresponding to filename extension.
-    byte_offset : int
-        Size of header in bytes.
-    header_raw : str
-        Unproccessed header information.
-    """
-
-    def __init__(self, fname):
-        self.datadir, self.basename = os.path.split(fname)
-        self.fname = fname
-        self.filetype = self._determine_filetype()
-        self.byte_offset = self.start_byte()
-        self.header_raw = self.read_raw_header(self.byte_offset)
-
-    def _determine_filetype(self):
-        """
-        Check last three characters for appropriate file extension,
-        raise error if not.
-
-        Returns
-        -------
-        str
-            Filetype name associated with extension.
-
-        Raises
-        ------
-        UnhandledFileError
-            If last three characters of filename are not one of '3ds',
-            'sxm', or 'dat'.
-        """
-
-        if self.fname[-3:] == '3ds':
-            return 'grid'
-        elif self.fname[-3:] == 'sxm':
-            return 'scan'
-        elif self.fname[-3:] == 'dat':
-            return 'spec'
-        else:
-            raise UnhandledFileError('{} is not a supported filetype or does not exist'.format(self.basename))
-
-    def read_raw_header(self, byte_offset):
-        """
-        Return header as a raw string.
-
-        Everything before the end tag is considered to be part of the header.
-        the parsing will be done later by subclass methods.
-
-        Parameters
-        ----------
-        byte_offset : int
-            Size of header in bytes. Read up to this point in file.
-
-        Returns
-        -------
-        str
-            Contents of filename up to byte_offset as a decoded binary
-            string.
-        """
-
-        with open(self.fname, 'rb') as f:
-            return f.read(byte_offset).decode(encoding="latin1")
-
-    def start_byte(self):
-        """
-        Find first byte after end tag signalling end of header info.
-
-        Caveat, I believe this is the first byte after the end of the
-        line that the end tag is found on, not strictly the first byte
-        directly after the end tag is found. For example in Scan
-        __init__, byte_offset is incremented by 4 to account for a
-        'start' byte that is not actual data.
-
-        Returns
-        -------
-        int
-            Size of header in bytes.
-        """
-
-        with open(self.fname, 'rb') as f:
-            tag = _end_tags[self.filetype]
-
-            # Set to a default value to know if end_tag wasn't found
-            byte_offset = -1
-
-            for line in iter(f.readline,''):
-                # Convert from bytes to str
-                entry = line.strip().decode()
-                if tag in entry:
-                    byte_offset = f.tell()
-                    break
-
-            if byte_offset == -1:
-                raise FileHeaderNotFoundError(
-                        'Could not find the {} end tag in {}'.format(tag, self.basename)
-                        )
-        return byte_offset
-
-class Grid(NanonisFile):
-
-    """
-    Nanonis grid file class.
-
-    Contains data loading method specific to Nanonis grid file. Nanonis
-    3ds files contain a header terminated by '\r\n:HEADER_END:\r\n'
-    line, after which big endian encoded binary data starts. A grid is
-    always recorded in an 'up' direction, and data is recorded
-    sequentially starting from the first pixel. The number of bytes
-    corresponding to a single pixel will depend on the experiment
-    parameters. In general the size of one pixel will be a sum of
-
-        - # fixed parameters
-        - # experimental parameters
-        - # sweep signal points (typically bias).
-
-    Hence if there are 2 fixed parameters, 8 experimental parameters,
-    and a 512 point bias sweep, a pixel will account 4 x (522) = 2088
-    bytes of data. The class intuits this from header info and extracts
-    the data for you and cuts it up into each channel, though normally
-    this should be just the current.
-
-    Currently cannot accept grids that are incomplete.
-
-    Parameters
-    ----------
-    fname : str
-        Filename for grid file.
-
-    Attributes
-    ----------
-    header : dict
-        Parsed 3ds header. Relevant fields are converted to float,
-        otherwise most are string values.
-    signals : dict
-        Dict keys correspond to channel name, with values being the
-        corresponding data array.
-
-    Raises
-    ------
-    UnhandledFileError
-        If fname does not have a '.3ds' extension.
-    """
-
-    def __init__(self, fname):
-        _is_valid_file(fname, ext='3ds')
-        super(Grid,self).__init__(fname)
-        self.header = _parse_3ds_header(self.header_raw)
-        self.signals = self._load_data()
-        self.signals['sweep_signal'] = self._derive_sweep_signal()
-        self.signals['topo'] = self._extract_topo()
-
-    def _load_data(self):
-        """
-        Read binary data for Nanonis 3ds file.
-
-        Returns
-        -------
-        dict
-            Channel name keyed dict of 3d array.
-        """
-        # load grid params
-        nx, ny = self.header['dim_px']
-        num_sweep = self.header['num_sweep_signal']
-        num_param = self.header['num_parameters']
-        num_chan = self.header['num_channels']
-        data_dict = dict()
-
-        # open and seek to start of data
-        f = open(self.fname, 'rb')
-        f.seek(self.byte_offset)
-        data_format = '>f4'
-        griddata = np.fromfile(f, dtype=data_format)
-        f.close()
-
-        # pixel size in bytes
-        exp_size_per_pix = num_param + num_sweep*num_chan
-        
-        # reshape from 1d to 3d
-        griddata_shaped = griddata.reshape((nx, ny, exp_size_per_pix))
-
-        # experimental parameters are first num_param of every pixel
-        params = griddata_shaped[:, :, :num_param]
-        data_dict['params'] = params
-
-        # extract data for each channel
-        for i, chann in enumerate(self.header['channels']):
-            start_ind = num_param + i * num_sweep
-            stop_ind = num_param + (i+1) * num_sweep
-            data_dict[chann] = griddata_shaped[:, :, start_ind:stop_ind]
-
-        return data_dict
-
-    def _derive_sweep_signal(self):
-        """
-        Computer sweep signal.
-
-        Based on start and stop points of sweep signal in header, and
-        number of sweep signal points.
-
-        Returns
-        -------
-        numpy.ndarray
-            1d sweep signal, should be sample bias in most cases.
-        """
-        # find sweep signal start and end from a given pixel value
-        sweep_start, sweep_end = self.signals['params'][0, 0, :2]
-        num_sweep_signal = self.header['num_sweep_signal']
-
-        return np.linspace(sweep_start, sweep_end, num_sweep_signal, dtype=np.float32)
-
-    def _extract_topo(self):
-        """
-        Extract topographic map based on z-controller height at each
-        pixel.
-
-        The data is already extracted, though it lives in the signals
-        dict under the key 'parameters'. Currently the 4th column is the
-        Z (m) information at each pixel, should update this to be more
-        general in case the fixed/experimental parameters are not the
-        same for other Nanonis users.
-
-        Returns
-        -------
-        numpy.ndarray
-            Copy of already extracted data to be more easily accessible
-            in signals dict.
-        """
-        return self.signals['params'][:, :, 4]
-
-class UnhandledFileError(Exception):
-
-    """
-    To be raised when unknown file extension is passed.
-    """
-    pass
-
-
-class FileHeaderNotFoundError(Exception):
-
-    """
-    To be raised when no header information could be determined.
-    """
-    pass
-
-
-def _parse_3ds_header(header_raw):
-    """
-    Parse raw header string.
-
-    Empirically done based on Nanonis header structure. See Grid
-    docstring or Nanonis help documentation for more details.
-
-    Parameters
-    ----------
-    header_raw : str
-        Raw header string from read_raw_header() method.
-
-    Returns
-    -------
-    dict
-        Channel name keyed dict of 3d array.
-    """
-    # cleanup string and remove end tag as entry
-    header_entries = header_raw.split('\r\n')
-    header_entries = header_entries[:-2]
-
-    # software version 'generic 5' had an extra header entry
-    if header_entries[2] == 'Filetype=Linear':
-        header_entries.pop(2)
-
-    header_dict = dict()
-
-    # grid dimensions in pixels
-    dim_px_str = _split_header_entry(header_entries[0])
-    header_dict['dim_px'] = [int(val) for val in dim_px_str.split(' x ')]
-
-    # grid frame center position, size, angle
-    grid_str = _split_header_entry(header_entries[1], multiple=True)
-    header_dict['pos_xy'] = [float(val) for val in grid_str[:2]]
-    header_dict['size_xy'] = [float(val) for val in grid_str[2:4]]
-    header_dict['angle'] = float(grid_str[-1])
-
-    # sweep signal
-    header_dict['sweep_signal'] = _split_header_entry(header_entries[2])
-
-    # fixed parameters
-    header_dict['fixed_parameters'] = _split_header_entry(header_entries[3], multiple=True)
-
-    # experimental parameters
-    header_dict['experimental_parameters'] = _split_header_entry(header_entries[4], multiple=True)
-
-    # number of parameters (each 4 bytes)
-    header_dict['num_parameters'] = int(_split_header_entry(header_entries[5]))
-
-    # experiment size in bytes
-    header_dict['experiment_size'] = int(_split_header_entry(header_entries[6]))
-
-    # number of points of sweep signal
-    header_dict['num_sweep_signal'] = int(_split_header_entry(header_entries[7]))
-
-    # channel names
-    header_dict['channels'] = _split_header_entry(header_entries[8], multiple=True)
-    header_dict['num_channels'] = len(header_dict['channels'])
-
-    # measure delay
-    header_dict['measure_delay'] = float(_split_header_entry(header_entries[9]))
-
-    # metadata
-    header_dict['experiment_name'] = _split_header_entry(header_entries[10])
-    header_dict['start_time'] = _split_header_entry(header_entries[11])
-    header_dict['end_time'] = _split_header_entry(header_entries[12])
-    header_dict['user'] = _split_header_entry(header_entries[13])
-    header_dict['comment'] = _split_header_entry(header_entries[14])
-
-    return header_dict
-
-def _split_header_entry(entry, multiple=False):
-    """
-    Split 3ds header entries by '=' character. If multiple values split
-    those by ';' character.
-    """
-
-    _, val_str = entry.split("=")
-
-    if multiple:
-        return val_str.strip('"').split(';')
-    else:
-        return val_str.strip('"')
-        
-def save_array(file, arr, allow_pickle=True):
-    """
-    Wrapper to numpy.save method for arrays.
-
-    The idea would be to use this to save a processed array for later
-    use in a matplotlib figure generation scripts. See numpy.save
-    documentation for details.
-
-    Parameters
-    ----------
-    file : file or str
-        File or filename to which the data is saved.  If file is a file-
-        object, then the filename is unchanged.  If file is a string, a
-        ``.npy`` extension will be appended to the file name if it does
-        not already have one.
-    arr : array_like
-        Array data to be saved.
-    allow_pickle : bool, optional
-        Allow saving object arrays using Python pickles. Reasons for
-        disallowing pickles include security (loading pickled data can
-        execute arbitrary code) and portability (pickled objects may not
-        be loadable on different Python installations, for example if
-        the stored objects require libraries that are not available, and
-        not all pickled data is compatible between Python 2 and Python
-        3). Default: True
-    """
-    np.save(file, arr, allow_pickle=allow_pickle)
-    
-def load_array(file, allow_pickle=True):
-    """
-    Wrapper to numpy.load method for binary files.
-
-    See numpy.load documentation for more details.
-
-    Parameters
-    ----------
-    file : file or str
-        The file to read. File-like objects must support the
-    ``seek()`` and ``read()`` methods. Pickled files require that the
-    file-like object support the ``readline()`` method as well.
-    allow_pickle : bool, optional
-        Allow loading pickled object arrays stored in npy files. Reasons
-        for disallowing pickles include security, as loading pickled
-        data can execute arbitrary code. If pickles are disallowed,
-        loading object arrays will fail. Default: True
-
-    Returns
-    -------
-    result : array, tuple, dict, etc.
-        Data stored in the file. For ``.npz`` files, the returned
-        instance of NpzFile class must be closed to avoid leaking file
-        descriptors.
-    """
-    return np.load(file)
-    
-def _is_valid_file(fname, ext):
-    """
-    Detect if invalid file is being initialized by class.
-    """
-    if fname[-3:] != ext:
-        raise UnhandledFileError('{} is not a {} file'.format(fname, ext))
-
-### END INTERFACE TO LOAD 3ds
-###############################################################
+try:
+    _plugin_dir = os.path.dirname(os.path.abspath(__file__))
+except NameError:
+    _plugin_dir = os.path.join(os.path.expanduser('~'), 'gwyddion' if os.name == 'nt' else '.gwyddion', 'pygwy')
+if _plugin_dir not in sys.path:
+    sys.path.insert(0, _plugin_dir)
 
 
 
@@ -442,6 +31,22 @@ def _is_valid_file(fname, ext):
 plugin_type = "FILE"
 plugin_desc = "3ds file format used by Nanonis for Grid Spectroscopy"
 
+### Grids whose Bricks would need more memory than this are opened as a
+### preview of a few bias maps instead, which 32 bit Gwyddion can hold.
+### Set GWYSCRIPTS_MAX_LOAD_MB to change the limit.
+max_load_mb = 1024
+preview_slices = 8
+
+### Grids whose selected data takes at most this many MB as float32 are
+### read into memory and decoded by a few threads, larger ones are
+### memory-mapped so only the channel being copied is paged in.
+max_decode_mb = 256
+
+### Without a statistics argument, the statistics for the colour ranges
+### are computed for grids with the on-disk cache, where that happens
+### once per file, and for grids of at most this many MB as float32.
+max_statistics_mb = 64
+
 ### The pygwy interface requires four functions for loading and saving files
 ### They are detect_by_filename, detect_by_content, load, and save.
 ### Each function needs specific inputs and return types.
@@ -462,28 +67,110 @@ def detect_by_content(filename, head, tail, filesize):
 
 ### Load the file into the Gwyddion data types.		
 
-def load(filename, mode=None):
+def load(filename, mode=None, channels=None, sweep_range=None, binning=1,
+	sweep_step=1, sweep_average=False, preview=None, derived=None, parameters=None,
+	features=None, statistics=None):
+	from gwyscripts import features as featuremaps, gridcache, gridstats, loadprofile, nanonis, transfer
+	
+	### With GWYSCRIPTS_PROFILE set every stage below is timed, see
+	### gwyscripts/loadprofile.py. Otherwise the stages cost nothing.
+	profile=loadprofile.profile(filename)
+	
 	### Load returns a container object, initialize here
 	mainC=gwy.Container()
 	
-	### Load the file into the Nanonispy Grid object
-	grid=Grid(filename) 
+	### Scripts can ask for k x k binning, every sweep_step-th (or with
+	### sweep_average the mean of sweep_step) sweep points, or a preview of
+	### a few bias maps, see nanonis.Grid. These are computed while reading
+	### the file and keep only the reduced data in memory. A grid opened
+	### from the GUI that would not fit in max_load_mb gets a preview.
+	### Derived channels and feature maps need the whole sweep, a preview
+	### only has a few bias maps to compute them from.
+	sweep_data=bool(derived or features)
+	if preview is not None and sweep_data:
+		raise ValueError("derived channels and features need the whole sweep, they cannot be computed from a preview")
+	reduced=binning>1 or sweep_step>1 or preview is not None
+	mmap=True
+	if not reduced:
+		header=nanonis.read_grid_header(filename)
+		dim_x,dim_y=header.get("dim_px")
+		load_channels,(start,stop)=nanonis.select_grid_data(header,channels,sweep_range,filename)
+		voxels=float(dim_x)*dim_y*(stop-start)*len(load_channels)
+		mmap=4*voxels>max_decode_mb*1024*1024
+		### The float64 Bricks, plus the float32 data they are copied from
+		### unless it is memory-mapped. The transfer writes straight into
+		### the Brick without a float64 temporary, so this is the peak.
+		load_bytes=(8 if mmap else 12)*voxels
+		if load_bytes>float(os.environ.get("GWYSCRIPTS_MAX_LOAD_MB",max_load_mb))*1024*1024:
+			if sweep_data:
+				raise ValueError(str(filename)+" is too large to load whole for derived channels or features, "
+					"select fewer channels or a sweep_range, use binning or raise GWYSCRIPTS_MAX_LOAD_MB")
+			preview=preview_slices
+			reduced=True
+	
+	### Load the file into the Nanonispy Grid object. A grid that fits in
+	### max_decode_mb is read and decoded to native float32 by a few threads
+	### at once, so the statistics and the Brick copies below do not
+	### byte-swap it again. Larger grids are memory-mapped so only the
+	### channel being copied is paged in.
+	### Scripts can pass channels and sweep_range to load only a subset,
+	### then only those parts of every pixel are read.
+	### With the GWYSCRIPTS_CACHE environment variable set, the decoded data
+	### is kept in an on-disk cache and reopening the file maps it directly.
+	cached=gridcache.enabled() and not reduced
+	grid=nanonis.Grid(filename, mmap=mmap, channels=channels, sweep_range=sweep_range,
+		cache=cached, profile=profile, binning=binning,
+		sweep_step=sweep_step, sweep_average=sweep_average, preview=preview)
 	
 	### Unpack the file for clarity, assuming the header format is constant.
 	
-	dim_x, dim_y=grid.header.get("dim_px")
-	real_x, real_y= grid.header.get("size_xy")
-	pos_x, pos_y = grid.header.get("pos_xy")
-	channels=grid.header.get("channels")
-	num_sweep_signal=grid.header.get("num_sweep_signal")
+	dim_x, dim_y=grid.dim_px
+	real_x, real_y= grid.size_xy
+	origin=grid_origin(grid)
+	channels=grid.channels
+	sweep=grid.signals.get("sweep_signal")
+	num_sweep_signal=len(sweep)
 	num_parameters=grid.header.get("num_parameters")
 	experimental_parameters=grid.header.get("experimental_parameters")
-	sweep_size=abs(grid.signals.get("sweep_signal")[0]-grid.signals.get("sweep_signal")[-1])
+	sweep_size=abs(sweep[0]-sweep[-1])
+	
+	### Single pass statistics of every channel, for the colour ranges and
+	### the metadata. They take longer than reading a large file, so unless
+	### a script asks for them they are only computed where that is cheap,
+	### see max_statistics_mb.
+	if statistics is None:
+		statistics=(cached or
+			4.0*dim_x*dim_y*num_sweep_signal*len(channels)<=max_statistics_mb*1024*1024)
+	if statistics:
+		with profile.stage("statistics"):
+			stats=[grid.statistics(chann) for chann in channels]
+			topoStats=grid.statistics("topo")
+		stats_range=lambda i,k: gridstats.colour_range(stats[i],layer=k)
+	
+	### A preview holds a few bias maps per channel, load them as images
+	if grid.preview is not None:
+		for i in range(len(channels)):
+			volData=grid.signals.get(channels[i])
+			for k in range(num_sweep_signal):
+				index=1+i*num_sweep_signal+k
+				tmpDataField=gwy.DataField(dim_x,dim_y,real_x,real_y,1)
+				_set_origin(tmpDataField,origin)
+				transfer.array_to_datafield(volData[:,:,k],tmpDataField)
+				tmpDataField.set_si_unit_xy(gwy.SIUnit("m"))
+				tmpDataField.set_si_unit_z(gwy.SIUnit("V" if "(V)" in channels[i] else "A"))
+				mainC.set_object_by_name("/"+str(index)+"/data",tmpDataField)
+				mainC.set_string_by_name("/"+str(index)+"/data/title",
+					str(channels[i])+" at "+"%g"%sweep[k]+" V (preview)")
+				mainC.set_boolean_by_name("/"+str(index)+"/data/visible",False)
+				if statistics:
+					_set_colour_range(mainC,"/"+str(index)+"/base",stats_range(i,k))
 	
 	### Need to be able to load a arbitrary amount of 3D channel data
-	for i in range(len(channels)):
+	for i in range(len(channels) if grid.preview is None else 0):
 		###Create the gwy Brick object and set dim/units
 		tmpBrick=gwy.Brick(dim_x,dim_y,num_sweep_signal,real_x,real_y,sweep_size,1)
+		_set_origin(tmpBrick,origin)
+		tmpBrick.set_zoffset(min(sweep[0],sweep[-1]))
 		tmpBrick.set_si_unit_x(gwy.SIUnit("m"))
 		tmpBrick.set_si_unit_y(gwy.SIUnit("m"))
 		tmpBrick.set_si_unit_z(gwy.SIUnit("V"))
@@ -492,35 +179,66 @@ def load(filename, mode=None):
 		else:
 			tmpBrick.set_si_unit_w(gwy.SIUnit("A"))
 			
-		### Transfer data to grid object	
+		### Transfer data to grid object in one bulk copy. In mmap mode
+		### this is also where the channel is read from the file.
 		volData=grid.signals.get(channels[i])
-		for x in range(dim_x):
-			for y in range(dim_y):
-				for z in range(num_sweep_signal):
-					tmpBrick.set_val(x,y,z,volData[x,y,z])
+		with profile.stage("brick "+str(channels[i]),volData.nbytes):
+			transfer.array_to_brick(volData,tmpBrick)
 					
 		###Load Brick into main Container
 		mainC.set_object_by_name("/brick/"+str(i),tmpBrick)
 		
 		###Create a preview by slicing the volume data
-		tmpPreviewDataField=gwy.DataField(dim_x, dim_y, real_x, real_y,1)
-		tmpBrick.extract_plane(tmpPreviewDataField,0,0,0,dim_x,dim_y,-1,True)
+		with profile.stage("preview "+str(channels[i])):
+			tmpPreviewDataField=gwy.DataField(dim_x, dim_y, real_x, real_y,1)
+			_set_origin(tmpPreviewDataField,origin)
+			tmpBrick.extract_plane(tmpPreviewDataField,0,0,0,dim_x,dim_y,-1,True)
 		mainC.set_object_by_name("/brick/"+str(i)+"/preview",tmpPreviewDataField)
 		
 		### set title of volume data
-		mainC.set_string_by_name("/brick/"+str(i)+"/title",str(channels[i]))
+		title=str(channels[i])
+		if grid.binning>1:
+			title+=" (binned "+str(grid.binning)+"x"+str(grid.binning)+")"
+		mainC.set_string_by_name("/brick/"+str(i)+"/title",title)
+		
+		### The sweep direction is lost in the Brick z axis, keep it for save()
+		mainC.set_double_by_name("/brick/"+str(i)+"/sweep_start",float(sweep[0]))
+		mainC.set_double_by_name("/brick/"+str(i)+"/sweep_end",float(sweep[-1]))
 		
 		### Make sure data is visible upon loading 
 		mainC.set_boolean_by_name("/brick/"+str(i)+"/visible",False)
 		
-		### TO DO: figure out how to store the meta data in Container
+		### Channel statistics go with the volume data
+		if statistics:
+			metaC=gwy.Container()
+			summary=grid.header["statistics"][channels[i]]
+			for name,key in (("Minimum","min"),("Maximum","max"),("Mean","mean"),("RMS","std")):
+				metaC.set_string_by_name(name,"%g"%summary[key])
+			metaC.set_string_by_name("Colour range","%g to %g"%summary["colour_range"])
+			mainC.set_object_by_name("/brick/"+str(i)+"/meta",metaC)
+		
+	### Derived channels requested by a script as (kind, channel) pairs,
+	### e.g. derived=[("didv","Current (A)")], follow the raw channels
+	for j,(kind,chann) in enumerate(derived or []):
+		index=len(channels)+j
+		with profile.stage(kind+" "+str(chann)):
+			tmpBrick=derived_brick(grid,kind,chann)
+		mainC.set_object_by_name("/brick/"+str(index),tmpBrick)
+		tmpPreviewDataField=gwy.DataField(dim_x, dim_y, real_x, real_y,1)
+		_set_origin(tmpPreviewDataField,origin)
+		tmpBrick.extract_plane(tmpPreviewDataField,0,0,0,dim_x,dim_y,-1,True)
+		mainC.set_object_by_name("/brick/"+str(index)+"/preview",tmpPreviewDataField)
+		mainC.set_string_by_name("/brick/"+str(index)+"/title",_derived_titles[kind].format(chann))
+		mainC.set_double_by_name("/brick/"+str(index)+"/sweep_start",float(sweep[0]))
+		mainC.set_double_by_name("/brick/"+str(index)+"/sweep_end",float(sweep[-1]))
+		mainC.set_boolean_by_name("/brick/"+str(index)+"/visible",False)
 		
 	###Load the topograph to display as well
-	topoDataField=gwy.DataField(dim_x,dim_y,real_x,real_y,1)
 	topo=grid.signals.get('topo')
-	for x in range(dim_x):
-		for y in range(dim_y):
-			topoDataField.set_val(x,y,topo[x,y])
+	with profile.stage("topo",topo.nbytes):
+		topoDataField=gwy.DataField(dim_x,dim_y,real_x,real_y,1)
+		_set_origin(topoDataField,origin)
+		transfer.array_to_datafield(topo,topoDataField)
 	
 	topoDataField.set_si_unit_xy(gwy.SIUnit('m'))
 	topoDataField.set_si_unit_z(gwy.SIUnit('m'))
@@ -528,9 +246,282 @@ def load(filename, mode=None):
 	mainC.set_object_by_name("/0/data",topoDataField)
 	mainC.set_string_by_name("/0/data/title","topo")
 	mainC.set_boolean_by_name("/0/data/visible",True)
+	if statistics:
+		_set_colour_range(mainC,"/0/base",gridstats.colour_range(topoStats))
+	
+	### Keep the header fields and the per pixel parameters that have no
+	### place in the Bricks, so save() can write them back
+	for key in _header_strings:
+		mainC.set_string_by_name("/3ds/"+key,str(grid.header.get(key,"")))
+	for key in ("fixed_parameters","experimental_parameters"):
+		mainC.set_string_by_name("/3ds/"+key,";".join(grid.header.get(key)))
+	mainC.set_double_by_name("/3ds/angle",float(grid.header.get("angle")))
+	mainC.set_double_by_name("/3ds/measure_delay",float(grid.header.get("measure_delay")))
+	params=grid.signals.get("params")
+	paramBrick=gwy.Brick(dim_x,dim_y,params.shape[2],real_x,real_y,params.shape[2],False)
+	_set_origin(paramBrick,origin)
+	with profile.stage("params",params.nbytes):
+		transfer.array_to_brick(params,paramBrick)
+	mainC.set_object_by_name("/3ds/params",paramBrick)
+	
+	### Parameter maps requested by name, e.g. parameters=["Current (A)","X (m)"]
+	### to look at the setpoint current or the drift during the grid.
+	### grid.parameters holds views of the parameter block, so each map is
+	### copied only once, straight into its DataField.
+	first_index=1+(len(channels)*num_sweep_signal if grid.preview is not None else 0)
+	for j,name in enumerate(parameters or []):
+		if name not in grid.parameters:
+			raise ValueError(str(name)+" is not a parameter of this grid, it has "+", ".join(grid.parameter_names))
+		index=first_index+j
+		paramDataField=gwy.DataField(dim_x,dim_y,real_x,real_y,1)
+		_set_origin(paramDataField,origin)
+		transfer.array_to_datafield(grid.parameters[name],paramDataField)
+		paramDataField.set_si_unit_xy(gwy.SIUnit("m"))
+		paramDataField.set_si_unit_z(gwy.SIUnit(_unit(name)))
+		mainC.set_object_by_name("/"+str(index)+"/data",paramDataField)
+		mainC.set_string_by_name("/"+str(index)+"/data/title",str(name))
+		mainC.set_boolean_by_name("/"+str(index)+"/data/visible",False)
+	
+	### Gap and coherence peak maps of the channels requested by a script,
+	### given by name or as (kind, channel) pairs of a derived channel, e.g.
+	### features=["LI Demod 1 X (A)",("didv","Current (A)")]. Use
+	### feature_fields to pass options.
+	first_index+=len(parameters or [])
+	for j,item in enumerate(features or []):
+		with profile.stage("features "+str(item)):
+			fields=feature_fields(grid,item)
+		for m,name in enumerate(featuremaps.MAPS):
+			index=first_index+j*len(fields)+m
+			mainC.set_object_by_name("/"+str(index)+"/data",fields[name][0])
+			mainC.set_string_by_name("/"+str(index)+"/data/title",fields[name][1])
+			mainC.set_boolean_by_name("/"+str(index)+"/data/visible",False)
+	
+	### Keep the timings with the data and in the log file
+	if profile.enabled:
+		metaC=gwy.Container()
+		profile.finish(metaC)
+		mainC.set_object_by_name("/0/meta",metaC)
 	
 	return mainC
 	
+### Scripts used to open grids with Read_3ds.Grid, which now lives in
+### gwyscripts.nanonis. It is only imported when a grid is opened.
+def Grid(*args, **kwargs):
+	from gwyscripts import nanonis
+	return nanonis.Grid(*args, **kwargs)
+
+### Header fields kept as strings in the container under /3ds/
+_header_strings=("sweep_signal","experiment_name","start_time","end_time","user","comment")
+
+### Lower left corner of the grid frame, the x/y offset of everything
+### loaded from the grid. Nanonis stores the position of the frame center.
+def grid_origin(grid):
+	pos_x,pos_y=grid.header.get("pos_xy")
+	size_x,size_y=grid.header.get("size_xy")
+	return pos_x-size_x/2.0,pos_y-size_y/2.0
+
+def _set_origin(obj, origin):
+	obj.set_xoffset(origin[0])
+	obj.set_yoffset(origin[1])
+
+### Unit in the parentheses at the end of a Nanonis name, e.g. "Z (m)"
+def _unit(name):
+	name=str(name)
+	if name.endswith(")") and "(" in name:
+		return name[name.rindex("(")+1:-1]
+	return ""
+
+### Fix the false colour range of a channel to (min, max), e.g. the 1% and
+### 99% quantiles, so outliers do not wash out the image
+def _set_colour_range(container, prefix, limits):
+	low,high=limits
+	if not (high>low):
+		return
+	container.set_int32_by_name(prefix+"/range-type",1)
+	container.set_double_by_name(prefix+"/min",low)
+	container.set_double_by_name(prefix+"/max",high)
+
+### Build a Brick of a channel derived along the sweep, computed for the
+### whole grid at once. kind is "didv", "normalized_didv" or "smooth", the
+### options are passed on to the Grid method of that name, e.g.
+### derived_brick(grid,"didv","Current (A)",window=7,order=3)
+_derived_titles=dict(didv="dI/dV of {}",normalized_didv="(dI/dV)/(I/V) of {}",smooth="Smoothed {}")
+
+def _derived_unit(kind, channel):
+	unit="V" if "(V)" in channel else "A"
+	return dict(didv=unit+"/V",normalized_didv="",smooth=unit)[kind]
+
+def derived_brick(grid, kind, channel, **options):
+	from gwyscripts import transfer
+	
+	if kind not in _derived_titles:
+		raise ValueError("unknown derived channel "+str(kind)+", use one of "+", ".join(sorted(_derived_titles)))
+	volData=getattr(grid,kind)(channel,**options)
+	dim_x,dim_y,num_sweep=volData.shape
+	real_x,real_y=grid.size_xy
+	sweep=grid.signals.get("sweep_signal")
+	
+	tmpBrick=gwy.Brick(dim_x,dim_y,num_sweep,real_x,real_y,abs(sweep[0]-sweep[-1]),False)
+	_set_origin(tmpBrick,grid_origin(grid))
+	tmpBrick.set_zoffset(min(sweep[0],sweep[-1]))
+	tmpBrick.set_si_unit_x(gwy.SIUnit("m"))
+	tmpBrick.set_si_unit_y(gwy.SIUnit("m"))
+	tmpBrick.set_si_unit_z(gwy.SIUnit("V"))
+	tmpBrick.set_si_unit_w(gwy.SIUnit(_derived_unit(kind,channel)))
+	
+	transfer.array_to_brick(volData,tmpBrick)
+	return tmpBrick
+
+### Gap, coherence peak and zero bias maps of every spectrum of a channel,
+### see gwyscripts.features.gap_map. channel is a name or a (kind, channel)
+### pair as in derived_brick. Returns a dict of (DataField, title) by map
+### name, e.g. for a script
+### fields=Read_3ds.feature_fields(grid,"LI Demod 1 X (A)",window=(0.001,0.02),symmetric=True)
+_feature_titles=dict(gap="Gap of {}",zero_bias="Zero bias {}",positive_peak="Positive peak of {}",
+	positive_height="Positive peak height of {}",negative_peak="Negative peak of {}",
+	negative_height="Negative peak height of {}")
+
+def feature_fields(grid, channel, window=None, symmetric=False):
+	from gwyscripts import features, transfer
+	
+	sweep=grid.signals.get("sweep_signal")
+	if isinstance(channel,tuple):
+		kind,chann=channel
+		if kind not in _derived_titles:
+			raise ValueError("unknown derived channel "+str(kind)+", use one of "+", ".join(sorted(_derived_titles)))
+		maps=features.gap_map(getattr(grid,kind)(chann),sweep,window,symmetric)
+		label=_derived_titles[kind].format(chann)
+		unit=_derived_unit(kind,chann)
+	else:
+		maps=grid.gap_map(channel,window,symmetric)
+		label=str(channel)
+		unit=_unit(channel)
+	
+	dim_x,dim_y=grid.dim_px
+	real_x,real_y=grid.size_xy
+	fields={}
+	for name in features.MAPS:
+		tmpDataField=gwy.DataField(dim_x,dim_y,real_x,real_y,1)
+		_set_origin(tmpDataField,grid_origin(grid))
+		transfer.array_to_datafield(maps[name],tmpDataField)
+		tmpDataField.set_si_unit_xy(gwy.SIUnit("m"))
+		tmpDataField.set_si_unit_z(gwy.SIUnit(unit if name.endswith("height") or name=="zero_bias" else "V"))
+		fields[name]=(tmpDataField,_feature_titles[name].format(label))
+	return fields
+
+### Build a Brick of the Fourier magnitude of every bias map of a channel.
+### Meant for the pygwy console or other scripts, e.g.
+### mainC.set_object_by_name("/brick/9",Read_3ds.fft_brick(grid,"LI Demod 1 X (A)",window="hann"))
+def fft_brick(grid, channel, window=None, power=False, remove_mean=False):
+	from gwyscripts import transfer
+	
+	spectra=grid.fft_stack(channel,window,power,remove_mean)
+	dim_x,dim_y,num_sweep=spectra.shape
+	real_x,real_y=grid.size_xy
+	sweep=grid.signals.get("sweep_signal")
+	
+	### Reciprocal space extent, zero frequency is at the center pixel
+	k_x=dim_x/real_x
+	k_y=dim_y/real_y
+	fftBrick=gwy.Brick(dim_x,dim_y,num_sweep,k_x,k_y,abs(sweep[0]-sweep[-1]),False)
+	fftBrick.set_xoffset(-(dim_x//2)*k_x/dim_x)
+	fftBrick.set_yoffset(-(dim_y//2)*k_y/dim_y)
+	fftBrick.set_zoffset(min(sweep[0],sweep[-1]))
+	fftBrick.set_si_unit_x(gwy.SIUnit("1/m"))
+	fftBrick.set_si_unit_y(gwy.SIUnit("1/m"))
+	fftBrick.set_si_unit_z(gwy.SIUnit("V"))
+	
+	transfer.array_to_brick(spectra,fftBrick)
+	return fftBrick
+
+### Write the volume data of the container back to a 3ds file. Every Brick
+### with the dimensions of the first one becomes a channel named by its
+### title, the topograph (if it fits) is kept as the Z parameter. The
+### header fields and parameters kept by load() are written back. The
+### Bricks are read through views where pygwy allows it and written a
+### chunk of rows at a time, see nanonis.write_grid.
 def save(data, filename, mode=None):
+	import re
+	import numpy as np
+	from gwyscripts import nanonis, transfer
+	
+	keys=[key for key in data.keys_by_name() if re.match(r"^/brick/\d+$",key)]
+	keys.sort(key=lambda key: int(key.split("/")[-1]))
+	if not keys:
+		return False
+	
+	first=data.get_object_by_name(keys[0])
+	dim_x,dim_y,num_sweep=first.get_xres(),first.get_yres(),first.get_zres()
+	real_x,real_y=first.get_xreal(),first.get_yreal()
+	
+	### Every channel is only fetched from its Brick while it is written,
+	### so at most one copy of a channel is held at a time
+	signals={}
+	channels=[]
+	for key in keys:
+		brick=data.get_object_by_name(key)
+		if (brick.get_xres(),brick.get_yres(),brick.get_zres())!=(dim_x,dim_y,num_sweep):
+			continue
+		if data.contains_by_name(key+"/title"):
+			chann=str(data.get_string_by_name(key+"/title"))
+		else:
+			chann="Channel "+key.split("/")[-1]
+		while chann in signals:
+			chann+=" "
+		channels.append(chann)
+		signals[chann]=lambda brick=brick: transfer.brick_view(brick)
+	
+	### Sweep as loaded, otherwise increasing along the Brick z axis
+	prefix=keys[0]
+	if data.contains_by_name(prefix+"/sweep_start"):
+		sweep_start=data.get_double_by_name(prefix+"/sweep_start")
+		sweep_end=data.get_double_by_name(prefix+"/sweep_end")
+	else:
+		sweep_start=first.get_zoffset()
+		sweep_end=sweep_start+first.get_zreal()
+	
+	### The header fields kept by load(), otherwise those of a plain grid
+	x0=first.get_xoffset()
+	y0=first.get_yoffset()
+	header=dict(dim_px=[dim_x,dim_y], pos_xy=[x0+real_x/2.0,y0+real_y/2.0],
+		size_xy=[real_x,real_y], angle=0.0, sweep_signal="Bias (V)",
+		fixed_parameters=["Sweep Start","Sweep End"],
+		experimental_parameters=["X (m)","Y (m)","Z (m)"], channels=channels,
+		num_sweep_signal=num_sweep)
+	for key in _header_strings:
+		if data.contains_by_name("/3ds/"+key):
+			header[key]=str(data.get_string_by_name("/3ds/"+key))
+	for key in ("angle","measure_delay"):
+		if data.contains_by_name("/3ds/"+key):
+			header[key]=data.get_double_by_name("/3ds/"+key)
+	
+	### The per pixel parameters kept by load() if they still fit the
+	### Bricks, otherwise the pixel positions
+	params=None
+	if data.contains_by_name("/3ds/params"):
+		names=[str(data.get_string_by_name("/3ds/"+key)).split(";")
+			for key in ("fixed_parameters","experimental_parameters")]
+		paramBrick=data.get_object_by_name("/3ds/params")
+		if ((paramBrick.get_xres(),paramBrick.get_yres(),paramBrick.get_zres())==
+				(dim_x,dim_y,len(names[0])+len(names[1]))):
+			params=transfer.brick_to_array(paramBrick).astype(np.float32)
+			header["fixed_parameters"],header["experimental_parameters"]=names
+	if params is None:
+		params=np.zeros((dim_x,dim_y,5),dtype=np.float32)
+		params[:,:,2]=(x0+(np.arange(dim_x)+0.5)*real_x/dim_x)[:,None]
+		params[:,:,3]=(y0+(np.arange(dim_y)+0.5)*real_y/dim_y)[None,:]
+	
+	### The sweep and the topograph as they are now
+	names=header["fixed_parameters"]+header["experimental_parameters"]
+	for name,value in (("Sweep Start",sweep_start),("Sweep End",sweep_end)):
+		if name in names:
+			params[:,:,names.index(name)]=value
+	if data.contains_by_name("/0/data") and "Z (m)" in names:
+		topo=data.get_object_by_name("/0/data")
+		if (topo.get_xres(),topo.get_yres())==(dim_x,dim_y):
+			params[:,:,names.index("Z (m)")]=transfer.datafield_view(topo)
+	signals["params"]=params
+	
+	nanonis.write_grid(filename,header,signals)
 	return True
 	
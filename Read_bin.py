@@ -10,8 +10,16 @@
 ### Import necessary modules
 
 import gwy #pygwy modules and functions
-import numpy as np #easy storing of data
 import struct #reading binary file
+import os
+import sys
+
+try:
+	_plugin_dir=os.path.dirname(os.path.abspath(__file__))
+except NameError:
+	_plugin_dir=os.path.join(os.path.expanduser('~'),'gwyddion' if os.name=='nt' else '.gwyddion','pygwy')
+if _plugin_dir not in sys.path:
+	sys.path.insert(0,_plugin_dir)
 
 
 plugin_type = "FILE"
@@ -33,56 +41,127 @@ def detect_by_content(filname, head, tail, filesize):
 		return 0
 
 
+def load_series(path, threads=None):
+	"""
+	Load a series of layer bin files as a single gwy.Brick.
+
+	See read_series for the arguments. Meant to be called from the
+	pygwy console or other scripts, e.g.
+	Read_bin.load_series('C:/data/layers/*.bin').
+	"""
+	from gwyscripts import layerbin, transfer
+	
+	mainC=gwy.Container()
+	
+	series=layerbin.read_series(path,threads)
+	nx,ny,nz=series['data'].shape
+	xspacing=series['xspacing']
+	yspacing=series['yspacing']
+	bias=series['bias']
+	real_x=abs(xspacing[0]-xspacing[-1])
+	real_y=abs(yspacing[0]-yspacing[-1])
+	
+	brick=gwy.Brick(nx,ny,nz,real_x,real_y,abs(bias[-1]-bias[0]),True)
+	brick.set_xoffset(min(xspacing[0],xspacing[-1]))
+	brick.set_yoffset(min(yspacing[0],yspacing[-1]))
+	brick.set_zoffset(bias[0])
+	brick.set_si_unit_x(gwy.SIUnit('m'))
+	brick.set_si_unit_y(gwy.SIUnit('m'))
+	brick.set_si_unit_z(gwy.SIUnit('V'))
+	brick.set_si_unit_w(gwy.SIUnit('V'))
+	transfer.array_to_brick(series['data'],brick)
+	mainC.set_object_by_name("/brick/0",brick)
+	
+	###Create a preview by slicing the volume data
+	preview=gwy.DataField(nx,ny,real_x,real_y,True)
+	brick.extract_plane(preview,0,0,0,nx,ny,-1,True)
+	mainC.set_object_by_name("/brick/0/preview",preview)
+	mainC.set_string_by_name("/brick/0/title","Layers "+str(bias[0])+" to "+str(bias[-1])+" V")
+	
+	metaC=gwy.Container()
+	for k in range(nz):
+		metaC.set_string_by_name("Bias "+str(k)+": ",str(bias[k]))
+	mainC.set_object_by_name("/brick/0/meta",metaC)
+	
+	return mainC
+
+
 def load(filename):
+	from gwyscripts import layerbin, loadprofile, transfer
+	
+	### With GWYSCRIPTS_PROFILE set every stage below is timed, see
+	### gwyscripts/loadprofile.py. Otherwise the stages cost nothing.
+	profile=loadprofile.profile(filename)
+	
 	### Load returns a container object, initialize here
 	mainC=gwy.Container()
 	
+	###Read the header, axes and data in one go
+	with profile.stage('read',os.path.getsize(filename)):
+		layer=layerbin.read_layer(filename)
+	nx=layer['nx']
+	ny=layer['ny']
+	xspacing=layer['xspacing']
+	yspacing=layer['yspacing']
 	
-	with open(filename,"rb") as f:
-		
-		###Read the 'header' parts of the bin file
-		nx=int(struct.unpack('>i',f.read(4))[0])
-		ny=int(struct.unpack('>i',f.read(4))[0])
-		bias=struct.unpack('>d',f.read(8))[0]
-		setCurrent=struct.unpack('>d',f.read(8))[0]
-		
+	metaC=gwy.Container()
+	
+	
+	metaC.set_string_by_name("Bias: ", str(layer['bias']))
+	metaC.set_string_by_name("Set current: ", str(layer['setCurrent']))
+	mainC.set_object_by_name("/0/meta",metaC)
+	
+	dField=gwy.DataField(nx,ny,abs(xspacing[0]-xspacing[-1]),abs(yspacing[0]-yspacing[-1]),True)
+	dField.set_xoffset(min(xspacing[0],xspacing[-1]))
+	dField.set_yoffset(min(yspacing[0],yspacing[-1]))
+	dField.set_si_unit_xy(gwy.SIUnit('m'))
+	dField.set_si_unit_z(gwy.SIUnit('V'))
 
-		
-		metaC=gwy.Container()
-		
-		
-		metaC.set_string_by_name("Bias: ", str(bias))
-		mainC.set_object_by_name("/0/meta",metaC)
-		
-		#initialize the dimensions and data arrays
-		data=np.zeros((nx,ny))
-		xspacing=np.zeros(nx)
-		yspacing=np.zeros(ny)
-		
-		for x in range(nx):
-			xspacing[x]=struct.unpack('>d',f.read(8))[0]
+	###Copy the data into the DataField in one bulk transfer
+	with profile.stage('datafield',layer['data'].nbytes):
+		transfer.array_to_datafield(layer['data'],dField)
 			
-		for y in range(ny):
-			yspacing[y]=struct.unpack('>d',f.read(8))[0]
-		
-		for x in range(nx):
-			for y in range(ny):
-				data[x,y]=struct.unpack('>d',f.read(8))[0]
-				
-		dField=gwy.DataField(nx,ny,abs(xspacing[0]-xspacing[-1]),abs(yspacing[0]-yspacing[-1]),True)
-		dField.set_si_unit_xy(gwy.SIUnit('m'))
-		dField.set_si_unit_z(gwy.SIUnit('V'))
-
-		
-		for x in range(nx):
-			for y in range(ny):
-				dField.set_val(x,y,data[x,y])
-				
-		mainC.set_object_by_name("/0/data",dField)
-		mainC.set_boolean_by_name("/0/data/visible",True)
-		
-		return mainC
+	mainC.set_object_by_name("/0/data",dField)
+	mainC.set_boolean_by_name("/0/data/visible",True)
+	
+	### The axis directions are lost in the DataField, keep them for save()
+	mainC.set_boolean_by_name("/0/x_decreasing",bool(xspacing[-1]<xspacing[0]))
+	mainC.set_boolean_by_name("/0/y_decreasing",bool(yspacing[-1]<yspacing[0]))
+	
+	### Keep the timings with the data and in the log file
+	if profile.enabled:
+		profile.finish(metaC)
+	
+	return mainC
 		
+### Write the first image of the container as a layer bin file. The axes
+### follow from the offset and size of the DataField and the directions
+### kept by load(), the bias and set current from the metadata.
 def save(data, filename, mode=None):
-	return True		
+	import numpy as np
+	from gwyscripts import layerbin, transfer
+	
+	if not data.contains_by_name("/0/data"):
+		return False
+	dField=data.get_object_by_name("/0/data")
+	nx,ny=dField.get_xres(),dField.get_yres()
+	xspacing=dField.get_xoffset()+np.arange(nx)*dField.get_xreal()/max(nx-1,1)
+	yspacing=dField.get_yoffset()+np.arange(ny)*dField.get_yreal()/max(ny-1,1)
+	if data.contains_by_name("/0/x_decreasing") and data.get_boolean_by_name("/0/x_decreasing"):
+		xspacing=xspacing[::-1]
+	if data.contains_by_name("/0/y_decreasing") and data.get_boolean_by_name("/0/y_decreasing"):
+		yspacing=yspacing[::-1]
+	
+	header={}
+	if data.contains_by_name("/0/meta"):
+		metaC=data.get_object_by_name("/0/meta")
+		for key,name in (("bias","Bias: "),("setCurrent","Set current: ")):
+			if metaC.contains_by_name(name):
+				try:
+					header[key]=float(metaC.get_string_by_name(name))
+				except ValueError:
+					pass
+	
+	layerbin.write_layer(filename,transfer.datafield_view(dField),xspacing,yspacing,**header)
+	return True
 				
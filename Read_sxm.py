@@ -0,0 +1,101 @@
+#### Read_sxm
+### This is meant to read nanonis sxm scan files to be used in
+### the software Gwyddion. This is done through their pygwy module
+###
+### USING PYGWY REQUIRES 32 BIT GWYDDION AND 32 BIT PYTHON 2.7
+###
+### The parsing itself lives in gwyscripts/nanonis.py, next to the 3ds grid
+### reader
+
+
+
+### Import necessary modules
+
+import gwy #pygwy modules and functions
+
+import os
+import sys
+
+try:
+	_plugin_dir=os.path.dirname(os.path.abspath(__file__))
+except NameError:
+	_plugin_dir=os.path.join(os.path.expanduser('~'),'gwyddion' if os.name=='nt' else '.gwyddion','pygwy')
+if _plugin_dir not in sys.path:
+	sys.path.insert(0,_plugin_dir)
+
+
+
+### NEED TO DEFINE THESE VARIABLES TO INTERFACE WITH GWYDDION
+
+plugin_type = "FILE"
+plugin_desc = "sxm file format used by Nanonis for scans"
+
+### Functions to determine if the filetype is valid and which load methods
+### to use
+def detect_by_filename(filename):
+	if (filename.endswith(".sxm")):
+		return 100
+	else:
+		return 0
+
+def detect_by_content(filename, head, tail, filesize):
+	if (head.startswith(":NANONIS_VERSION:")):
+		return 100
+	else:
+		return 0
+
+### Load the file into the Gwyddion data types.
+
+def load(filename, mode=None):
+	from gwyscripts import nanonis, transfer
+
+	### Load returns a container object, initialize here
+	mainC=gwy.Container()
+
+	### The header is parsed once and the data memory-mapped, every frame
+	### is a view that is only read when it is copied into its DataField
+	scan=nanonis.Scan(filename, mmap=True)
+
+	dim_x, dim_y=scan.header.get("scan_pixels")
+	real_x, real_y=scan.header.get("scan_range")
+	pos_x, pos_y=scan.header.get("scan_offset",[0.0,0.0])
+
+	### Units of the channels from the DATA_INFO table
+	units=dict((info["Name"],info.get("Unit","")) for info in scan.header.get("data_info"))
+
+	### One DataField per channel and direction, in file order
+	index=0
+	for chann in scan.channels:
+		for direction in ("forward","backward"):
+			frame=scan.signals[chann].get(direction)
+			if frame is None:
+				continue
+
+			dField=gwy.DataField(dim_x,dim_y,real_x,real_y,False)
+			dField.set_xoffset(pos_x-real_x/2.0)
+			dField.set_yoffset(pos_y-real_y/2.0)
+			dField.set_si_unit_xy(gwy.SIUnit("m"))
+			dField.set_si_unit_z(gwy.SIUnit(str(units[chann])))
+
+			### Copy the frame into the DataField in one bulk transfer
+			transfer.array_to_datafield(frame,dField)
+
+			mainC.set_object_by_name("/"+str(index)+"/data",dField)
+			mainC.set_string_by_name("/"+str(index)+"/data/title",str(chann)+" ("+direction+")")
+
+			### Only show the first channel upon loading
+			mainC.set_boolean_by_name("/"+str(index)+"/data/visible",index==0)
+			index+=1
+
+	### Keep the header entries with the first channel
+	metaC=gwy.Container()
+	for key in ("rec_date","rec_time","bias","scan_dir","acq_time","comment"):
+		if key in scan.header:
+			metaC.set_string_by_name(key.replace("_"," ").capitalize(),str(scan.header[key]))
+	mainC.set_object_by_name("/0/meta",metaC)
+
+	return mainC
+
+### Writing sxm files is not supported
+def save(data, filename, mode=None):
+	return False
@@ -0,0 +1,8 @@
+### gwyscripts
+###
+### Shared helpers for the Gwyddion plugins in this repository.
+###
+### Gwyddion only registers the *.py files sitting directly in the pygwy
+### folder as plugins, so code that is used by more than one plugin lives
+### in this package instead. Nothing in here imports gwy at module level,
+### which keeps it importable from plain Python 2.7 and 3.x as well.
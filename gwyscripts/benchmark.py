@@ -0,0 +1,537 @@
+### benchmark
+###
+### Synthetic data benchmarks for the load and transfer paths.
+###
+### Writes Nanonis 3ds grids and Java layer bin files of configurable size
+### to a temporary directory and times every stage of opening them, with
+### a stand-in gwy module that records the calls made on it when the real
+### one is not available:
+###
+###     python -m gwyscripts.benchmark --grid 64x64x256 --grid 128x128x512 \
+###         --channels 4 --bin 1024x1024 --json results.json
+###     python -m gwyscripts.benchmark --compare results.json
+###
+### Every stage reports wall time, throughput in MB/s and values/s and the
+### peak memory allocated while it ran (Python 3 only, through
+### tracemalloc). Results are saved as JSON so runs on different commits
+### can be compared with --compare. The import time of the plugin files,
+### which Gwyddion pays at every startup, is measured in a fresh
+### interpreter and checked against --max-import-ms.
+
+from __future__ import print_function
+
+import os
+import sys
+import gc
+import glob
+import json
+import time
+import types
+import shutil
+import struct
+import importlib
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from gwyscripts import decode, features, layerbin, nanonis, transfer
+
+
+_repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_FIXED_PARAMETERS = ['Sweep Start', 'Sweep End']
+_EXPERIMENTAL_PARAMETERS = ['X (m)', 'Y (m)', 'Z (m)', 'Z offset (m)',
+                            'Settling time (s)', 'Integration time (s)',
+                            'Z-Ctrl hold', 'Final Z (m)']
+
+
+### Synthetic data
+
+def write_grid(fname, nx, ny, num_sweep, num_chan, seed=0):
+    """
+    Write a synthetic Nanonis 3ds grid with random data.
+
+    The payload is written a row of pixels at a time, so large grids do
+    not have to fit in memory.
+
+    Returns
+    -------
+    int
+        Size of the file in bytes.
+    """
+    params = _FIXED_PARAMETERS + _EXPERIMENTAL_PARAMETERS
+    channels = ['Channel {} (A)'.format(i) for i in range(num_chan)]
+    header = ['Grid dim="{} x {}"'.format(nx, ny),
+              'Grid settings=0.000000E+0;0.000000E+0;1.000000E-8;1.000000E-8;0.000000E+0',
+              'Sweep Signal="Bias (V)"',
+              'Fixed parameters="{}"'.format(';'.join(_FIXED_PARAMETERS)),
+              'Experiment parameters="{}"'.format(';'.join(_EXPERIMENTAL_PARAMETERS)),
+              '# Parameters (4 byte)={}'.format(len(params)),
+              'Experiment size (bytes)={}'.format(4 * num_sweep * num_chan),
+              'Points={}'.format(num_sweep),
+              'Channels="{}"'.format(';'.join(channels)),
+              'Delay before measuring (s)=0.000000E+0',
+              'Experiment=Grid Spectroscopy',
+              'Start time=01.01.2020 00:00:00',
+              'End time=01.01.2020 00:00:00',
+              'User=',
+              'Comment=synthetic benchmark grid',
+              ':HEADER_END:', '']
+
+    rng = np.random.RandomState(seed)
+    with open(fname, 'wb') as f:
+        f.write('\r\n'.join(header).encode('latin1'))
+        for x in range(nx):
+            row = rng.standard_normal((ny, len(params) + num_sweep * num_chan)).astype('>f4')
+            row[:, 0] = -1.0
+            row[:, 1] = 1.0
+            f.write(row.tobytes())
+
+    return os.path.getsize(fname)
+
+
+def write_layer(fname, nx, ny, bias=0.0, seed=0):
+    """
+    Write a synthetic Java layer bin file with random data.
+
+    Returns
+    -------
+    int
+        Size of the file in bytes.
+    """
+    rng = np.random.RandomState(seed)
+    with open(fname, 'wb') as f:
+        f.write(struct.pack('>iidd', nx, ny, bias, 1e-10))
+        np.linspace(0, 1e-8, nx).astype('>f8').tofile(f)
+        np.linspace(0, 1e-8, ny).astype('>f8').tofile(f)
+        rng.standard_normal((nx, ny)).astype('>f8').tofile(f)
+
+    return os.path.getsize(fname)
+
+
+### Stand-in for the gwy module
+
+class _Recorder(object):
+
+    """
+    Counts the calls made on the stand-in gwy objects.
+    """
+
+    def __init__(self):
+        self.calls = dict()
+
+    def record(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def reset(self):
+        self.calls = dict()
+
+
+def stand_in_gwy():
+    """
+    Return a module that imitates the parts of gwy used by the plugins.
+
+    DataField and Brick keep their data in a flat float64 array in the
+    Gwyddion memory layout and support set_data/get_data, set_val/get_val
+    and extract_plane. Every call is counted in the module's recorder.
+    """
+    recorder = _Recorder()
+    gwy = types.ModuleType('gwy')
+    gwy.recorder = recorder
+
+    class _Object(object):
+        def __getattr__(self, name):
+            if name.startswith('set_') or name in ('data_changed', 'invalidate'):
+                def call(*args):
+                    recorder.record(name)
+                return call
+            raise AttributeError(name)
+
+        def set_data(self, data):
+            recorder.record('set_data')
+            self.data[:] = data
+
+        def get_data(self):
+            recorder.record('get_data')
+            return self.data.tolist()
+
+        def get_xres(self):
+            return self.xres
+
+        def get_yres(self):
+            return self.yres
+
+        def get_xreal(self):
+            return self.xreal
+
+        def get_yreal(self):
+            return self.yreal
+
+        def get_xoffset(self):
+            return self.xoffset
+
+        def get_yoffset(self):
+            return self.yoffset
+
+    class DataField(_Object):
+        def __init__(self, xres, yres, xreal, yreal, nullme=True):
+            self.xres, self.yres = xres, yres
+            self.xreal, self.yreal = xreal, yreal
+            self.xoffset = self.yoffset = 0.0
+            self.data = np.zeros(xres * yres)
+
+        def set_xoffset(self, offset):
+            self.xoffset = offset
+
+        def set_yoffset(self, offset):
+            self.yoffset = offset
+
+        def set_val(self, x, y, val):
+            recorder.record('set_val')
+            self.data[y * self.xres + x] = val
+
+        def get_val(self, x, y):
+            recorder.record('get_val')
+            return self.data[y * self.xres + x]
+
+    class Brick(_Object):
+        def __init__(self, xres, yres, zres, xreal, yreal, zreal, nullme=True):
+            self.xres, self.yres, self.zres = xres, yres, zres
+            self.xreal, self.yreal, self.zreal = xreal, yreal, zreal
+            self.xoffset = self.yoffset = self.zoffset = 0.0
+            self.data = np.zeros(xres * yres * zres)
+
+        def set_xoffset(self, offset):
+            self.xoffset = offset
+
+        def set_yoffset(self, offset):
+            self.yoffset = offset
+
+        def set_zoffset(self, offset):
+            self.zoffset = offset
+
+        def get_zres(self):
+            return self.zres
+
+        def get_zreal(self):
+            return self.zreal
+
+        def get_zoffset(self):
+            return self.zoffset
+
+        def set_val(self, x, y, z, val):
+            recorder.record('set_val')
+            self.data[(z * self.yres + y) * self.xres + x] = val
+
+        def get_val(self, x, y, z):
+            recorder.record('get_val')
+            return self.data[(z * self.yres + y) * self.xres + x]
+
+        def extract_plane(self, target, istart, jstart, kstart, width, height, depth, keep_offsets):
+            recorder.record('extract_plane')
+            plane = self.data.reshape((self.zres, self.yres, self.xres))[kstart]
+            target.data[:] = plane[jstart:jstart + height, istart:istart + width].ravel()
+
+    class Container(dict):
+        def __getattr__(self, name):
+            if name.startswith('set_') and name.endswith('_by_name'):
+                def call(key, value):
+                    recorder.record(name)
+                    self[key] = value
+                return call
+            if name.startswith('get_') and name.endswith('_by_name'):
+                return self.__getitem__
+            raise AttributeError(name)
+
+        def contains_by_name(self, key):
+            return key in self
+
+        def keys_by_name(self):
+            return list(self.keys())
+
+    gwy.DataField = DataField
+    gwy.Brick = Brick
+    gwy.Container = Container
+    gwy.SIUnit = lambda unit='': unit
+    return gwy
+
+
+def import_plugin(name, gwy):
+    """
+    Import a plugin file, e.g. 'Read_3ds', with gwy as its gwy module.
+
+    sys.modules['gwy'] is only replaced during the import, the plugin
+    keeps using gwy afterwards.
+    """
+    if _repo_dir not in sys.path:
+        sys.path.insert(0, _repo_dir)
+    saved = sys.modules.get('gwy')
+    sys.modules['gwy'] = gwy
+    try:
+        plugin = importlib.import_module(name)
+    finally:
+        if saved is None:
+            sys.modules.pop('gwy', None)
+        else:
+            sys.modules['gwy'] = saved
+    plugin.gwy = gwy
+    return plugin
+
+
+### Timing
+
+def measure(func, repeat=1):
+    """
+    Run func repeat times and return the best wall time in seconds and
+    the peak memory in bytes allocated during the runs (None without
+    tracemalloc).
+    """
+    best = None
+    peak = None
+    for _ in range(repeat):
+        gc.collect()
+        if tracemalloc is not None:
+            tracemalloc.start()
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if tracemalloc is not None:
+            peak = max(peak or 0, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, peak
+
+
+def _result(stage, size, seconds, peak, nbytes, values, calls=None):
+    return dict(stage=stage, size=size, seconds=seconds,
+                mb_per_s=nbytes / 1e6 / max(seconds, 1e-9),
+                values_per_s=values / max(seconds, 1e-9),
+                peak_mb=None if peak is None else peak / 1e6,
+                calls=calls or dict())
+
+
+def bench_grid(tmpdir, nx, ny, num_sweep, num_chan, gwy, repeat=1):
+    """
+    Time the stages of opening a synthetic grid of the given size.
+    """
+    fname = os.path.join(tmpdir, 'grid_{}x{}x{}_{}.3ds'.format(nx, ny, num_sweep, num_chan))
+    nbytes = write_grid(fname, nx, ny, num_sweep, num_chan)
+    size = '{}x{}x{} {}ch'.format(nx, ny, num_sweep, num_chan)
+    voxels = nx * ny * num_sweep * num_chan
+    results = []
+
+    def header():
+        nanonis.clear_header_cache()
+        nanonis.NanonisFile(fname)
+
+    seconds, peak = measure(header, repeat)
+    header_raw = nanonis.NanonisFile(fname).header_raw
+    results.append(_result('header_scan', size, seconds, peak, len(header_raw), 1))
+
+    seconds, peak = measure(lambda: nanonis._parse_3ds_header(header_raw), repeat)
+    results.append(_result('parse_3ds_header', size, seconds, peak, len(header_raw), 1))
+
+    offset = nanonis.NanonisFile(fname).byte_offset
+    count = (nbytes - offset) // 4
+    for threads in (1, None):
+        seconds, peak = measure(lambda: decode.read_float32(fname, offset, count, threads=threads), repeat)
+        results.append(_result('decode_payload' if threads else 'decode_threaded', size,
+                               seconds, peak, 4 * count, count))
+
+    seconds, peak = measure(lambda: nanonis.Grid(fname), repeat)
+    results.append(_result('grid_load_data', size, seconds, peak, nbytes, voxels))
+
+    def mmap_touch():
+        grid = nanonis.Grid(fname, mmap=True)
+        for chann in grid.channels:
+            np.asarray(grid.signals[chann]).sum()
+
+    seconds, peak = measure(mmap_touch, repeat)
+    results.append(_result('grid_mmap_touch', size, seconds, peak, nbytes, voxels))
+
+    grid = nanonis.Grid(fname, mmap=True)
+    volume = np.array(grid.signals[grid.channels[0]])
+
+    def brick_transfer():
+        brick = gwy.Brick(nx, ny, num_sweep, 1.0, 1.0, 1.0, True)
+        transfer.array_to_brick(volume, brick)
+
+    gwy.recorder.reset()
+    seconds, peak = measure(brick_transfer, repeat)
+    results.append(_result('brick_transfer', size, seconds, peak, volume.nbytes,
+                           volume.size, gwy.recorder.calls))
+
+    sweep = grid.signals['sweep_signal']
+    seconds, peak = measure(lambda: features.gap_map(volume, sweep), repeat)
+    results.append(_result('gap_map', size, seconds, peak, volume.nbytes, volume.size))
+
+    import Read_3ds
+    gwy.recorder.reset()
+    seconds, peak = measure(lambda: Read_3ds.load(fname), repeat)
+    results.append(_result('read_3ds_load', size, seconds, peak, nbytes, voxels, gwy.recorder.calls))
+
+    os.remove(fname)
+    return results
+
+
+def bench_bin(tmpdir, nx, ny, gwy, repeat=1):
+    """
+    Time the stages of opening a synthetic layer bin file of the given
+    size.
+    """
+    fname = os.path.join(tmpdir, 'layer_{}x{}.bin'.format(nx, ny))
+    nbytes = write_layer(fname, nx, ny)
+    size = '{}x{}'.format(nx, ny)
+    results = []
+
+    seconds, peak = measure(lambda: layerbin.read_layer(fname), repeat)
+    results.append(_result('read_layer', size, seconds, peak, nbytes, nx * ny))
+
+    import Read_bin
+    gwy.recorder.reset()
+    seconds, peak = measure(lambda: Read_bin.load(fname), repeat)
+    results.append(_result('read_bin_load', size, seconds, peak, nbytes, nx * ny, gwy.recorder.calls))
+
+    os.remove(fname)
+    return results
+
+
+def plugin_modules():
+    """
+    Names of the plugin files next to the gwyscripts package.
+    """
+    return sorted(os.path.splitext(os.path.basename(path))[0]
+                  for path in glob.glob(os.path.join(_repo_dir, '*.py')))
+
+
+# run in a fresh interpreter, which has imported neither NumPy nor this
+# package, with a bare gwy module since the plugins use none of it at
+# import time
+_IMPORT_SCRIPT = (
+    'import sys, time, types\n'
+    'sys.path.insert(0, {repo!r})\n'
+    'sys.modules["gwy"] = types.ModuleType("gwy")\n'
+    'start = time.time()\n'
+    'import {module}\n'
+    'print((time.time() - start) * 1000)\n')
+
+
+def bench_import(module):
+    """
+    Time importing a plugin file in a fresh interpreter, as Gwyddion
+    does at startup.
+
+    Nothing but the standard library is loaded before the import, so
+    the time includes NumPy or the gwyscripts package if the plugin
+    pulls them in.
+
+    Returns
+    -------
+    float
+        Import time in milliseconds.
+    """
+    code = _IMPORT_SCRIPT.format(repo=_repo_dir, module=module)
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=_repo_dir)
+    return float(out.decode('ascii').strip().splitlines()[-1])
+
+
+def _parse_size(text, dims):
+    values = [int(val) for val in text.lower().split('x')]
+    if len(values) != dims:
+        raise argparse.ArgumentTypeError('expected {} sizes separated by x, got {}'.format(dims, text))
+    return values
+
+
+def _git_commit():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=_repo_dir,
+                                      stderr=subprocess.STDOUT)
+        return out.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    """
+    Print the speed of every stage in new relative to old.
+    """
+    previous = dict(((r['stage'], r['size']), r) for r in old['results'])
+    print('{:<18} {:<18} {:>10} {:>10} {:>8}'.format('stage', 'size', 'old s', 'new s', 'speedup'))
+    for r in new['results']:
+        o = previous.get((r['stage'], r['size']))
+        if o is None:
+            continue
+        print('{:<18} {:<18} {:>10.4f} {:>10.4f} {:>7.2f}x'.format(
+            r['stage'], r['size'], o['seconds'], r['seconds'], o['seconds'] / max(r['seconds'], 1e-9)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m gwyscripts.benchmark',
+                                     description='Benchmark the grid and layer bin load paths on synthetic data.')
+    parser.add_argument('--grid', action='append', type=lambda t: _parse_size(t, 3),
+                        help='grid size NXxNYxNSWEEP, can be repeated (default 64x64x256)')
+    parser.add_argument('--channels', type=int, default=2, help='channels per grid (default 2)')
+    parser.add_argument('--bin', action='append', type=lambda t: _parse_size(t, 2),
+                        help='layer size NXxNY, can be repeated (default 512x512)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage, the best is kept')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='compare with the results in this file')
+    parser.add_argument('--max-import-ms', type=float, default=50.0,
+                        help='fail if importing a plugin file takes longer (default 50)')
+    parser.add_argument('--tmpdir', help='directory for the synthetic files')
+    args = parser.parse_args(argv)
+
+    try:
+        import gwy
+        gwy.recorder = _Recorder()
+    except ImportError:
+        gwy = stand_in_gwy()
+        sys.modules['gwy'] = gwy
+    if _repo_dir not in sys.path:
+        sys.path.insert(0, _repo_dir)
+
+    tmpdir = tempfile.mkdtemp(dir=args.tmpdir)
+    results = []
+    try:
+        for nx, ny, num_sweep in args.grid or [[64, 64, 256]]:
+            results += bench_grid(tmpdir, nx, ny, num_sweep, args.channels, gwy, args.repeat)
+        for nx, ny in args.bin or [[512, 512]]:
+            results += bench_bin(tmpdir, nx, ny, gwy, args.repeat)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    imports = dict((module, bench_import(module)) for module in plugin_modules())
+
+    print('{:<18} {:<18} {:>10} {:>10} {:>12} {:>9}'.format('stage', 'size', 'seconds', 'MB/s', 'values/s', 'peak MB'))
+    for r in results:
+        print('{:<18} {:<18} {:>10.4f} {:>10.1f} {:>12.3g} {:>9}'.format(
+            r['stage'], r['size'], r['seconds'], r['mb_per_s'], r['values_per_s'],
+            '-' if r['peak_mb'] is None else '{:.1f}'.format(r['peak_mb'])))
+    for module, ms in sorted(imports.items()):
+        print('import {:<30} {:>10.1f} ms'.format(module, ms))
+
+    report = dict(commit=_git_commit(), python=sys.version.split()[0], numpy=np.__version__,
+                  time=time.strftime('%Y-%m-%d %H:%M:%S'), results=results, import_ms=imports)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+    slow = [module for module, ms in imports.items() if ms > args.max_import_ms]
+    if slow:
+        print('plugin import slower than {} ms: {}'.format(args.max_import_ms, ', '.join(sorted(slow))))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,250 @@
+### convert
+###
+### Command line batch converter for Nanonis grids and scans and Java
+### layer bins.
+###
+### Runs without Gwyddion, e.g. on a multi-core Linux box, to decode a
+### whole directory tree before anyone opens the data:
+###
+###     python -m gwyscripts.convert DATA_DIR --out NPZ_DIR
+###     python -m gwyscripts.convert DATA_DIR --cache
+###
+### --out writes one native endian .npz per source file, mirroring the
+### directory tree. --cache fills the grid cache of gwyscripts.gridcache
+### instead, so Read_3ds.load maps the decoded channels directly (run
+### Gwyddion with the same GWYSCRIPTS_CACHE). Files are converted by a
+### pool of processes, one file per worker, with no more workers than
+### the available memory allows.
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+import numpy as np
+
+_EXTENSIONS = ('.3ds', '.sxm', '.bin')
+
+# rough memory a worker needs besides the data when filling the cache,
+# which streams in chunks
+_CACHE_WORKER_BYTES = 128 * 1024 * 1024
+
+
+def find_sources(paths):
+    """
+    Return every .3ds, .sxm and .bin file under the given files or directories.
+    """
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _, fnames in os.walk(path):
+                sources += [os.path.join(dirpath, fname) for fname in sorted(fnames)
+                            if fname.endswith(_EXTENSIONS)]
+        elif path.endswith(_EXTENSIONS):
+            sources.append(path)
+    return sources
+
+
+def available_memory():
+    """
+    Return the available physical memory in bytes, or None if unknown.
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def worker_count(sources, jobs=None, memory=None, cache=False):
+    """
+    Number of worker processes that fit in memory.
+
+    Writing .npz files holds about one source file worth of native data
+    per worker, filling the cache only a chunk, so the largest source
+    decides how many workers fit next to each other.
+    """
+    jobs = jobs or multiprocessing.cpu_count()
+    memory = memory or available_memory()
+    if memory is None or not sources:
+        return max(1, min(jobs, len(sources)))
+
+    if cache:
+        per_worker = _CACHE_WORKER_BYTES
+    else:
+        per_worker = max(os.path.getsize(source) for source in sources) + _CACHE_WORKER_BYTES
+
+    return max(1, min(jobs, len(sources), memory // per_worker))
+
+
+def convert_file(task):
+    """
+    Convert a single source file, run inside a worker process.
+
+    Parameters
+    ----------
+    task : tuple
+        (source, out_dir, root, cache) with root the top of the source
+        tree that out_dir mirrors.
+
+    Returns
+    -------
+    tuple
+        (source, bytes read, seconds, error message or None)
+    """
+    source, out_dir, root, cache = task
+    start = time.time()
+    try:
+        if source.endswith('.3ds'):
+            _convert_grid(source, out_dir, root, cache)
+        elif source.endswith('.sxm'):
+            _convert_scan(source, out_dir, root)
+        else:
+            _convert_bin(source, out_dir, root)
+    except Exception as err:
+        return source, 0, time.time() - start, '{}: {}'.format(type(err).__name__, err)
+    return source, os.path.getsize(source), time.time() - start, None
+
+
+def _convert_grid(source, out_dir, root, cache):
+    from gwyscripts import nanonis
+
+    if cache:
+        nanonis.Grid(source, cache=True)
+        return
+
+    grid = nanonis.Grid(source, mmap=True)
+    arrays = dict(header_json=np.array(json.dumps(grid.header)))
+    for name, arr in grid.signals.items():
+        arrays[name] = _native(arr)
+    np.savez(_out_path(source, out_dir, root), **arrays)
+
+
+def _convert_scan(source, out_dir, root):
+    from gwyscripts import nanonis
+
+    scan = nanonis.Scan(source, mmap=True)
+    arrays = dict(header_json=np.array(json.dumps(scan.header)))
+    for chann, frames in scan.signals.items():
+        for direction, arr in frames.items():
+            arrays[chann + '/' + direction] = _native(arr)
+    np.savez(_out_path(source, out_dir, root), **arrays)
+
+
+def _convert_bin(source, out_dir, root):
+    from gwyscripts import layerbin
+
+    layer = layerbin.read_layer(source)
+    arrays = dict((name, _native(layer[name])) for name in ('xspacing', 'yspacing', 'data'))
+    arrays['nx'] = np.array(layer['nx'])
+    arrays['ny'] = np.array(layer['ny'])
+    arrays['bias'] = np.array(layer['bias'])
+    arrays['setCurrent'] = np.array(layer['setCurrent'])
+    np.savez(_out_path(source, out_dir, root), **arrays)
+
+
+def _native(arr):
+    arr = np.asarray(arr)
+    return np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder('='))
+
+
+def _common_root(paths):
+    """
+    Deepest directory holding every path, compared by path component.
+    """
+    drives, parts = zip(*[os.path.splitdrive(os.path.abspath(path)) for path in paths])
+    if any(drive != drives[0] for drive in drives):
+        raise ValueError('sources on different drives have no common directory')
+
+    common = []
+    for names in zip(*[part.split(os.sep) for part in parts]):
+        if any(name != names[0] for name in names):
+            break
+        common.append(names[0])
+    root = drives[0] + (os.sep.join(common) or os.sep)
+    if not os.path.isdir(root):
+        root = os.path.dirname(root)
+    return root
+
+
+def _out_path(source, out_dir, root):
+    rel = os.path.relpath(os.path.abspath(source), root)
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep) or os.path.isabs(rel):
+        raise ValueError('{} is not inside {}'.format(source, root))
+    path = os.path.join(out_dir, rel + '.npz')
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError:
+        if not os.path.isdir(os.path.dirname(path)):
+            raise
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m gwyscripts.convert',
+        description='Decode Nanonis .3ds grids, .sxm scans and Java layer .bin files to native NumPy formats.')
+    parser.add_argument('paths', nargs='+', help='source files or directories to search')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--out', help='directory for the .npz files, mirrors the source tree')
+    target.add_argument('--cache', action='store_true',
+                        help='fill the grid cache (GWYSCRIPTS_CACHE) instead, only .3ds files are used')
+    parser.add_argument('-j', '--jobs', type=int, help='maximum number of worker processes')
+    parser.add_argument('--mem-mb', type=float, help='memory the workers may use, default what is available')
+    args = parser.parse_args(argv)
+
+    sources = find_sources(args.paths)
+    if args.cache:
+        sources = [source for source in sources if source.endswith('.3ds')]
+        if not os.environ.get('GWYSCRIPTS_CACHE'):
+            from gwyscripts import gridcache
+            os.environ['GWYSCRIPTS_CACHE'] = gridcache.cache_dir()
+    if not sources:
+        print('no .3ds, .sxm or .bin files found')
+        return 1
+
+    root = _common_root(args.paths)
+
+    memory = int(args.mem_mb * 1024 * 1024) if args.mem_mb else None
+    workers = worker_count(sources, args.jobs, memory, args.cache)
+    print('converting {} files with {} workers'.format(len(sources), workers))
+
+    tasks = [(source, args.out, root, args.cache) for source in sources]
+    start = time.time()
+    total_bytes = 0
+    failed = 0
+
+    pool = multiprocessing.Pool(workers, maxtasksperchild=1)
+    try:
+        for done, (source, nbytes, seconds, error) in enumerate(pool.imap_unordered(convert_file, tasks), 1):
+            if error is None:
+                total_bytes += nbytes
+                print('[{}/{}] {}  {:.1f} MB  {:.2f} s  {:.1f} MB/s'.format(
+                    done, len(tasks), source, nbytes / 1e6, seconds, nbytes / 1e6 / max(seconds, 1e-9)))
+            else:
+                failed += 1
+                print('[{}/{}] {}  FAILED  {}'.format(done, len(tasks), source, error))
+            sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+
+    elapsed = time.time() - start
+    print('{} files, {:.1f} MB in {:.1f} s ({:.1f} MB/s), {} failed'.format(
+        len(tasks), total_bytes / 1e6, elapsed, total_bytes / 1e6 / max(elapsed, 1e-9), failed))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
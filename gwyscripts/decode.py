@@ -0,0 +1,112 @@
+### decode
+###
+### Chunked, multi-threaded decoding of big endian float32 payloads, such
+### as the data section of a 3ds grid, into native float32 arrays.
+###
+### Reading the payload with a single np.fromfile leaves it big endian,
+### and every later NumPy operation pays for a byte swap. Here the file is
+### read one fixed size chunk at a time into a small ring of raw buffers.
+### While the next chunk is read, a pool of threads byte-swaps the
+### previous ones into their place in a preallocated native buffer (NumPy
+### releases the GIL in the copy, Python in the read). The values stay
+### float32, float64 is only produced when they are handed to a gwy.Brick.
+
+
+import io
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import numpy as np
+
+
+# rough number of bytes read at a time
+_CHUNK_BYTES = 8 * 1024 * 1024
+
+# more threads than this only add contention on the memory bus
+_MAX_THREADS = 4
+
+
+def read_float32(fname, offset, count, out=None, chunk_bytes=_CHUNK_BYTES, threads=None):
+    """
+    Read count big endian float32 values into a native float32 array.
+
+    Parameters
+    ----------
+    fname : str
+        File to read.
+    offset : int
+        Byte offset of the first value.
+    count : int
+        Number of values.
+    out : numpy.ndarray, optional
+        Contiguous float32 array of count values to read into.
+    chunk_bytes : int, optional
+        Approximate size of the chunks read at a time.
+    threads : int, optional
+        Number of decoding threads, defaults to one per CPU up to 4. With
+        1 the chunks are decoded in the reading thread.
+
+    Returns
+    -------
+    numpy.ndarray
+        1d native float32 array.
+
+    Raises
+    ------
+    ValueError
+        If the file holds fewer than count values after offset.
+    """
+    if out is None:
+        out = np.empty(count, dtype=np.float32)
+    elif out.dtype != np.float32 or out.size != count or not out.flags.c_contiguous:
+        raise ValueError('out must be a contiguous float32 array of {} values'.format(count))
+    out = out.reshape(-1)
+
+    if threads is None:
+        threads = min(multiprocessing.cpu_count(), _MAX_THREADS)
+    chunk = max(1, chunk_bytes // 4)
+    starts = range(0, count, chunk)
+    threads = max(1, min(threads, len(starts)))
+
+    # one raw buffer per decoding thread plus the one being read into
+    free = queue.Queue()
+    for _ in range(threads + 1 if threads > 1 else 1):
+        free.put(np.empty(chunk, dtype='>f4'))
+
+    def decode(start, raw, n):
+        try:
+            out[start:start + n] = raw[:n]
+        finally:
+            free.put(raw)
+
+    pool = ThreadPool(threads) if threads > 1 else None
+    pending = []
+    try:
+        with io.open(fname, 'rb') as f:
+            f.seek(offset)
+            for start in starts:
+                n = min(chunk, count - start)
+                raw = free.get()
+                got = f.readinto(raw[:n].view(np.uint8))
+                if got != 4 * n:
+                    free.put(raw)
+                    raise ValueError('{} is truncated, expected {} values but found {}'.format(
+                        fname, count, start + got // 4))
+                if pool is None:
+                    decode(start, raw, n)
+                else:
+                    pending.append(pool.apply_async(decode, (start, raw, n)))
+        # re-raise anything that went wrong in a decoding thread
+        for result in pending:
+            result.get()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return out
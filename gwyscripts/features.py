@@ -0,0 +1,195 @@
+### features
+###
+### Per pixel features of the spectra of a grid: the position and height
+### of the coherence peaks on either side of zero bias, the gap between
+### them and the zero bias conductance, returned as 2D maps.
+###
+### All spectra of a volume indexed [x, y, sweep] are handled at once, a
+### chunk of x rows at a time. A peak is the maximum of a spectrum within
+### a bias window, found with one argmax over the sweep points of the
+### window (NaN values are masked). Its position is refined to a fraction
+### of the sweep spacing by the vertex of the parabola through the maximum
+### and its two neighbours. Spectra can be symmetrized about zero bias
+### first by averaging every point with the spectrum interpolated at minus
+### its bias. The sweep point indices and interpolation weights depend on
+### the sweep only and are computed once per call.
+
+
+import numpy as np
+
+
+# maps returned by gap_map
+MAPS = ('gap', 'zero_bias', 'positive_peak', 'positive_height',
+        'negative_peak', 'negative_height')
+
+# rough number of bytes of data per chunk of rows
+_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def _interpolation(sweep, targets):
+    """
+    Indices and weights that linearly interpolate a spectrum sampled at
+    sweep at the target biases.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        (lower index, weight of the upper point, inside). Targets outside
+        the sweep have inside False.
+    """
+    sweep = np.asarray(sweep, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64)
+    order = np.argsort(sweep)
+    position = np.interp(targets, sweep[order], np.arange(len(sweep), dtype=np.float64)[order])
+    inside = (targets >= sweep.min()) & (targets <= sweep.max())
+
+    lower = np.clip(np.floor(position).astype(np.intp), 0, max(len(sweep) - 2, 0))
+    weight = (position - lower).astype(np.float32)
+    return lower, weight, inside
+
+
+def _interpolate(data, lower, weight):
+    upper = np.minimum(lower + 1, data.shape[-1] - 1)
+    return data[..., lower] * (1 - weight) + data[..., upper] * weight
+
+
+def symmetrize(data, sweep, out=None):
+    """
+    Average every spectrum with its mirror image about zero bias.
+
+    Points whose negative bias lies outside the sweep are left as they
+    are.
+
+    Parameters
+    ----------
+    data : array_like
+        Spectra along the last axis. May be memory-mapped or big endian.
+    sweep : array_like
+        Bias of the sweep points.
+    out : numpy.ndarray, optional
+        float32 array of the same shape to write the result into.
+
+    Returns
+    -------
+    numpy.ndarray
+        float32 symmetrized spectra.
+    """
+    sweep = np.asarray(sweep)
+    lower, weight, inside = _interpolation(sweep, -sweep)
+    data = np.asarray(data, dtype=np.float32)
+    if out is None:
+        out = np.empty(data.shape, dtype=np.float32)
+
+    out[...] = data
+    mirrored = _interpolate(data, lower[inside], weight[inside])
+    out[..., inside] += mirrored
+    out[..., inside] *= 0.5
+    return out
+
+
+def find_peak(data, sweep, low, high):
+    """
+    Position and height of the maximum of every spectrum between two
+    biases.
+
+    Parameters
+    ----------
+    data : array_like
+        Spectra along the last axis.
+    sweep : array_like
+        Bias of the sweep points, monotonic.
+    low, high : float
+        Bias window searched for the maximum, both ends included.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        (position, height) with the shape of data without its last axis.
+        Spectra without a value in the window give NaN.
+    """
+    data = np.asarray(data, dtype=np.float32)
+    sweep = np.asarray(sweep, dtype=np.float64)
+    index = np.flatnonzero((sweep >= min(low, high)) & (sweep <= max(low, high)))
+    shape, num_sweep = data.shape[:-1], data.shape[-1]
+    if not len(index):
+        return np.full(shape, np.nan), np.full(shape, np.nan)
+
+    # the window of a monotonic sweep is a contiguous slice
+    start, stop = index[0], index[-1] + 1
+    window = data[..., start:stop]
+    centre = start + np.where(np.isnan(window), -np.inf, window).argmax(axis=-1)
+
+    # parabolic refinement with the neighbours in the full spectrum
+    left = np.maximum(centre - 1, 0)
+    right = np.minimum(centre + 1, num_sweep - 1)
+    pixels = tuple(np.indices(shape))
+    y0 = data[pixels + (left,)].astype(np.float64)
+    y1 = data[pixels + (centre,)].astype(np.float64)
+    y2 = data[pixels + (right,)].astype(np.float64)
+
+    curvature = y0 - 2 * y1 + y2
+    refine = (curvature < 0) & (left < centre) & (centre < right)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        offset = np.where(refine, 0.5 * (y0 - y2) / np.where(refine, curvature, 1), 0.0)
+    offset = np.clip(np.nan_to_num(offset), -0.5, 0.5)
+
+    position = np.interp(centre + offset, np.arange(num_sweep, dtype=np.float64), sweep)
+    height = y1 - 0.25 * (y0 - y2) * offset
+
+    # a spectrum that is NaN over the whole window has no peak
+    position[np.isnan(y1)] = np.nan
+    return position, height
+
+
+def gap_map(data, sweep, window=None, symmetric=False, chunk_bytes=_CHUNK_BYTES):
+    """
+    Coherence peaks, gap and zero bias conductance of every spectrum of a
+    volume.
+
+    Parameters
+    ----------
+    data : array_like
+        Conductance volume indexed [x, y, sweep], e.g. a lock-in channel
+        or the numerical dI/dV. May be memory-mapped or big endian.
+    sweep : array_like
+        Bias of the sweep points, monotonic.
+    window : tuple of float, optional
+        (min, max) of |bias| searched for the coherence peaks, on both
+        sides of zero bias. Default: the whole sweep
+    symmetric : bool, optional
+        Symmetrize the spectra about zero bias first. Default: False
+    chunk_bytes : int, optional
+        Approximate size of the chunks of x rows read at a time.
+
+    Returns
+    -------
+    dict
+        [x, y] float64 maps keyed by the names in MAPS: 'positive_peak'
+        and 'negative_peak' are the peak biases, 'positive_height' and
+        'negative_height' the peak values, 'gap' half the distance
+        between the peaks and 'zero_bias' the spectrum interpolated at
+        zero bias (NaN if the sweep does not cross zero).
+    """
+    sweep = np.asarray(sweep, dtype=np.float64)
+    nx, ny, nz = data.shape
+    if window is None:
+        window = (0.0, np.abs(sweep).max())
+    low, high = sorted(abs(float(w)) for w in window)
+
+    maps = dict((name, np.full((nx, ny), np.nan)) for name in MAPS)
+    zero_lower, zero_weight, zero_inside = _interpolation(sweep, [0.0])
+
+    rows = max(1, chunk_bytes // max(1, ny * nz * 4))
+    for x0 in range(0, nx, rows):
+        chunk = np.asarray(data[x0:x0 + rows], dtype=np.float32)
+        if symmetric:
+            chunk = symmetrize(chunk, sweep)
+        part = slice(x0, x0 + len(chunk))
+
+        maps['positive_peak'][part], maps['positive_height'][part] = find_peak(chunk, sweep, low, high)
+        maps['negative_peak'][part], maps['negative_height'][part] = find_peak(chunk, sweep, -high, -low)
+        if zero_inside[0]:
+            maps['zero_bias'][part] = _interpolate(chunk, zero_lower, zero_weight)[..., 0]
+
+    maps['gap'] = 0.5 * (maps['positive_peak'] - maps['negative_peak'])
+    return maps
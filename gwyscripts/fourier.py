@@ -0,0 +1,115 @@
+### fourier
+###
+### Batched 2d Fourier transforms of volume data, e.g. the constant bias
+### maps of a grid for QPI.
+###
+### The layers of a volume are transformed a block at a time with a single
+### real FFT call per block. NumPy's FFT keeps its plan for a given size
+### between calls, and the window is built once, so every block after the
+### first only pays for the transform itself. Only half of the spectrum
+### is computed; the other half of the magnitude follows from Hermitian
+### symmetry of the transform of real data.
+
+
+import numpy as np
+
+
+# rough number of values per block of layers, the transform needs a few
+# complex temporaries of this size
+_FFT_BLOCK = 2 * 1024 * 1024
+
+_windows = dict(hann=np.hanning, hanning=np.hanning, hamming=np.hamming,
+                blackman=np.blackman, bartlett=np.bartlett)
+
+
+def window_2d(shape, window):
+    """
+    Return a separable 2d window as a float32 array.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        (nx, ny) of the layers.
+    window : str or None
+        One of 'hann', 'hamming', 'blackman', 'bartlett', or None for no
+        window (all ones).
+
+    Returns
+    -------
+    numpy.ndarray
+        Window indexed [x, y].
+    """
+    nx, ny = shape
+    if window is None:
+        return np.ones(shape, dtype=np.float32)
+    if window not in _windows:
+        raise ValueError('unknown window {}, use one of {}'.format(window, sorted(_windows)))
+
+    func = _windows[window]
+    return np.outer(func(nx), func(ny)).astype(np.float32)
+
+
+def power_spectrum_stack(data, window=None, power=False, remove_mean=False,
+                         out=None, dtype=np.float32):
+    """
+    Fourier magnitude of every [x, y] layer of a volume.
+
+    Parameters
+    ----------
+    data : array_like
+        Volume indexed [x, y, z]. Can be a memory-mapped or big endian
+        array, it is read one block of layers at a time.
+    window : str, optional
+        Window applied to every layer before the transform, see
+        window_2d. Default: None
+    power : bool, optional
+        Return the squared magnitude instead of the magnitude.
+        Default: False
+    remove_mean : bool, optional
+        Subtract the mean of each layer first, which removes the zero
+        frequency peak. Default: False
+    out : numpy.ndarray, optional
+        Array of the same shape to write the result into. May be data
+        itself, in which case the transform is done in place block by
+        block and no second full size array is needed.
+    dtype : dtype, optional
+        dtype of a newly allocated out. Default: float32
+
+    Returns
+    -------
+    numpy.ndarray
+        Spectra indexed [kx, ky, z], shifted so zero frequency is at
+        index (nx // 2, ny // 2).
+    """
+    nx, ny, nz = data.shape
+    if out is None:
+        # Fortran order keeps every layer contiguous
+        out = np.empty((nx, ny, nz), dtype=dtype, order='F')
+
+    win = window_2d((nx, ny), window)[:, :, None]
+
+    # the half of the spectrum not returned by rfft2 is the mirror image
+    # of the computed half through the origin
+    half = ny // 2 + 1
+    mirror_x = (-np.arange(nx)) % nx
+    mirror_y = ny - np.arange(half, ny)
+
+    layers = max(1, _FFT_BLOCK // (nx * ny))
+    for z0 in range(0, nz, layers):
+        z1 = min(z0 + layers, nz)
+        block = np.array(data[:, :, z0:z1], dtype=np.float32)
+        if remove_mean:
+            block -= block.mean(axis=(0, 1), keepdims=True)
+        block *= win
+
+        spec = np.abs(np.fft.rfft2(block, axes=(0, 1)))
+        if power:
+            spec *= spec
+
+        full = np.empty((nx, ny, z1 - z0), dtype=spec.dtype)
+        full[:, :half] = spec
+        full[:, half:] = spec[mirror_x][:, mirror_y]
+
+        out[:, :, z0:z1] = np.fft.fftshift(full, axes=(0, 1))
+
+    return out
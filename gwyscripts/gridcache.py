@@ -0,0 +1,310 @@
+### gridcache
+###
+### On-disk cache of decoded grid data for fast reopening.
+###
+### Every cached source file gets its own directory holding one native
+### endian .npy file per array (params, sweep signal, topo and each
+### channel) and an index.json describing the source and the arrays.
+### Cached arrays are opened memory-mapped, so reopening a grid neither
+### re-reads nor byte-swaps the original payload.
+###
+### An entry is valid while the source has the same size and mtime. If
+### only the mtime changed (e.g. the file was copied) a quick hash of the
+### start and end of the file decides. The total size of the cache is
+### capped and the least recently used entries are removed first.
+###
+### The cache is off unless the GWYSCRIPTS_CACHE environment variable is
+### set to the directory to keep it in. GWYSCRIPTS_CACHE_MB sets the size
+### cap in megabytes.
+
+
+import os
+import json
+import time
+import shutil
+import hashlib
+
+import numpy as np
+
+
+_INDEX = 'index.json'
+
+# bytes hashed at each end of the source file
+_HASH_BYTES = 1024 * 1024
+
+# rows copied at a time when writing an array
+_WRITE_BYTES = 32 * 1024 * 1024
+
+_DEFAULT_MAX_MB = 8192
+
+
+def enabled():
+    """
+    Return True if the cache has been switched on.
+    """
+    return bool(os.environ.get('GWYSCRIPTS_CACHE'))
+
+
+def cache_dir():
+    """
+    Return the cache directory, see the module notes.
+    """
+    return os.environ.get('GWYSCRIPTS_CACHE') or os.path.join(os.path.expanduser('~'), '.gwyscripts_cache')
+
+
+def max_bytes():
+    """
+    Return the size cap of the cache in bytes.
+    """
+    return int(float(os.environ.get('GWYSCRIPTS_CACHE_MB', _DEFAULT_MAX_MB)) * 1024 * 1024)
+
+
+def quick_hash(fname):
+    """
+    Hash the size and the first and last megabyte of a file.
+    """
+    size = os.path.getsize(fname)
+    sha = hashlib.sha1(str(size).encode('ascii'))
+    with open(fname, 'rb') as f:
+        sha.update(f.read(_HASH_BYTES))
+        if size > 2 * _HASH_BYTES:
+            f.seek(size - _HASH_BYTES)
+        sha.update(f.read(_HASH_BYTES))
+    return sha.hexdigest()
+
+
+class CacheEntry(object):
+
+    """
+    Cached arrays of one source file.
+
+    Opening an entry validates it against the source and empties it if
+    the source has changed.
+
+    Parameters
+    ----------
+    source : str
+        Path of the source file.
+    root : str, optional
+        Cache directory. Default: cache_dir()
+
+    Attributes
+    ----------
+    path : str
+        Directory of this entry.
+    index : dict
+        Contents of index.json. 'arrays' maps array names to .npy files,
+        'meta' holds whatever the caller stored with set_meta.
+    """
+
+    def __init__(self, source, root=None):
+        self.source = os.path.abspath(source)
+        self.root = root or cache_dir()
+        name = hashlib.sha1(self.source.encode('utf-8')).hexdigest()[:20]
+        self.path = os.path.join(self.root, name)
+
+        stat = os.stat(self.source)
+        self.index = self._read_index()
+
+        if self.index is not None and not self._matches(stat):
+            self.clear()
+            self.index = None
+
+        is_new = self.index is None
+        if self.index is None:
+            # nothing is written to disk until the first array is stored
+            self.index = dict(source=self.source, size=stat.st_size,
+                              mtime=stat.st_mtime, hash=None,
+                              arrays=dict(), meta=dict())
+
+        self.index['last_used'] = time.time()
+        if not is_new:
+            self._write_index()
+
+    def _matches(self, stat):
+        if self.index.get('size') != stat.st_size:
+            return False
+        if self.index.get('mtime') == stat.st_mtime:
+            return True
+
+        # same size but touched, only trust it if the contents agree
+        if self.index.get('hash') is None or self.index['hash'] != quick_hash(self.source):
+            return False
+        self.index['mtime'] = stat.st_mtime
+        return True
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.path, _INDEX)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write_index(self):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        tmp = os.path.join(self.path, _INDEX + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f)
+        _replace(tmp, os.path.join(self.path, _INDEX))
+
+    def has(self, name):
+        """
+        Return True if an array of this name is cached.
+        """
+        return name in self.index['arrays']
+
+    def load(self, name):
+        """
+        Return the cached array, memory-mapped read only.
+        """
+        return np.load(os.path.join(self.path, self.index['arrays'][name]), mmap_mode='r')
+
+    def write(self, name, data, axes=None):
+        """
+        Store an array in native byte order.
+
+        The array is copied a chunk of rows at a time into a
+        memory-mapped .npy file, so data can itself be memory-mapped and
+        is never held twice in memory.
+
+        Parameters
+        ----------
+        name : str
+            Name to store the array under.
+        data : array_like
+            Array to store.
+        axes : tuple of int, optional
+            Store data.transpose(axes) instead. The chunks are still
+            rows of data, so a memory-mapped data is read sequentially
+            once whatever the new layout.
+        """
+        data = np.asarray(data)
+        axes = tuple(range(data.ndim)) if axes is None else tuple(axes)
+
+        fname = 'array_{}.npy'.format(len(self.index['arrays']))
+        while fname in self.index['arrays'].values():
+            fname = '_' + fname
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        tmp = os.path.join(self.path, fname + '.tmp')
+
+        out = np.lib.format.open_memmap(tmp, mode='w+', dtype=data.dtype.newbyteorder('='),
+                                        shape=tuple(data.shape[axis] for axis in axes))
+        if data.ndim:
+            # position of the rows of data in the stored layout
+            row_axis = axes.index(0)
+            row_bytes = max(1, data[:1].nbytes)
+            rows = max(1, _WRITE_BYTES // row_bytes)
+            for start in range(0, data.shape[0], rows):
+                index = (slice(None),) * row_axis + (slice(start, start + rows),)
+                out[index] = data[start:start + rows].transpose(axes)
+        else:
+            out[...] = data
+        out.flush()
+        del out
+
+        _replace(tmp, os.path.join(self.path, fname))
+        self.index['arrays'][name] = fname
+        if self.index.get('hash') is None:
+            self.index['hash'] = quick_hash(self.source)
+        self._write_index()
+
+    def set_meta(self, **meta):
+        """
+        Store small JSON serializable values alongside the arrays.
+        """
+        self.index['meta'].update(meta)
+        if self.index['arrays']:
+            self._write_index()
+
+    def clear(self):
+        """
+        Remove every cached array of this entry.
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def nbytes(self):
+        """
+        Return the size of this entry on disk.
+        """
+        return _dir_size(self.path)
+
+
+def evict(limit=None, root=None, keep=()):
+    """
+    Remove least recently used entries until the cache fits the limit.
+
+    Parameters
+    ----------
+    limit : int, optional
+        Size cap in bytes. Default: max_bytes()
+    root : str, optional
+        Cache directory. Default: cache_dir()
+    keep : list of str, optional
+        Entry directories that must not be removed, e.g. the one that
+        is being written.
+
+    Returns
+    -------
+    int
+        Number of entries removed.
+    """
+    limit = max_bytes() if limit is None else limit
+    root = root or cache_dir()
+    if not os.path.isdir(root):
+        return 0
+
+    entries = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path):
+            continue
+        try:
+            with open(os.path.join(path, _INDEX)) as f:
+                last_used = json.load(f).get('last_used', 0)
+        except (IOError, OSError, ValueError):
+            last_used = 0
+        entries.append((last_used, path, _dir_size(path)))
+
+    total = sum(size for _, _, size in entries)
+    removed = 0
+    for last_used, path, size in sorted(entries):
+        if total <= limit:
+            break
+        if path in keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        removed += 1
+
+    return removed
+
+
+def clear(root=None):
+    """
+    Remove the whole cache directory.
+    """
+    shutil.rmtree(root or cache_dir(), ignore_errors=True)
+
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, fnames in os.walk(path):
+        for fname in fnames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, fname))
+            except OSError:
+                pass
+    return total
+
+
+def _replace(src, dst):
+    """
+    Rename src over dst, also on Windows where os.rename refuses to
+    overwrite and Python 2.7 has no os.replace.
+    """
+    if os.name == 'nt' and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
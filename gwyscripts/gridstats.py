@@ -0,0 +1,263 @@
+### gridstats
+###
+### Single pass statistics of grid channels for colour scaling and
+### outlier detection.
+###
+### A volume indexed [x, y, z] is read one chunk of x rows at a time. For
+### every z layer, and for the volume as a whole, the chunk is folded into
+### running count, min, max, mean and variance (combined per chunk as in
+### Chan et al., so no precision is lost over many chunks) and into a
+### histogram. The histograms cannot know the data range in advance, so
+### each one starts on the range of the first values it sees and doubles
+### its range, merging pairs of bins, whenever later values fall outside.
+### Memory stays at one chunk plus the histograms however large the
+### volume is, and memory-mapped data is read sequentially once. NaN and
+### infinite values, e.g. pixels missing from an incomplete grid, are left
+### out and counted separately.
+
+
+import numpy as np
+
+
+_DEFAULT_BINS = 256
+
+# arrays returned by StreamingStatistics.result
+FIELDS = ('count', 'nonfinite', 'min', 'max', 'mean', 'std', 'hist', 'hist_edges',
+          'total_count', 'total_nonfinite', 'total_min', 'total_max', 'total_mean',
+          'total_std', 'total_hist', 'total_hist_edges')
+
+# rough number of bytes of data per chunk
+_CHUNK_BYTES = 32 * 1024 * 1024
+
+
+class StreamingHistogram(object):
+
+    """
+    Fixed number of bins per layer over a range that grows as needed.
+
+    Parameters
+    ----------
+    num_layers : int
+        Number of independent histograms.
+    bins : int, optional
+        Bins per histogram, must be even. Default: 256
+
+    Attributes
+    ----------
+    counts : numpy.ndarray
+        int64 (num_layers, bins) counts.
+    lo : numpy.ndarray
+        Lower edge of the first bin of every layer.
+    width : numpy.ndarray
+        Bin width of every layer, 0 until the layer has seen data.
+    """
+
+    def __init__(self, num_layers, bins=_DEFAULT_BINS):
+        if bins < 2 or bins % 2:
+            raise ValueError('number of bins must be even, got {}'.format(bins))
+        self.bins = bins
+        self.counts = np.zeros((num_layers, bins), dtype=np.int64)
+        self.lo = np.zeros(num_layers)
+        self.width = np.zeros(num_layers)
+
+    def update(self, values, vmin, vmax):
+        """
+        Add values of shape (m, num_layers) whose per-layer extremes are
+        vmin and vmax (NaN for a layer without values). Values that are
+        not finite are skipped, they would grow the range forever.
+        """
+        bins = self.bins
+        has_data = np.isfinite(vmin) & np.isfinite(vmax)
+
+        # the first values of a layer decide its initial range
+        new = has_data & (self.width == 0)
+        if new.any():
+            span = vmax[new] - vmin[new]
+            tiny = np.maximum(np.abs(vmin[new]), 1e-30) * 1e-6
+            self.lo[new] = vmin[new]
+            self.width[new] = np.maximum(span, tiny) * (1 + 1e-6) / bins
+
+        while True:
+            below = has_data & (vmin < self.lo)
+            above = has_data & ~below & (vmax >= self.lo + self.width * bins)
+            if not (below.any() or above.any()):
+                break
+            for grow, down in ((below, True), (above, False)):
+                if not grow.any():
+                    continue
+                merged = self.counts[grow].reshape((-1, bins // 2, 2)).sum(axis=2)
+                counts = np.zeros((len(merged), bins), dtype=np.int64)
+                if down:
+                    counts[:, bins // 2:] = merged
+                    self.lo[grow] -= self.width[grow] * bins
+                else:
+                    counts[:, :bins // 2] = merged
+                self.counts[grow] = counts
+                self.width[grow] *= 2
+
+        valid = np.isfinite(values)
+        index = np.floor((values - self.lo) / np.where(self.width > 0, self.width, 1))
+        index = np.clip(np.nan_to_num(index), 0, bins - 1).astype(np.intp)
+        index += np.arange(values.shape[1]) * bins
+        self.counts += np.bincount(index[valid], minlength=self.counts.size).reshape(self.counts.shape)
+
+    def edges(self):
+        """
+        Return the (num_layers, bins + 1) bin edges.
+        """
+        return self.lo[:, None] + self.width[:, None] * np.arange(self.bins + 1)
+
+
+class StreamingStatistics(object):
+
+    """
+    Running per-layer statistics of chunks of a volume.
+
+    Parameters
+    ----------
+    num_layers : int
+        Number of z layers.
+    bins : int, optional
+        Histogram bins, see StreamingHistogram.
+    """
+
+    def __init__(self, num_layers, bins=_DEFAULT_BINS):
+        self.count = np.zeros(num_layers, dtype=np.int64)
+        self.nonfinite = np.zeros(num_layers, dtype=np.int64)
+        self.min = np.full(num_layers, np.nan)
+        self.max = np.full(num_layers, np.nan)
+        self.mean = np.zeros(num_layers)
+        self.m2 = np.zeros(num_layers)
+        self.histogram = StreamingHistogram(num_layers, bins)
+        self.total_histogram = StreamingHistogram(1, bins)
+
+    def update(self, block):
+        """
+        Fold in a chunk of shape (..., num_layers).
+        """
+        values = np.asarray(block, dtype=np.float64).reshape((-1, len(self.count)))
+        if not len(values):
+            return
+
+        finite = np.isfinite(values)
+        if not finite.all():
+            self.nonfinite += (~finite).sum(axis=0)
+            values = np.where(finite, values, np.nan)
+            count = finite.sum(axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                vmin = np.where(count > 0, np.nanmin(np.where(count > 0, values, 0), axis=0), np.nan)
+                vmax = np.where(count > 0, np.nanmax(np.where(count > 0, values, 0), axis=0), np.nan)
+                mean = np.nansum(values, axis=0) / np.maximum(count, 1)
+                m2 = np.nansum((values - mean) ** 2, axis=0)
+        else:
+            count = np.full(len(self.count), len(values), dtype=np.int64)
+            vmin = values.min(axis=0)
+            vmax = values.max(axis=0)
+            mean = values.mean(axis=0)
+            m2 = ((values - mean) ** 2).sum(axis=0)
+
+        # combine with the running values, layers without data keep theirs
+        total = self.count + count
+        delta = mean - self.mean
+        weight = np.where(total > 0, count / np.maximum(total, 1).astype(np.float64), 0)
+        self.mean += delta * weight
+        self.m2 += m2 + delta ** 2 * self.count * weight
+        self.count = total
+        has_data = count > 0
+        self.min = np.fmin(self.min, vmin)
+        self.max = np.fmax(self.max, vmax)
+
+        self.histogram.update(values, vmin, vmax)
+        if has_data.any():
+            self.total_histogram.update(values.reshape((-1, 1)), np.array([vmin[has_data].min()]),
+                                        np.array([vmax[has_data].max()]))
+
+    def result(self):
+        """
+        Return the statistics as a dict of arrays.
+
+        Per layer: 'count' and 'nonfinite' (the values that were left
+        out), 'min', 'max', 'mean', 'std', 'hist' and 'hist_edges'. For
+        the volume as a whole the same with a 'total_' prefix.
+        """
+        count = self.count
+        total_count = count.sum()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(self.m2 / count)
+            total_mean = (self.mean * count).sum() / total_count
+            total_m2 = (self.m2 + count * (self.mean - total_mean) ** 2).sum()
+            total_std = np.sqrt(total_m2 / total_count)
+
+        return dict(count=count, nonfinite=self.nonfinite, min=self.min, max=self.max,
+                    mean=np.where(count > 0, self.mean, np.nan), std=std,
+                    hist=self.histogram.counts, hist_edges=self.histogram.edges(),
+                    total_count=np.array(total_count),
+                    total_nonfinite=np.array(self.nonfinite.sum()), total_min=np.array(np.fmin.reduce(self.min)),
+                    total_max=np.array(np.fmax.reduce(self.max)), total_mean=np.array(total_mean),
+                    total_std=np.array(total_std), total_hist=self.total_histogram.counts[0],
+                    total_hist_edges=self.total_histogram.edges()[0])
+
+
+def volume_statistics(data, bins=_DEFAULT_BINS, chunk_bytes=_CHUNK_BYTES):
+    """
+    Statistics of every layer of a volume in one pass.
+
+    Parameters
+    ----------
+    data : array_like
+        Volume indexed [x, y, z], or an image indexed [x, y] which is
+        treated as a single layer. May be memory-mapped or big endian.
+    bins : int, optional
+        Histogram bins. Default: 256
+    chunk_bytes : int, optional
+        Approximate size of the chunks of x rows read at a time.
+
+    Returns
+    -------
+    dict
+        See StreamingStatistics.result.
+    """
+    if data.ndim == 2:
+        data = data[:, :, None]
+    nx, ny, nz = data.shape
+    stats = StreamingStatistics(nz, bins)
+
+    rows = max(1, chunk_bytes // max(1, ny * nz * 8))
+    for x0 in range(0, nx, rows):
+        stats.update(data[x0:x0 + rows])
+
+    return stats.result()
+
+
+def colour_range(stats, low=0.01, high=0.99, layer=None):
+    """
+    Data range between two quantiles, read off the histogram.
+
+    Parameters
+    ----------
+    stats : dict
+        Result of volume_statistics.
+    low, high : float, optional
+        Quantiles of the range. Default: 0.01 and 0.99
+    layer : int, optional
+        Layer to use, defaults to the whole volume.
+
+    Returns
+    -------
+    tuple of float
+        (min, max), NaN if there was no data.
+    """
+    if layer is None:
+        hist, edges = stats['total_hist'], stats['total_hist_edges']
+    else:
+        hist, edges = stats['hist'][layer], stats['hist_edges'][layer]
+
+    cumulative = np.concatenate(([0], np.cumsum(hist))).astype(np.float64)
+    if cumulative[-1] == 0:
+        return (np.nan, np.nan)
+    cumulative /= cumulative[-1]
+
+    # interpolate within the bin, repeated cumulative values (empty bins)
+    # are skipped by interpolating over the unique ones
+    unique, first = np.unique(cumulative, return_index=True)
+    return tuple(float(np.interp(q, unique, edges[first])) for q in (low, high))
@@ -0,0 +1,191 @@
+### layerbin
+###
+### Reader and writer for the layer bin files of the Java code, used by
+### Read_bin.py and the command line tools in this package. It does not
+### import gwy.
+###
+### The 'header' is nx, ny (big endian int) then bias and setCurrent
+### (big endian double). The x axis, y axis and the nx*ny data values
+### follow as big endian doubles, with y running fastest in the data.
+
+
+import os
+import glob
+import struct
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+
+_header_format = '>iidd'
+_header_size = struct.calcsize(_header_format)
+
+# reading a series is mostly waiting on the disk, so a few more threads
+# than cores is fine
+_SERIES_THREADS = 8
+
+# rough number of bytes converted at a time when writing
+_WRITE_BYTES = 16 * 1024 * 1024
+
+
+def read_layer(filename):
+    """
+    Read a layer bin file with one bulk read of everything after the
+    header.
+
+    Returns
+    -------
+    dict
+        nx, ny, bias and setCurrent from the header, the xspacing and
+        yspacing axes and data indexed as data[x, y]. The arrays are big
+        endian views over the single buffer that was read.
+    """
+    with open(filename, 'rb') as f:
+        nx, ny, bias, setCurrent = struct.unpack(_header_format, f.read(_header_size))
+        count = nx + ny + nx*ny
+        values = np.fromfile(f, dtype='>f8', count=count)
+
+    if values.size != count:
+        raise ValueError('{} is truncated, expected {} values but found {}'.format(filename, count, values.size))
+
+    return dict(nx=nx, ny=ny, bias=bias, setCurrent=setCurrent,
+                xspacing=values[:nx],
+                yspacing=values[nx:nx + ny],
+                data=values[nx + ny:].reshape((nx, ny)))
+
+
+def read_layer_header(filename):
+    """
+    Read only the header and the axes of a layer bin file.
+
+    Returns
+    -------
+    dict
+        Same keys as read_layer, without data.
+    """
+    with open(filename, 'rb') as f:
+        nx, ny, bias, setCurrent = struct.unpack(_header_format, f.read(_header_size))
+        axes = np.fromfile(f, dtype='>f8', count=nx + ny)
+
+    if axes.size != nx + ny:
+        raise ValueError('{} is truncated, could not read the axes'.format(filename))
+
+    return dict(nx=nx, ny=ny, bias=bias, setCurrent=setCurrent,
+                xspacing=axes[:nx],
+                yspacing=axes[nx:])
+
+
+def read_series(path, threads=None):
+    """
+    Read a series of layer bin files into one volume ordered by bias.
+
+    The headers are read first to check that every layer has the same
+    dimensions and axes and to sort the layers by bias. The biases must
+    be evenly spaced, as the z axis of a gwy.Brick. The data of each
+    layer is then read by a pool of threads straight into its slot of the
+    volume.
+
+    Parameters
+    ----------
+    path : str or list of str
+        Directory holding the .bin layers, a glob pattern, or a list of
+        filenames.
+    threads : int, optional
+        Number of reader threads. Default: up to 8.
+
+    Returns
+    -------
+    dict
+        files and bias in bias order, setCurrent of each layer, the common
+        xspacing and yspacing axes and data indexed as data[x, y, layer].
+
+    Raises
+    ------
+    ValueError
+        If no layers are found, the layers do not match or their biases
+        are not evenly spaced.
+    """
+    if isinstance(path, (list, tuple)):
+        files = list(path)
+    elif os.path.isdir(path):
+        files = glob.glob(os.path.join(path, '*.bin'))
+    else:
+        files = glob.glob(path)
+
+    if not files:
+        raise ValueError('no layer bin files found in {}'.format(path))
+
+    pool = ThreadPool(threads or min(len(files), _SERIES_THREADS))
+    try:
+        headers = pool.map(read_layer_header, files)
+
+        first = headers[0]
+        for fname, header in zip(files, headers):
+            if (header['nx'], header['ny']) != (first['nx'], first['ny']):
+                raise ValueError('{} is {} x {}, expected {} x {}'.format(
+                    fname, header['nx'], header['ny'], first['nx'], first['ny']))
+            if not (np.array_equal(header['xspacing'], first['xspacing']) and
+                    np.array_equal(header['yspacing'], first['yspacing'])):
+                raise ValueError('{} has different axes than {}'.format(fname, files[0]))
+
+        order = sorted(range(len(files)), key=lambda i: (headers[i]['bias'], files[i]))
+        files = [files[i] for i in order]
+        headers = [headers[i] for i in order]
+
+        bias = np.array([header['bias'] for header in headers])
+        steps = np.diff(bias)
+        if len(steps) and not (steps.min() > 0 and np.allclose(steps, steps.mean(), rtol=1e-3, atol=0)):
+            raise ValueError('the biases of the layers in {} are not evenly spaced: {}'.format(
+                path, ', '.join('%g' % b for b in bias)))
+
+        # Fortran order keeps every layer contiguous and is already the
+        # memory layout of a gwy.Brick
+        data = np.empty((first['nx'], first['ny'], len(files)), order='F')
+
+        def read_into(k):
+            data[:, :, k] = read_layer(files[k])['data']
+
+        pool.map(read_into, range(len(files)))
+    finally:
+        pool.close()
+        pool.join()
+
+    return dict(files=files,
+                bias=bias,
+                setCurrent=[header['setCurrent'] for header in headers],
+                xspacing=first['xspacing'],
+                yspacing=first['yspacing'],
+                data=data)
+
+
+def write_layer(filename, data, xspacing, yspacing, bias=0.0, setCurrent=0.0):
+    """
+    Write a layer bin file.
+
+    The data is converted to big endian doubles and written a chunk of
+    x rows at a time, so it can be a view of a gwy.DataField or a
+    memory-mapped array and is never copied in full.
+
+    Parameters
+    ----------
+    filename : str
+        File to write.
+    data : array_like
+        Layer indexed as data[x, y].
+    xspacing, yspacing : array_like
+        x and y axes, of length nx and ny.
+    bias, setCurrent : float, optional
+        Header values. Default: 0.0
+    """
+    nx, ny = data.shape
+    if len(xspacing) != nx or len(yspacing) != ny:
+        raise ValueError('axes of length {} and {} do not fit a {} x {} layer'.format(
+            len(xspacing), len(yspacing), nx, ny))
+
+    rows = max(1, _WRITE_BYTES // (8 * ny))
+    with open(filename, 'wb') as f:
+        f.write(struct.pack(_header_format, nx, ny, bias, setCurrent))
+        np.asarray(xspacing, dtype='>f8').tofile(f)
+        np.asarray(yspacing, dtype='>f8').tofile(f)
+        for x0 in range(0, nx, rows):
+            np.ascontiguousarray(data[x0:x0 + rows], dtype='>f8').tofile(f)
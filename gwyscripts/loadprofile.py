@@ -0,0 +1,211 @@
+### loadprofile
+###
+### Optional per-stage timing of the file loaders.
+###
+### With the GWYSCRIPTS_PROFILE environment variable set, Read_3ds.load
+### and Read_bin.load record the wall time, bytes handled and peak memory
+### of every stage (header scan, reading the data, filling the Bricks,
+### previews, topo). Every load appends one JSON line to the log file
+### GWYSCRIPTS_PROFILE points at ('1' for ~/gwyscripts_profile.log), and
+### the same numbers are stored in the metadata of the loaded data.
+###
+### Peak memory comes from tracemalloc on Python 3, which counts the
+### allocations made during the stage. Python 2.7 has no tracemalloc, so
+### there the peak resident size of the whole process is reported
+### instead, which only ever grows.
+###
+### When the variable is not set, profile() returns a profile whose
+### stages do nothing, so the loaders pay no cost.
+
+
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+_DEFAULT_LOG = os.path.join(os.path.expanduser('~'), 'gwyscripts_profile.log')
+
+
+def log_path():
+    """
+    Return the log file to write to, or None if profiling is off.
+    """
+    value = os.environ.get('GWYSCRIPTS_PROFILE')
+    if not value or value == '0':
+        return None
+    if value == '1':
+        return _DEFAULT_LOG
+    return value
+
+
+def profile(source):
+    """
+    Return a LoadProfile for loading source, a do-nothing one if
+    profiling is off.
+    """
+    path = log_path()
+    if path is None:
+        return null_profile
+    return LoadProfile(source, path)
+
+
+class LoadProfile(object):
+
+    """
+    Timings of the stages of loading one file.
+
+    Parameters
+    ----------
+    source : str
+        Path of the file being loaded.
+    log : str, optional
+        File the results are appended to by finish().
+
+    Attributes
+    ----------
+    stages : list of dict
+        One dict per finished stage with 'stage', 'seconds', 'bytes' and
+        'peak_bytes' (None if unknown).
+    """
+
+    enabled = True
+
+    def __init__(self, source, log=None):
+        self.source = os.path.abspath(source)
+        self.log = log
+        self.stages = []
+        self._start = time.time()
+
+    @contextmanager
+    def stage(self, name, nbytes=0):
+        """
+        Time the enclosed block as one stage.
+
+        Yields the stage record, so bytes that are only known inside the
+        block can be filled in with record['bytes'] = ...
+        """
+        record = dict(stage=name, seconds=None, bytes=nbytes, peak_bytes=None)
+        trace = tracemalloc is not None and not tracemalloc.is_tracing()
+        if trace:
+            tracemalloc.start()
+        start = time.time()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.time() - start
+            if trace:
+                record['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            elif tracemalloc is None:
+                record['peak_bytes'] = peak_rss()
+            self.stages.append(record)
+
+    def total_seconds(self):
+        """
+        Return the time since the profile was created.
+        """
+        return time.time() - self._start
+
+    def summary(self):
+        """
+        Return one line of text per stage.
+        """
+        lines = []
+        for record in self.stages:
+            text = '{:.3f} s'.format(record['seconds'])
+            if record['bytes']:
+                text += ', {:.1f} MB, {:.1f} MB/s'.format(
+                    record['bytes'] / 1e6, record['bytes'] / 1e6 / max(record['seconds'], 1e-9))
+            if record['peak_bytes'] is not None:
+                text += ', peak {:.1f} MB'.format(record['peak_bytes'] / 1e6)
+            lines.append((record['stage'], text))
+        return lines
+
+    def finish(self, meta=None):
+        """
+        Append the results to the log file and store them in meta.
+
+        Parameters
+        ----------
+        meta : gwy.Container, optional
+            Metadata container that gets a 'Load <stage>' string per
+            stage and the total load time.
+        """
+        total = self.total_seconds()
+        if meta is not None:
+            for name, text in self.summary():
+                meta.set_string_by_name('Load ' + name, text)
+            meta.set_string_by_name('Load total', '{:.3f} s'.format(total))
+
+        if self.log:
+            line = dict(time=time.strftime('%Y-%m-%d %H:%M:%S'), source=self.source,
+                        total_seconds=total, stages=self.stages)
+            try:
+                with open(self.log, 'a') as f:
+                    f.write(json.dumps(line) + '\n')
+            except (IOError, OSError):
+                # a log that cannot be written must not break loading
+                pass
+
+
+class _NullProfile(object):
+
+    """
+    Stand-in for LoadProfile when profiling is off.
+    """
+
+    enabled = False
+    stages = []
+
+    @contextmanager
+    def stage(self, name, nbytes=0):
+        yield dict()
+
+    def finish(self, meta=None):
+        pass
+
+
+null_profile = _NullProfile()
+
+
+def peak_rss():
+    """
+    Return the peak resident memory of the process in bytes, or None if
+    it cannot be determined.
+    """
+    if os.name == 'nt':
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class _Counters(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                            ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                            ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+            counters = _Counters()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.PeakWorkingSetSize
+        except (ImportError, AttributeError, OSError):
+            pass
+        return None
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
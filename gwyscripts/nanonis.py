@@ -0,0 +1,1590 @@
+### nanonis
+###
+### Parsing core for Nanonis data files, used by Read_3ds.py and the
+### command line tools in this package.
+###
+### This started as a copy of the necessary parts of the nanonispy library
+### (made for Python 3.x), changed to also run on Python 2.7. It does not
+### import gwy, the Gwyddion specific parts stay in the plugin files.
+
+
+import os
+import copy
+import threading
+import numpy as np
+from collections import OrderedDict
+
+from gwyscripts import decode, features, fourier, gridcache, gridstats, loadprofile, spectra
+
+
+_end_tags = dict(grid=':HEADER_END:', scan='SCANIT_END', spec='[DATA]')
+
+# header strings are unicode on Python 2.7
+try:
+    _string_types = basestring
+except NameError:
+    _string_types = str
+
+# size of the file window mapped at a time by strided reads
+_CHUNK_BYTES = 32 * 1024 * 1024
+
+# headers are searched for the end tag in blocks of this size, up to a
+# limit so a file without a tag is not read in its entirety
+_HEADER_BLOCK_SIZE = 64 * 1024
+_HEADER_MAX_SIZE = 16 * 1024 * 1024
+
+class _HeaderCache(object):
+
+    """
+    Bounded LRU cache of file headers.
+
+    Entries are keyed on absolute path, size and modification time, so a
+    file that changes on disk is simply a cache miss. Only one entry is
+    kept per path and the least recently used entry is evicted once
+    maxsize entries are stored.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(fname):
+        stat = os.stat(fname)
+        return (os.path.abspath(fname), stat.st_size, stat.st_mtime)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            for old_key in [k for k in self._entries if k[0] == key[0]]:
+                del self._entries[old_key]
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_header_cache = _HeaderCache()
+
+def clear_header_cache():
+    """
+    Forget every cached file header.
+    """
+    _header_cache.clear()
+
+class NanonisFile(object):
+
+    """
+    Base class for Nanonis data files (grid, scan, point spectroscopy).
+
+    Handles methods and parsing tasks common to all Nanonis files.
+
+    Parameters
+    ----------
+    fname : str
+        Name of Nanonis file.
+
+    Attributes
+    ----------
+    datadir : str
+        Directory path for Nanonis file.
+    basename : str
+        Just the filename, no path.
+    fname : str
+        Full path of Nanonis file.
+    filetype : str
+        filetype corresponding to filename extension.
+    byte_offset : int
+        Size of header in bytes.
+    header_raw : str
+        Unproccessed header information.
+
+    Notes
+    -----
+    The header is found and read in a single buffered pass and cached
+    on path, size and modification time, so opening an unchanged file
+    again does not touch its contents.
+    """
+
+    def __init__(self, fname):
+        self.datadir, self.basename = os.path.split(fname)
+        self.fname = fname
+        self.filetype = self._determine_filetype()
+
+        key = _HeaderCache.key(fname)
+        entry = _header_cache.get(key)
+        if entry is None:
+            byte_offset, header_raw = self._scan_header()
+            entry = dict(byte_offset=byte_offset, header_raw=header_raw)
+            _header_cache.put(key, entry)
+        self._header_entry = entry
+
+        self.byte_offset = entry['byte_offset']
+        self.header_raw = entry['header_raw']
+
+    def _parsed_header(self, parser):
+        """
+        Return a copy of the parsed header, only calling parser on the
+        first use of a cache entry.
+        """
+        if 'header' not in self._header_entry:
+            self._header_entry['header'] = parser(self.header_raw)
+        return copy.deepcopy(self._header_entry['header'])
+
+    def _scan_header(self):
+        """
+        Find the end tag and read the header in one buffered pass.
+
+        Returns
+        -------
+        tuple
+            Size of header in bytes and the header as a decoded string.
+            See start_byte for where the header is considered to end.
+
+        Raises
+        ------
+        FileHeaderNotFoundError
+            If the end tag is not found in the first _HEADER_MAX_SIZE
+            bytes.
+        ValueError
+            If the file ends before the end tag.
+        """
+        tag = _end_tags[self.filetype].encode('ascii')
+        buf = b''
+        search_from = 0
+        tag_pos = -1
+        byte_offset = -1
+
+        with open(self.fname, 'rb') as f:
+            while len(buf) < _HEADER_MAX_SIZE:
+                block = f.read(_HEADER_BLOCK_SIZE)
+                buf += block
+
+                if tag_pos == -1:
+                    tag_pos = buf.find(tag, search_from)
+                    search_from = max(0, len(buf) - len(tag) + 1)
+
+                if tag_pos != -1:
+                    # header ends with the line holding the end tag
+                    eol = buf.find(b'\n', tag_pos + len(tag))
+                    if eol != -1:
+                        byte_offset = eol + 1
+                    elif not block:
+                        byte_offset = len(buf)
+
+                if byte_offset != -1 or not block:
+                    break
+
+        if byte_offset == -1 and len(buf) < _HEADER_MAX_SIZE:
+            raise ValueError('{} is truncated, it ends before the {} end tag'.format(
+                self.fname, _end_tags[self.filetype]))
+        if byte_offset == -1:
+            raise FileHeaderNotFoundError(
+                    'Could not find the {} end tag in {}'.format(_end_tags[self.filetype], self.basename)
+                    )
+
+        return byte_offset, buf[:byte_offset].decode(encoding="latin1")
+
+    def _determine_filetype(self):
+        """
+        Check last three characters for appropriate file extension,
+        raise error if not.
+
+        Returns
+        -------
+        str
+            Filetype name associated with extension.
+
+        Raises
+        ------
+        UnhandledFileError
+            If last three characters of filename are not one of '3ds',
+            'sxm', or 'dat'.
+        """
+
+        if self.fname[-3:] == '3ds':
+            return 'grid'
+        elif self.fname[-3:] == 'sxm':
+            return 'scan'
+        elif self.fname[-3:] == 'dat':
+            return 'spec'
+        else:
+            raise UnhandledFileError('{} is not a supported filetype or does not exist'.format(self.basename))
+
+    def read_raw_header(self, byte_offset):
+        """
+        Return header as a raw string.
+
+        Everything before the end tag is considered to be part of the header.
+        the parsing will be done later by subclass methods.
+
+        Parameters
+        ----------
+        byte_offset : int
+            Size of header in bytes. Read up to this point in file.
+
+        Returns
+        -------
+        str
+            Contents of filename up to byte_offset as a decoded binary
+            string.
+        """
+
+        with open(self.fname, 'rb') as f:
+            return f.read(byte_offset).decode(encoding="latin1")
+
+    def start_byte(self):
+        """
+        Find first byte after end tag signalling end of header info.
+
+        Caveat, I believe this is the first byte after the end of the
+        line that the end tag is found on, not strictly the first byte
+        directly after the end tag is found. For example in Scan
+        __init__, byte_offset is incremented by 4 to account for a
+        'start' byte that is not actual data.
+
+        Returns
+        -------
+        int
+            Size of header in bytes.
+        """
+
+        return self._scan_header()[0]
+
+class Grid(NanonisFile):
+
+    """
+    Nanonis grid file class.
+
+    Contains data loading method specific to Nanonis grid file. Nanonis
+    3ds files contain a header terminated by '\r\n:HEADER_END:\r\n'
+    line, after which big endian encoded binary data starts. A grid is
+    always recorded in an 'up' direction, and data is recorded
+    sequentially starting from the first pixel. The number of bytes
+    corresponding to a single pixel will depend on the experiment
+    parameters. In general the size of one pixel will be a sum of
+
+        - # fixed parameters
+        - # experimental parameters
+        - # sweep signal points (typically bias).
+
+    Hence if there are 2 fixed parameters, 8 experimental parameters,
+    and a 512 point bias sweep, a pixel will account 4 x (522) = 2088
+    bytes of data. The class intuits this from header info and extracts
+    the data for you and cuts it up into each channel, though normally
+    this should be just the current.
+
+    Grids that are still being written can be opened with
+    incomplete=True. Pixels that are not in the file yet are NaN and
+    refresh() reads whatever has been appended since the last read.
+
+    Parameters
+    ----------
+    fname : str
+        Filename for grid file.
+    mmap : bool, optional
+        If True the data section is memory-mapped instead of read into
+        memory. The arrays in signals are then read-only views over the
+        file and bytes are only paged in when a channel is accessed.
+        Default: False
+    channels : str or list of str, optional
+        Channel names to load, defaults to every channel in the header.
+    sweep_range : tuple of int, optional
+        (start, stop) sweep point indices to load, interpreted like a
+        slice. Defaults to the whole sweep.
+    incomplete : bool, optional
+        Accept a file that does not hold every pixel yet. The data is
+        read into NaN filled arrays that refresh() updates in place.
+        Cannot be combined with mmap. Default: False
+    cache : bool, optional
+        Read the data from the on-disk cache in gwyscripts.gridcache,
+        adding whatever is missing from the source first. Cached arrays
+        are native endian and memory-mapped. Cannot be combined with
+        incomplete. Default: False
+    profile : gwyscripts.loadprofile.LoadProfile, optional
+        Records the time spent scanning the header and reading the data
+        as the 'header' and 'read' (or 'cache') stages.
+    binning : int, optional
+        Average k x k blocks of pixels. Pixels beyond the last whole
+        block are dropped. Default: 1
+    sweep_step : int, optional
+        Keep every sweep_step-th sweep point, or with sweep_average the
+        mean of every sweep_step consecutive points. Default: 1
+    sweep_average : bool, optional
+        Average the sweep points instead of skipping them. Default: False
+    preview : int, optional
+        Only read this many sweep points of every channel, evenly spaced
+        over the sweep range, e.g. to look at a few bias maps of a grid
+        too large to load. The parameters and topo are read in full.
+
+    Binning, sweep reduction and preview are computed while streaming
+    the file one chunk of pixel rows at a time, so only the reduced
+    float32 arrays are held in memory. They cannot be combined with
+    incomplete or cache, and mmap has no effect on them.
+
+    Attributes
+    ----------
+    header : dict
+        Parsed 3ds header. Relevant fields are converted to float,
+        otherwise most are string values.
+    signals : dict
+        Dict keys correspond to channel name, with values being the
+        corresponding data array.
+    mmap : bool
+        Whether signals are views over a memory-mapped file.
+    channels : list of str
+        Names of the channels that were loaded.
+    sweep_range : tuple of int
+        (start, stop) sweep point indices that were loaded.
+    pixels_read : int
+        Number of complete pixels read so far, in recording order.
+    dim_px : list of int
+        Pixels of the loaded data, smaller than the header's after
+        binning.
+    size_xy : list of float
+        Size of the loaded data in m.
+    parameter_names : list of str
+        Names of the fixed and experimental parameters, in file order.
+    parameters : dict
+        Parameter name keyed dict of [x, y] maps, e.g. 'Z (m)' or
+        'X (m)'. These are views of signals['params'], nothing is
+        copied.
+    sweep_indices : numpy.ndarray
+        Sweep point indices that were read. With sweep_average every
+        consecutive sweep_step of them are averaged.
+
+    Raises
+    ------
+    UnhandledFileError
+        If fname does not have a '.3ds' extension.
+    """
+
+    def __init__(self, fname, mmap=False, channels=None, sweep_range=None,
+                 incomplete=False, cache=False, profile=None, binning=1,
+                 sweep_step=1, sweep_average=False, preview=None):
+        _is_valid_file(fname, ext='3ds')
+        if mmap and incomplete:
+            raise ValueError('incomplete grids cannot be memory-mapped')
+        if cache and incomplete:
+            raise ValueError('incomplete grids cannot be cached')
+        if binning < 1 or sweep_step < 1 or (preview is not None and preview < 1):
+            raise ValueError('binning, sweep_step and preview must be at least 1')
+        reduced = binning > 1 or sweep_step > 1 or preview is not None
+        if reduced and (cache or incomplete):
+            raise ValueError('reduced grids cannot be cached or incomplete')
+
+        # a valid cache entry also holds the header, so the source file
+        # does not need to be scanned again
+        self._cache_entry = gridcache.CacheEntry(fname) if cache else None
+        if cache:
+            meta = self._cache_entry.index['meta']
+            key = _HeaderCache.key(fname)
+            if 'byte_offset' in meta and _header_cache.get(key) is None:
+                _header_cache.put(key, dict(byte_offset=meta['byte_offset'],
+                                            header_raw=meta['header_raw']))
+
+        profile = profile or loadprofile.null_profile
+
+        with profile.stage('header') as record:
+            super(Grid,self).__init__(fname)
+            self.mmap = mmap
+            self.incomplete = incomplete
+            self.header = self._parsed_header(_parse_3ds_header)
+            self.channels, self.sweep_range = self._select(channels, sweep_range)
+            record['bytes'] = self.byte_offset
+
+        self._maps = dict()
+        self._maps_entry = None
+        self._statistics = dict()
+        names = self.header['fixed_parameters'] + self.header['experimental_parameters']
+        self.parameter_names = names[:self.header['num_parameters']]
+        self.binning = binning
+        self.sweep_step = sweep_step
+        self.sweep_average = sweep_average
+        self.preview = preview
+        self.sweep_indices = self._sweep_indices()
+
+        nx, ny = self.header['dim_px']
+        if binning > min(nx, ny):
+            raise ValueError('binning {} is larger than the {} x {} grid'.format(binning, nx, ny))
+        self.dim_px = [nx // binning, ny // binning]
+        self.size_xy = [size * dim * binning / float(num)
+                        for size, dim, num in zip(self.header['size_xy'], self.dim_px, (nx, ny))]
+
+        if reduced:
+            self.mmap = False
+            with profile.stage('read reduced') as record:
+                self.signals = self._load_reduced()
+                record['bytes'] = sum(arr.nbytes for arr in self.signals.values())
+        elif cache:
+            with profile.stage('cache'):
+                self.signals = self._load_cached()
+        else:
+            # in mmap mode the bytes are only read when the data is used
+            nbytes = 0 if mmap else os.path.getsize(fname) - self.byte_offset
+            with profile.stage('read', nbytes):
+                self.signals = self._load_data()
+                self.signals['sweep_signal'] = self._derive_sweep_signal()
+                self.signals['topo'] = self._extract_topo()
+
+        self.parameters = self._name_parameters()
+
+    def _select(self, channels, sweep_range):
+        """
+        Validate the requested channels and sweep point range, see
+        select_grid_data.
+        """
+        return select_grid_data(self.header, channels, sweep_range, self.basename)
+
+    def _sweep_indices(self):
+        """
+        Sweep point indices to read for the reduction settings.
+        """
+        start, stop = self.sweep_range
+        if self.preview is not None:
+            count = min(self.preview, stop - start)
+            return np.unique(np.linspace(start, stop - 1, count).round().astype(int))
+        if self.sweep_average:
+            # drop the points after the last whole group
+            num_groups = (stop - start) // self.sweep_step
+            if num_groups == 0:
+                raise ValueError('sweep range {} is shorter than sweep_step {}'.format(
+                    self.sweep_range, self.sweep_step))
+            return np.arange(start, start + num_groups * self.sweep_step)
+        return np.arange(start, stop, self.sweep_step)
+
+    def _load_reduced(self):
+        """
+        Read binned and sweep reduced float32 data.
+
+        The file is mapped one chunk of binning whole pixel rows at a
+        time. From every chunk the parameters and the selected sweep
+        points of every channel are copied out, converted to float32 and
+        averaged over the k x k pixel blocks and the sweep groups, before
+        moving on to the next chunk.
+
+        Returns
+        -------
+        dict
+            Channel name keyed dict of 3d float32 arrays, plus 'params',
+            'sweep_signal' and 'topo'.
+        """
+        nx, ny = self.header['dim_px']
+        num_sweep = self.header['num_sweep_signal']
+        num_param = self.header['num_parameters']
+        pix_size = num_param + num_sweep * self.header['num_channels']
+        k = self.binning
+        nx_out, ny_out = self.dim_px
+        group = self.sweep_step if self.sweep_average and self.preview is None else 1
+        idx = self.sweep_indices
+        num_out = len(idx) // group
+
+        columns = [np.arange(num_param)]
+        for chann in self.channels:
+            columns.append(num_param + self.header['channels'].index(chann) * num_sweep + idx)
+
+        out = [np.empty((nx_out, ny_out, num_param), dtype=np.float32)]
+        out += [np.empty((nx_out, ny_out, num_out), dtype=np.float32) for _ in self.channels]
+
+        rows = max(1, _CHUNK_BYTES // (k * ny * pix_size * 4))
+        for x0 in range(0, nx_out, rows):
+            x1 = min(x0 + rows, nx_out)
+            block = np.memmap(self.fname, dtype='>f4', mode='r',
+                              offset=self.byte_offset + x0 * k * ny * pix_size * 4,
+                              shape=((x1 - x0) * k, ny, pix_size))
+            for arr, cols in zip(out, columns):
+                values = block[:, :ny_out * k][:, :, cols].astype(np.float32)
+                arr[x0:x1] = _bin_block(values, k, 1 if arr is out[0] else group)
+            del block
+
+        data_dict = dict(params=out[0])
+        for chann, arr in zip(self.channels, out[1:]):
+            data_dict[chann] = arr
+        self.pixels_read = nx * ny
+
+        sweep_start, sweep_end = out[0][0, 0, :2]
+        sweep = np.linspace(sweep_start, sweep_end, num_sweep, dtype=np.float32)[idx]
+        data_dict['sweep_signal'] = sweep.reshape((num_out, group)).mean(axis=1)
+        data_dict['topo'] = out[0][:, :, self._z_index()]
+
+        return data_dict
+
+    def _load_data(self):
+        """
+        Read binary data for Nanonis 3ds file.
+
+        Only the parameters and the selected channels and sweep range
+        are read. A full selection is read and decoded in chunks by a
+        few threads, see gwyscripts.decode, otherwise the selected parts
+        of every pixel are gathered with strided reads.
+
+        Returns
+        -------
+        dict
+            Channel name keyed dict of native float32 3d arrays. In mmap
+            mode these are big endian views over a numpy.memmap of the
+            file instead.
+        """
+        # load grid params
+        nx, ny = self.header['dim_px']
+        num_sweep = self.header['num_sweep_signal']
+        num_param = self.header['num_parameters']
+        num_chan = self.header['num_channels']
+        data_dict = dict()
+        data_format = '>f4'
+
+        # pixel size in bytes
+        exp_size_per_pix = num_param + num_sweep*num_chan
+
+        # element ranges within a pixel: parameters first, then the
+        # selected part of each selected channel
+        sweep_start, sweep_stop = self.sweep_range
+        fields = [(0, num_param)]
+        for chann in self.channels:
+            start_ind = num_param + self.header['channels'].index(chann) * num_sweep
+            fields.append((start_ind + sweep_start, start_ind + sweep_stop))
+
+        full_selection = (len(self.channels) == num_chan
+                          and self.sweep_range == (0, num_sweep))
+
+        if self.incomplete:
+            # preallocate NaN filled buffers that _read_tail fills in place
+            self._fields = fields
+            self._pix_size = exp_size_per_pix
+            self._flat = [np.full((nx*ny, stop - start), np.nan, dtype=np.float32)
+                          for start, stop in fields]
+            self.pixels_read = 0
+            self._read_tail()
+            arrays = [arr.reshape((nx, ny, -1)) for arr in self._flat]
+        elif self.mmap or full_selection:
+            if self.mmap:
+                # map only the expected data section, nothing is read yet
+                griddata = np.memmap(self.fname, dtype=data_format, mode='r',
+                                     offset=self.byte_offset,
+                                     shape=(nx*ny*exp_size_per_pix,))
+            else:
+                griddata = decode.read_float32(self.fname, self.byte_offset,
+                                               nx*ny*exp_size_per_pix)
+
+            # reshape from 1d to 3d
+            griddata_shaped = griddata.reshape((nx, ny, exp_size_per_pix))
+            arrays = [griddata_shaped[:, :, start:stop] for start, stop in fields]
+            self.pixels_read = nx*ny
+        else:
+            arrays = _read_pixel_fields(self.fname, self.byte_offset, nx*ny,
+                                        exp_size_per_pix, fields, data_format)
+            arrays = [arr.reshape((nx, ny, -1)) for arr in arrays]
+            self.pixels_read = nx*ny
+
+        # experimental parameters are first num_param of every pixel
+        data_dict['params'] = arrays[0]
+
+        # extract data for each channel
+        for chann, arr in zip(self.channels, arrays[1:]):
+            data_dict[chann] = arr
+
+        return data_dict
+
+    def _load_cached(self):
+        """
+        Return the signals from the on-disk cache.
+
+        Channels that are not cached yet are read in full from the
+        memory-mapped source and written to the cache first, after which
+        the least recently used cache entries are evicted if the cache
+        is over its size limit.
+
+        Returns
+        -------
+        dict
+            Channel name keyed dict of memory-mapped arrays, cut to the
+            selected sweep range.
+        """
+        entry = self._cache_entry
+        missing = [chann for chann in self.channels if not entry.has('channel/' + chann)]
+
+        if missing or not entry.has('params'):
+            source = Grid(self.fname, mmap=True, channels=missing)
+            if not entry.has('params'):
+                entry.set_meta(byte_offset=self.byte_offset, header_raw=self.header_raw)
+                entry.write('params', source.signals['params'])
+                entry.write('sweep_signal', source.signals['sweep_signal'])
+                entry.write('topo', source.signals['topo'])
+            for chann in missing:
+                entry.write('channel/' + chann, source.signals[chann])
+            del source
+            gridcache.evict(keep=[entry.path])
+
+        start, stop = self.sweep_range
+        data_dict = dict()
+        data_dict['params'] = entry.load('params')
+        data_dict['sweep_signal'] = entry.load('sweep_signal')[start:stop]
+        data_dict['topo'] = entry.load('topo')
+        for chann in self.channels:
+            data_dict[chann] = entry.load('channel/' + chann)[:, :, start:stop]
+
+        return data_dict
+
+    def refresh(self):
+        """
+        Read the pixels appended to an incomplete grid since the last
+        read.
+
+        Only the new bytes at the end of the file are read, and they are
+        written into the existing arrays in signals, so views held on to
+        by the caller see the update.
+
+        Returns
+        -------
+        int
+            Number of new pixels, always 0 for a grid that was not opened
+            with incomplete=True.
+        """
+        if not self.incomplete:
+            return 0
+
+        had_pixels = self.pixels_read > 0
+        num_new = self._read_tail()
+
+        # the sweep signal comes from the first pixel, which may only
+        # have arrived now
+        if num_new and not had_pixels:
+            self.signals['sweep_signal'] = self._derive_sweep_signal()
+
+        return num_new
+
+    def _read_tail(self):
+        """
+        Read every complete pixel after pixels_read into the buffers.
+
+        Returns
+        -------
+        int
+            Number of pixels read.
+        """
+        nx, ny = self.header['dim_px']
+        pix_bytes = self._pix_size * 4
+
+        # a pixel that is only partly written is picked up next time
+        num_avail = (os.path.getsize(self.fname) - self.byte_offset) // pix_bytes
+        num_avail = max(0, min(num_avail, nx*ny))
+        first = self.pixels_read
+        if num_avail <= first:
+            return 0
+
+        out = [arr[first:num_avail] for arr in self._flat]
+        _read_pixel_fields(self.fname, self.byte_offset + first * pix_bytes,
+                           num_avail - first, self._pix_size, self._fields,
+                           out=out)
+        self.pixels_read = num_avail
+
+        return num_avail - first
+
+    def fft_stack(self, channel, window=None, power=False, remove_mean=False,
+                  dtype=np.float32):
+        """
+        Fourier magnitude of every constant sweep signal map of a
+        channel, e.g. for QPI.
+
+        The channel is first copied into the output array a chunk of
+        rows at a time, which reads the file sequentially in mmap mode,
+        or a block of layers at a time from the bias-major copy if
+        build_map_layout made one, and then transformed in place a block
+        of layers at a time. The
+        output is the only full size array that is allocated.
+
+        Parameters
+        ----------
+        channel : str
+            Name of a loaded channel.
+        window, power, remove_mean
+            See gwyscripts.fourier.power_spectrum_stack.
+        dtype : dtype, optional
+            dtype of the result. Default: float32
+
+        Returns
+        -------
+        numpy.ndarray
+            Spectra indexed [kx, ky, sweep], shifted so zero frequency is
+            at index (nx // 2, ny // 2).
+        """
+        data = self.signals[channel]
+        nx, ny, nz = data.shape
+        out = np.empty((nx, ny, nz), dtype=dtype, order='F')
+
+        maps = self.map_layout(channel)
+        if maps is not None:
+            # every layer is contiguous in the bias-major copy
+            layers = max(1, _CHUNK_BYTES // (nx * ny * 4))
+            for z0 in range(0, nz, layers):
+                out[:, :, z0:z0 + layers] = maps[z0:z0 + layers].transpose(1, 2, 0)
+        else:
+            rows = max(1, _CHUNK_BYTES // (ny * nz * 4))
+            for x0 in range(0, nx, rows):
+                out[x0:x0 + rows] = data[x0:x0 + rows]
+
+        return fourier.power_spectrum_stack(out, window, power, remove_mean, out=out)
+
+    def build_map_layout(self, channels=None):
+        """
+        Persist bias-major copies of channels next to the grid.
+
+        In the 3ds file every spectrum is contiguous, but a constant
+        sweep signal map is spread over the whole file. The copies are
+        stored transposed, indexed [sweep, x, y], in the on-disk cache of
+        gwyscripts.gridcache (its default directory if GWYSCRIPTS_CACHE
+        is not set), so a map is a single contiguous read. They are
+        written once, reading the source sequentially, and stay valid
+        until the source file changes. layer() and fft_stack() use them
+        from then on, also in later sessions, while spectrum() keeps
+        reading the original layout.
+
+        Parameters
+        ----------
+        channels : str or list of str, optional
+            Channels to copy, defaults to every loaded channel.
+
+        Raises
+        ------
+        ValueError
+            For reduced or incomplete grids, whose data differs from the
+            file.
+        """
+        if self._reduced() or self.incomplete:
+            raise ValueError('map layouts can only be built for complete, full resolution grids')
+        if channels is None:
+            channels = self.channels
+        elif isinstance(channels, _string_types):
+            channels = [channels]
+
+        entry = self._map_entry()
+        missing = [chann for chann in channels if not entry.has('maps/' + chann)]
+        if not missing:
+            return
+
+        source = Grid(self.fname, mmap=True, channels=missing)
+        for chann in missing:
+            entry.write('maps/' + chann, source.signals[chann], axes=(2, 0, 1))
+        del source
+        gridcache.evict(keep=[entry.path])
+
+    def map_layout(self, channel):
+        """
+        Return the bias-major copy of a channel, or None if there is none.
+
+        Returns
+        -------
+        numpy.ndarray or None
+            Memory-mapped array indexed [sweep, x, y], cut to the loaded
+            sweep range.
+        """
+        if self._reduced() or self.incomplete:
+            return None
+        if channel not in self._maps:
+            entry = self._map_entry()
+            key = 'maps/' + channel
+            if not entry.has(key):
+                return None
+            start, stop = self.sweep_range
+            self._maps[channel] = entry.load(key)[start:stop]
+        return self._maps[channel]
+
+    def layer(self, channel, index):
+        """
+        Map of a channel at one sweep point, indexed [x, y].
+
+        Read from the bias-major copy if there is one, see
+        build_map_layout, otherwise gathered from every pixel.
+        """
+        maps = self.map_layout(channel)
+        if maps is not None:
+            return maps[index]
+        return self.signals[channel][:, :, index]
+
+    def spectrum(self, channel, x, y):
+        """
+        Spectrum of a channel at pixel (x, y), contiguous in the
+        original layout.
+        """
+        return self.signals[channel][x, y]
+
+    def _reduced(self):
+        return self.binning > 1 or self.sweep_step > 1 or self.preview is not None
+
+    def _map_entry(self):
+        if self._cache_entry is not None:
+            return self._cache_entry
+        if self._maps_entry is None:
+            self._maps_entry = gridcache.CacheEntry(self.fname)
+        return self._maps_entry
+
+    def didv(self, channel, window=3, order=2):
+        """
+        Numerical derivative of a channel with respect to the sweep
+        signal, e.g. dI/dV of the current.
+
+        See gwyscripts.spectra.didv for the arguments. Computed in
+        float32 a chunk of rows at a time.
+
+        Returns
+        -------
+        numpy.ndarray
+            float32 volume indexed [x, y, sweep].
+        """
+        return spectra.didv(self.signals[channel], self.signals['sweep_signal'], window, order)
+
+    def normalized_didv(self, channel, window=3, order=2, broadening=0.01):
+        """
+        Normalized conductance (dI/dV)/(I/V) of a current channel.
+
+        See gwyscripts.spectra.normalized_didv for the arguments.
+
+        Returns
+        -------
+        numpy.ndarray
+            float32 volume indexed [x, y, sweep].
+        """
+        return spectra.normalized_didv(self.signals[channel], self.signals['sweep_signal'],
+                                       window, order, broadening)
+
+    def smooth(self, channel, window=5, order=2):
+        """
+        Savitzky-Golay smoothed spectra of a channel.
+
+        See gwyscripts.spectra.smooth for the arguments.
+
+        Returns
+        -------
+        numpy.ndarray
+            float32 volume indexed [x, y, sweep].
+        """
+        return spectra.smooth(self.signals[channel], window, order)
+
+    def gap_map(self, channel, window=None, symmetric=False):
+        """
+        Coherence peaks, gap and zero bias conductance of every spectrum
+        of a conductance channel.
+
+        See gwyscripts.features.gap_map for the arguments. All spectra
+        are handled at once, a chunk of rows at a time.
+
+        Returns
+        -------
+        dict
+            [x, y] maps keyed by the names in gwyscripts.features.MAPS.
+        """
+        return features.gap_map(self.signals[channel], self.signals['sweep_signal'], window, symmetric)
+
+    def statistics(self, channel, bins=256):
+        """
+        Per sweep point and overall statistics of a channel.
+
+        Computed in a single pass over the channel a chunk of rows at a
+        time, see gwyscripts.gridstats, only when asked for. The result
+        is kept on this Grid, and with cache=True also in the on-disk
+        cache so opening the unchanged file again does not touch the
+        data. It is not kept with the header cache, the histograms would
+        make its memory use unbounded. A summary is added to
+        header['statistics'].
+
+        Parameters
+        ----------
+        channel : str
+            Name of a loaded channel, or 'topo'.
+        bins : int, optional
+            Histogram bins. Default: 256
+
+        Returns
+        -------
+        dict
+            See gwyscripts.gridstats.StreamingStatistics.result.
+        """
+        # an incomplete grid changes with every refresh
+        memo = None if self.incomplete else self._statistics
+        stats = None if memo is None else memo.get((channel, bins))
+
+        # the disk cache holds statistics of full sweeps only
+        entry = self._cache_entry
+        on_disk = (entry is not None and self.sweep_range == (0, self.header['num_sweep_signal']) and
+                   (self.binning, self.sweep_step, self.sweep_average, self.preview) == (1, 1, False, None))
+        prefix = 'stats/{}/{}/'.format(channel, bins)
+        if stats is None and on_disk and all(entry.has(prefix + name) for name in gridstats.FIELDS):
+            stats = dict((name, np.array(entry.load(prefix + name))) for name in gridstats.FIELDS)
+
+        if stats is None:
+            stats = gridstats.volume_statistics(self.signals[channel], bins)
+            if on_disk:
+                for name in gridstats.FIELDS:
+                    entry.write(prefix + name, stats[name])
+
+        if memo is not None:
+            memo[(channel, bins)] = stats
+
+        self.header.setdefault('statistics', dict())[channel] = dict(
+            min=float(stats['total_min']), max=float(stats['total_max']),
+            mean=float(stats['total_mean']), std=float(stats['total_std']),
+            colour_range=gridstats.colour_range(stats))
+
+        return stats
+
+    def _derive_sweep_signal(self):
+        """
+        Computer sweep signal.
+
+        Based on start and stop points of sweep signal in header, and
+        number of sweep signal points.
+
+        Returns
+        -------
+        numpy.ndarray
+            1d sweep signal, should be sample bias in most cases.
+        """
+        # find sweep signal start and end from a given pixel value
+        sweep_start, sweep_end = self.signals['params'][0, 0, :2]
+        num_sweep_signal = self.header['num_sweep_signal']
+        start, stop = self.sweep_range
+
+        return np.linspace(sweep_start, sweep_end, num_sweep_signal, dtype=np.float32)[start:stop]
+
+    def _extract_topo(self):
+        """
+        Extract topographic map based on z-controller height at each
+        pixel.
+
+        The data is already extracted, though it lives in the signals
+        dict under the key 'params'. The Z (m) column is looked up by
+        name, so other parameter settings are handled as well.
+
+        Returns
+        -------
+        numpy.ndarray
+            Copy of already extracted data to be more easily accessible
+            in signals dict.
+        """
+        return self.signals['params'][:, :, self._z_index()]
+
+    def _z_index(self):
+        """
+        Index of the Z (m) parameter, found by name.
+
+        Files that do not name a Z parameter keep the column used by
+        the default Nanonis settings.
+        """
+        names = self.parameter_names
+        if 'Z (m)' in names:
+            return names.index('Z (m)')
+        for i, name in enumerate(names):
+            if name.startswith('Z ') and name.endswith('(m)'):
+                return i
+        return 4
+
+    def _name_parameters(self):
+        """
+        Name the parameter maps.
+
+        Returns
+        -------
+        dict
+            Parameter name keyed dict of [x, y] views of the parameter
+            block, no data is copied.
+        """
+        params = self.signals['params']
+        return dict((name, params[:, :, i]) for i, name in enumerate(self.parameter_names))
+
+class Scan(NanonisFile):
+
+    """
+    Nanonis scan file class.
+
+    Nanonis sxm files start with a header of ':NAME:' lines, each
+    followed by its value, terminated by ':SCANIT_END:'. The big endian
+    float32 data starts after the 0x1A 0x04 code that follows the
+    header. It holds one frame of scan_pixels per channel and direction,
+    every frame stored line by line in the order the lines were scanned.
+
+    The frames are returned as [x, y] views of a single array over the
+    data, so nothing is copied or byte-swapped until a frame is used.
+    Backward frames are mirrored in x so both directions line up, and
+    frames of upward scans are flipped in y so that y = 0 is the top
+    line, as in Gwyddion. Both are views as well.
+
+    Parameters
+    ----------
+    fname : str
+        Filename for scan file.
+    mmap : bool, optional
+        If True the data is memory-mapped instead of read into memory.
+        Default: False
+
+    Attributes
+    ----------
+    header : dict
+        Parsed sxm header. Besides every entry as a string, keyed by the
+        lower case name, 'scan_pixels', 'scan_range', 'scan_offset' and
+        others are converted to numbers and 'data_info' is a list of one
+        dict per channel.
+    signals : dict
+        Channel name keyed dict of dicts with a 'forward' and/or
+        'backward' [x, y] array.
+    channels : list of str
+        Channel names in file order.
+    mmap : bool
+        Whether signals are views over a memory-mapped file.
+
+    Raises
+    ------
+    UnhandledFileError
+        If fname does not have a '.sxm' extension.
+    ValueError
+        If the file is shorter than its header says.
+    """
+
+    def __init__(self, fname, mmap=False):
+        _is_valid_file(fname, ext='sxm')
+        super(Scan,self).__init__(fname)
+        self.mmap = mmap
+        self.header = self._parsed_header(_parse_sxm_header)
+        self.channels = [info['Name'] for info in self.header['data_info']]
+        self.data_offset = self._find_data_offset()
+        self.signals = self._load_data()
+
+    def _find_data_offset(self):
+        """
+        Return the offset of the first data byte, just after the 0x1A
+        0x04 code a few bytes past the header.
+        """
+        with open(self.fname, 'rb') as f:
+            f.seek(self.byte_offset)
+            lead = f.read(16)
+        pos = lead.find(b'\x1a\x04')
+        if pos == -1:
+            # older files, the code is assumed to take the next 4 bytes
+            return self.byte_offset + 4
+        return self.byte_offset + pos + 2
+
+    def _load_data(self):
+        """
+        Map or read the data and cut it into frames.
+
+        Returns
+        -------
+        dict
+            Channel name keyed dict of direction keyed [x, y] views.
+        """
+        nx, ny = self.header['scan_pixels']
+        frames = []
+        for info in self.header['data_info']:
+            if info['Direction'] == 'both':
+                frames += [(info['Name'], 'forward'), (info['Name'], 'backward')]
+            else:
+                frames.append((info['Name'], info['Direction']))
+
+        count = len(frames) * nx * ny
+        found = max(0, os.path.getsize(self.fname) - self.data_offset) // 4
+        if found < count:
+            raise ValueError('{} is truncated, expected {} values but found {}'.format(
+                self.fname, count, found))
+
+        if self.mmap:
+            scandata = np.memmap(self.fname, dtype='>f4', mode='r',
+                                 offset=self.data_offset, shape=(count,))
+        else:
+            with open(self.fname, 'rb') as f:
+                f.seek(self.data_offset)
+                scandata = np.fromfile(f, dtype='>f4', count=count)
+
+        # frames are stored line by line, i.e. [frame, y, x]
+        scandata = scandata.reshape((len(frames), ny, nx)).transpose(0, 2, 1)
+        flip_y = self.header.get('scan_dir') == 'up'
+
+        data_dict = dict()
+        for i, (chann, direction) in enumerate(frames):
+            frame = scandata[i]
+            if direction == 'backward':
+                frame = frame[::-1]
+            if flip_y:
+                frame = frame[:, ::-1]
+            data_dict.setdefault(chann, dict())[direction] = frame
+
+        return data_dict
+
+def read_grid_header(fname):
+    """
+    Return the parsed header of a 3ds file without reading any data.
+
+    The header is cached, so opening a Grid of the same file afterwards
+    does not scan it again.
+    """
+    _is_valid_file(fname, ext='3ds')
+    return NanonisFile(fname)._parsed_header(_parse_3ds_header)
+
+def select_grid_data(header, channels=None, sweep_range=None, name='grid'):
+    """
+    Validate the channels and sweep point range requested from a grid.
+
+    Parameters
+    ----------
+    header : dict
+        Parsed 3ds header, e.g. from read_grid_header.
+    channels : str or list of str, optional
+        Channel names, defaults to every channel in the header.
+    sweep_range : tuple of int, optional
+        (start, stop) sweep point indices, interpreted like a slice.
+        Defaults to the whole sweep.
+    name : str, optional
+        Name of the grid in error messages.
+
+    Returns
+    -------
+    tuple
+        List of channel names and (start, stop) sweep indices.
+
+    Raises
+    ------
+    ValueError
+        If a channel is not in the header or the range is empty.
+    """
+    all_channels = header['channels']
+    num_sweep = header['num_sweep_signal']
+
+    if channels is None:
+        channels = list(all_channels)
+    elif isinstance(channels, _string_types):
+        channels = [channels]
+    else:
+        channels = list(channels)
+
+    for chann in channels:
+        if chann not in all_channels:
+            raise ValueError('{} has no channel {}'.format(name, chann))
+
+    if sweep_range is None:
+        sweep_range = (0, num_sweep)
+    start, stop, step = slice(*sweep_range).indices(num_sweep)
+    if step != 1 or stop <= start:
+        raise ValueError('invalid sweep range {} for {} points'.format(sweep_range, num_sweep))
+
+    return channels, (start, stop)
+
+def write_grid(fname, header, signals, chunk_bytes=_CHUNK_BYTES):
+    """
+    Write a Nanonis 3ds grid file.
+
+    The header is written in the Nanonis format and the parameters and
+    channels interleaved per pixel as big endian float32. The payload is
+    assembled and byte-swapped a chunk of x rows at a time, so the
+    arrays can be views of gwy.Bricks or memory-mapped and are never
+    copied in full.
+
+    Parameters
+    ----------
+    fname : str
+        File to write.
+    header : dict
+        Header in the format of Grid.header. 'dim_px', 'size_xy',
+        'sweep_signal', 'fixed_parameters', 'experimental_parameters'
+        and 'channels' are required. 'pos_xy', 'angle',
+        'measure_delay', 'experiment_name', 'start_time', 'end_time',
+        'user' and 'comment' are written if present. The number of
+        parameters and sweep points and the experiment size follow from
+        the arrays.
+    signals : dict
+        'params' indexed [x, y, parameter] and every channel in
+        header['channels'] indexed [x, y, sweep]. A channel can also be
+        given as a callable that returns its array. It is then only
+        called when the channel is written, after the arrays, and one
+        such channel is held at a time. If every channel is a callable,
+        header needs 'num_sweep_signal'.
+    chunk_bytes : int, optional
+        Approximate size of the payload assembled at a time.
+    """
+    nx, ny = header['dim_px']
+    params = signals['params']
+    channels = list(header['channels'])
+    num_param = len(header['fixed_parameters']) + len(header['experimental_parameters'])
+    if params.shape != (nx, ny, num_param):
+        raise ValueError('params of shape {} do not fit {} x {} pixels with {} parameters'.format(
+            params.shape, nx, ny, num_param))
+
+    deferred = [chann for chann in channels if callable(signals[chann])]
+    arrays = [chann for chann in channels if chann not in deferred]
+    num_sweep = signals[arrays[0]].shape[2] if arrays else header['num_sweep_signal']
+
+    def check(chann, arr):
+        if arr.shape != (nx, ny, num_sweep):
+            raise ValueError('{} has shape {}, expected {}'.format(chann, arr.shape, (nx, ny, num_sweep)))
+
+    for chann in arrays:
+        check(chann, signals[chann])
+
+    settings = list(header.get('pos_xy', (0.0, 0.0))) + list(header['size_xy']) + [header.get('angle', 0.0)]
+    lines = ['Grid dim="{} x {}"'.format(nx, ny),
+             'Grid settings={}'.format(';'.join(_format_float(val) for val in settings)),
+             'Sweep Signal="{}"'.format(header['sweep_signal']),
+             'Fixed parameters="{}"'.format(';'.join(header['fixed_parameters'])),
+             'Experiment parameters="{}"'.format(';'.join(header['experimental_parameters'])),
+             '# Parameters (4 byte)={}'.format(num_param),
+             'Experiment size (bytes)={}'.format(4 * num_sweep * len(channels)),
+             'Points={}'.format(num_sweep),
+             'Channels="{}"'.format(';'.join(channels)),
+             'Delay before measuring (s)={}'.format(_format_float(header.get('measure_delay', 0.0))),
+             'Experiment={}'.format(header.get('experiment_name', 'Grid Spectroscopy')),
+             'Start time={}'.format(header.get('start_time', '')),
+             'End time={}'.format(header.get('end_time', '')),
+             'User={}'.format(header.get('user', '')),
+             'Comment={}'.format(header.get('comment', '')),
+             _end_tags['grid'], '']
+
+    pix_size = num_param + num_sweep * len(channels)
+    rows = max(1, chunk_bytes // (4 * ny * pix_size))
+    block = np.zeros((rows, ny, pix_size), dtype='>f4')
+    header_raw = '\r\n'.join(lines).encode('latin1')
+
+    with open(fname, 'wb') as f:
+        f.write(header_raw)
+        for x0 in range(0, nx, rows):
+            x1 = min(x0 + rows, nx)
+            chunk = block[:x1 - x0]
+            chunk[:, :, :num_param] = params[x0:x1]
+            for chann in arrays:
+                start = num_param + channels.index(chann) * num_sweep
+                chunk[:, :, start:start + num_sweep] = signals[chann][x0:x1]
+            chunk.tofile(f)
+
+    # the deferred channels are filled in afterwards, mapping a chunk of
+    # rows of the file at a time
+    for chann in deferred:
+        arr = signals[chann]()
+        check(chann, arr)
+        start = num_param + channels.index(chann) * num_sweep
+        for x0 in range(0, nx, rows):
+            x1 = min(x0 + rows, nx)
+            chunk = np.memmap(fname, dtype='>f4', mode='r+',
+                              offset=len(header_raw) + 4 * x0 * ny * pix_size,
+                              shape=(x1 - x0, ny, pix_size))
+            chunk[:, :, start:start + num_sweep] = arr[x0:x1]
+            chunk.flush()
+            del chunk
+        del arr
+
+def _format_float(val):
+    """
+    Format a number the way Nanonis does, e.g. 1.000000E-8.
+    """
+    mantissa, exponent = '{:E}'.format(val).split('E')
+    return '{}E{:+d}'.format(mantissa, int(exponent))
+
+class UnhandledFileError(Exception):
+
+    """
+    To be raised when unknown file extension is passed.
+    """
+    pass
+
+
+class FileHeaderNotFoundError(Exception):
+
+    """
+    To be raised when no header information could be determined.
+    """
+    pass
+
+
+def _parse_3ds_header(header_raw):
+    """
+    Parse raw header string.
+
+    Empirically done based on Nanonis header structure. See Grid
+    docstring or Nanonis help documentation for more details. Entries
+    are looked up by their name, so extra or reordered entries written by
+    other software versions (e.g. 'Filetype=Linear' in 'generic 5') do
+    not matter.
+
+    Parameters
+    ----------
+    header_raw : str
+        Raw header string from read_raw_header() method.
+
+    Returns
+    -------
+    dict
+        Channel name keyed dict of 3d array.
+
+    Raises
+    ------
+    FileHeaderNotFoundError
+        If a required entry is missing from the header.
+    """
+    header_entries = _header_entries(header_raw)
+
+    def entry(name, multiple=False, default=None):
+        if name not in header_entries:
+            if default is None:
+                raise FileHeaderNotFoundError('3ds header has no {} entry'.format(name))
+            return default
+        return _split_header_entry(header_entries[name], multiple)
+
+    header_dict = dict()
+
+    # grid dimensions in pixels
+    dim_px_str = entry('Grid dim')
+    header_dict['dim_px'] = [int(val) for val in dim_px_str.split(' x ')]
+
+    # grid frame center position, size, angle
+    grid_str = entry('Grid settings', multiple=True)
+    header_dict['pos_xy'] = [float(val) for val in grid_str[:2]]
+    header_dict['size_xy'] = [float(val) for val in grid_str[2:4]]
+    header_dict['angle'] = float(grid_str[-1])
+
+    # sweep signal
+    header_dict['sweep_signal'] = entry('Sweep Signal')
+
+    # fixed parameters
+    header_dict['fixed_parameters'] = entry('Fixed parameters', multiple=True)
+
+    # experimental parameters
+    header_dict['experimental_parameters'] = entry('Experiment parameters', multiple=True)
+
+    # number of parameters (each 4 bytes)
+    header_dict['num_parameters'] = int(entry('# Parameters (4 byte)'))
+
+    # experiment size in bytes
+    header_dict['experiment_size'] = int(entry('Experiment size (bytes)'))
+
+    # number of points of sweep signal
+    header_dict['num_sweep_signal'] = int(entry('Points'))
+
+    # channel names
+    header_dict['channels'] = entry('Channels', multiple=True)
+    header_dict['num_channels'] = len(header_dict['channels'])
+
+    # measure delay
+    header_dict['measure_delay'] = float(entry('Delay before measuring (s)', default='0'))
+
+    # metadata
+    header_dict['experiment_name'] = entry('Experiment', default='')
+    header_dict['start_time'] = entry('Start time', default='')
+    header_dict['end_time'] = entry('End time', default='')
+    header_dict['user'] = entry('User', default='')
+    header_dict['comment'] = entry('Comment', default='')
+
+    return header_dict
+
+def _parse_sxm_header(header_raw):
+    """
+    Parse raw sxm header string.
+
+    Every ':NAME:' line starts an entry whose value is the following
+    lines up to the next entry. The DATA_INFO table of channels is split
+    into a dict per channel.
+
+    Parameters
+    ----------
+    header_raw : str
+        Raw header string.
+
+    Returns
+    -------
+    dict
+        Lower case entry name keyed dict.
+
+    Raises
+    ------
+    FileHeaderNotFoundError
+        If a required entry is missing from the header.
+    """
+    header_dict = dict()
+    name = None
+    for line in header_raw.splitlines():
+        stripped = line.strip()
+        if len(stripped) > 1 and stripped.startswith(':') and stripped.endswith(':'):
+            name = stripped.strip(':')
+            if name == 'SCANIT_END':
+                break
+            header_dict[name.lower()] = []
+        elif name is not None and stripped:
+            header_dict[name.lower()].append(line)
+
+    table = header_dict.pop('data_info', None)
+    for key, lines in list(header_dict.items()):
+        header_dict[key] = '\n'.join(entry.strip() for entry in lines)
+
+    for key, value in (('SCAN_PIXELS', header_dict.get('scan_pixels')),
+                       ('SCAN_RANGE', header_dict.get('scan_range')), ('DATA_INFO', table)):
+        if value is None:
+            raise FileHeaderNotFoundError('sxm header has no {} entry'.format(key))
+
+    header_dict['scan_pixels'] = [int(val) for val in header_dict['scan_pixels'].split()]
+    for key in ('scan_range', 'scan_offset', 'scan_time'):
+        if key in header_dict:
+            header_dict[key] = [float(val) for val in header_dict[key].split()]
+    for key in ('scan_angle', 'bias', 'acq_time'):
+        if key in header_dict:
+            header_dict[key] = float(header_dict[key])
+    if 'scan_dir' in header_dict:
+        header_dict['scan_dir'] = header_dict['scan_dir'].lower()
+
+    columns = table[0].split()
+    header_dict['data_info'] = [dict(zip(columns, row.strip().split('\t'))) for row in table[1:]]
+
+    return header_dict
+
+def _header_entries(header_raw):
+    """
+    Key the 'name=value' lines of a raw header by name.
+
+    Lines without an '=' character, like the end tag, are skipped.
+    """
+    header_entries = dict()
+    for line in header_raw.splitlines():
+        if '=' in line:
+            header_entries[line.split('=', 1)[0]] = line
+    return header_entries
+
+def _split_header_entry(entry, multiple=False):
+    """
+    Split 3ds header entries by '=' character. If multiple values split
+    those by ';' character.
+    """
+
+    _, val_str = entry.split("=", 1)
+
+    if multiple:
+        return val_str.strip('"').split(';')
+    else:
+        return val_str.strip('"')
+        
+def save_array(file, arr, allow_pickle=True):
+    """
+    Wrapper to numpy.save method for arrays.
+
+    The idea would be to use this to save a processed array for later
+    use in a matplotlib figure generation scripts. See numpy.save
+    documentation for details.
+
+    Parameters
+    ----------
+    file : file or str
+        File or filename to which the data is saved.  If file is a file-
+        object, then the filename is unchanged.  If file is a string, a
+        ``.npy`` extension will be appended to the file name if it does
+        not already have one.
+    arr : array_like
+        Array data to be saved.
+    allow_pickle : bool, optional
+        Allow saving object arrays using Python pickles. Reasons for
+        disallowing pickles include security (loading pickled data can
+        execute arbitrary code) and portability (pickled objects may not
+        be loadable on different Python installations, for example if
+        the stored objects require libraries that are not available, and
+        not all pickled data is compatible between Python 2 and Python
+        3). Default: True
+    """
+    np.save(file, arr, allow_pickle=allow_pickle)
+    
+def load_array(file, allow_pickle=True):
+    """
+    Wrapper to numpy.load method for binary files.
+
+    See numpy.load documentation for more details.
+
+    Parameters
+    ----------
+    file : file or str
+        The file to read. File-like objects must support the
+    ``seek()`` and ``read()`` methods. Pickled files require that the
+    file-like object support the ``readline()`` method as well.
+    allow_pickle : bool, optional
+        Allow loading pickled object arrays stored in npy files. Reasons
+        for disallowing pickles include security, as loading pickled
+        data can execute arbitrary code. If pickles are disallowed,
+        loading object arrays will fail. Default: True
+
+    Returns
+    -------
+    result : array, tuple, dict, etc.
+        Data stored in the file. For ``.npz`` files, the returned
+        instance of NpzFile class must be closed to avoid leaking file
+        descriptors.
+    """
+    return np.load(file)
+    
+def _is_valid_file(fname, ext):
+    """
+    Detect if invalid file is being initialized by class.
+    """
+    if fname[-3:] != ext:
+        raise UnhandledFileError('{} is not a {} file'.format(fname, ext))
+
+def _bin_block(values, k, group=1):
+    """
+    Average (rows*k, cols*k, n) values over k x k pixel blocks and over
+    consecutive groups of n.
+    """
+    nx, ny, n = values.shape
+    if k > 1:
+        values = values.reshape((nx // k, k, ny // k, k, n)).mean(axis=(1, 3))
+    if group > 1:
+        values = values.reshape(values.shape[:2] + (n // group, group)).mean(axis=3)
+    return values
+
+def _read_pixel_fields(fname, offset, num_pix, pix_size, fields,
+                       data_format='>f4', chunk_bytes=_CHUNK_BYTES, out=None):
+    """
+    Gather element ranges out of every fixed size pixel record.
+
+    The file is mapped one chunk of whole pixels at a time and only the
+    requested ranges are copied out, so only the pages holding them are
+    read from disk and the mapped window stays small.
+
+    Parameters
+    ----------
+    fname : str
+        File to read.
+    offset : int
+        Byte offset of the first pixel record.
+    num_pix : int
+        Number of pixel records.
+    pix_size : int
+        Number of elements in one pixel record.
+    fields : list of tuple
+        (start, stop) element ranges within a record to extract.
+    data_format : str, optional
+        Element dtype. Default: '>f4'
+    chunk_bytes : int, optional
+        Approximate size of the mapped window in bytes.
+    out : list of numpy.ndarray, optional
+        Arrays of shape (num_pix, stop - start) to read into instead of
+        allocating new ones.
+
+    Returns
+    -------
+    list of numpy.ndarray
+        One (num_pix, stop - start) array per field, in native byte
+        order.
+    """
+    itemsize = np.dtype(data_format).itemsize
+    if out is None:
+        native = np.dtype(data_format).newbyteorder('=')
+        out = [np.empty((num_pix, stop - start), dtype=native) for start, stop in fields]
+    chunk_pix = max(1, chunk_bytes // (pix_size * itemsize))
+
+    for first in range(0, num_pix, chunk_pix):
+        count = min(chunk_pix, num_pix - first)
+        block = np.memmap(fname, dtype=data_format, mode='r',
+                          offset=offset + first * pix_size * itemsize,
+                          shape=(count, pix_size))
+        for arr, (start, stop) in zip(out, fields):
+            arr[first:first + count] = block[:, start:stop]
+        del block
+
+    return out
@@ -0,0 +1,187 @@
+### sampling
+###
+### Shared machinery of gwyscripts.symmetrize and gwyscripts.warp: bilinear
+### sampling maps of images indexed [x, y], a small thread-safe cache for
+### them, and a runner that applies a map to a volume in blocks of layers.
+###
+### The data is zero padded by two rows and columns at the high x and y
+### edges before sampling. That way the four neighbours of every sample
+### point are always valid indices, and samples that fall outside the
+### image point at the padding and contribute nothing.
+
+
+import threading
+import multiprocessing
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+
+# rough number of values per block when mapping a volume, the gathers
+# need a few temporaries of this size
+_VOLUME_BLOCK = 4 * 1024 * 1024
+
+
+def bilinear_map(sx, sy):
+    """
+    Bilinear sampling map for the sample positions of every pixel.
+
+    Parameters
+    ----------
+    sx, sy : numpy.ndarray
+        (nx, ny) x and y positions, in pixel indices, every output pixel
+        samples.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        (base, fx, fy, valid), flat over the pixels. base is the index of
+        the lower neighbour in the flat padded array, fx and fy the
+        float32 fractional offsets and valid whether the sample lies
+        inside the image.
+    """
+    nx, ny = sx.shape
+
+    # tolerance keeps samples that land on the edge up to rounding
+    valid = ((sx > -1e-6) & (sx < nx - 1 + 1e-6) &
+             (sy > -1e-6) & (sy < ny - 1 + 1e-6))
+
+    x0 = np.clip(np.floor(sx), 0, nx - 1)
+    y0 = np.clip(np.floor(sy), 0, ny - 1)
+    fx = np.clip(sx - x0, 0, 1).astype(np.float32)
+    fy = np.clip(sy - y0, 0, 1).astype(np.float32)
+
+    base = (x0 * (ny + 2) + y0).astype(np.int32)
+    base[~valid] = nx * (ny + 2) + ny
+
+    return base.ravel(), fx.ravel(), fy.ravel(), valid.ravel()
+
+
+def padded(data, shape):
+    """
+    Copy of data with the zero padding, flattened over the pixels.
+
+    Returns
+    -------
+    numpy.ndarray
+        (padded pixels,) + stack shape array, float32 for float32 input
+        and float64 otherwise.
+    """
+    nx, ny = shape
+    stack = data.shape[2:]
+    dtype = np.float32 if data.dtype == np.float32 else np.float64
+    pad = np.zeros((nx + 2, ny + 2) + stack, dtype=dtype)
+    pad[:nx, :ny] = data
+    return pad.reshape((-1,) + stack)
+
+
+def interpolate(flat, ny, base, fx, fy):
+    """
+    Bilinear interpolation of the padded data at every sample point.
+
+    Returns
+    -------
+    numpy.ndarray
+        (pixels,) + stack shape array.
+    """
+    extra = (slice(None),) + (None,) * (flat.ndim - 1)
+    fx = fx[extra]
+    fy = fy[extra]
+    step_x = ny + 2
+    low = flat[base] * (1 - fy) + flat[base + 1] * fy
+    high = flat[base + step_x] * (1 - fy) + flat[base + step_x + 1] * fy
+    return low * (1 - fx) + high * fx
+
+
+class MapCache(object):
+
+    """
+    Bounded LRU cache of sampling maps, safe to use from several threads.
+
+    Parameters
+    ----------
+    size : int
+        Number of maps kept around.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        """
+        Return the maps for key, computing them with factory() on first
+        use. Other threads are not blocked while they are computed.
+        """
+        with self._lock:
+            maps = self._maps.pop(key, None)
+            if maps is not None:
+                self._maps[key] = maps
+                return maps
+
+        maps = factory()
+
+        with self._lock:
+            self._maps[key] = maps
+            while len(self._maps) > self.size:
+                self._maps.popitem(last=False)
+
+        return maps
+
+
+def apply_volume(maps, data, threads=1, out=None):
+    """
+    Apply maps to every layer of a volume.
+
+    The layers are processed in blocks, each block as one batched call
+    of maps.apply, so the temporaries stay bounded. With threads > 1 the
+    blocks are spread over a thread pool; NumPy releases the GIL in the
+    gathers and the arithmetic.
+
+    Parameters
+    ----------
+    maps : object
+        Has apply(data, out) for (nx, ny, nz) blocks.
+    data : array_like
+        Volume indexed [x, y, z].
+    threads : int, optional
+        Number of worker threads, None for one per CPU. Default: 1
+    out : numpy.ndarray, optional
+        Array of the same shape to write the result into. May be data
+        itself.
+
+    Returns
+    -------
+    numpy.ndarray
+        Mapped volume.
+    """
+    data = np.asarray(data)
+    nx, ny, nz = data.shape
+
+    if out is None:
+        out = np.empty(data.shape, dtype=np.float32 if data.dtype == np.float32 else np.float64)
+
+    layers = max(1, _VOLUME_BLOCK // (nx * ny))
+    blocks = [slice(z, min(z + layers, nz)) for z in range(0, nz, layers)]
+
+    def run_block(block):
+        maps.apply(data[:, :, block], out=out[:, :, block])
+
+    if threads is None:
+        threads = multiprocessing.cpu_count()
+    threads = min(threads, len(blocks))
+
+    if threads > 1:
+        pool = ThreadPool(threads)
+        try:
+            pool.map(run_block, blocks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for block in blocks:
+            run_block(block)
+
+    return out
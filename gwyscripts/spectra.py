@@ -0,0 +1,266 @@
+### spectra
+###
+### Derived channels computed along the sweep axis of a whole grid: the
+### numerical dI/dV, the normalized (dI/dV)/(I/V) and Savitzky-Golay
+### smoothed spectra.
+###
+### All of them are Savitzky-Golay filters, i.e. a local polynomial least
+### squares fit evaluated (or differentiated) at every sweep point. The
+### fit is linear in the data, so it reduces to a small convolution kernel
+### in the interior and a small matrix at each end of the sweep, where
+### the polynomial of the first and last window is evaluated instead of
+### padding the data. These are computed once per (window, order,
+### derivative, spacing) and kept in a small cache. Volumes indexed
+### [x, y, sweep] are filtered in float32 one chunk of x rows at a time,
+### each chunk with one vectorized multiply-add per kernel element.
+
+
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# number of different kernels kept around
+_CACHE_SIZE = 16
+
+# rough number of bytes of data per chunk of rows
+_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+class SavitzkyGolay(object):
+
+    """
+    Savitzky-Golay filter coefficients for one window and order.
+
+    Parameters
+    ----------
+    window : int
+        Odd number of sweep points in the fit window.
+    order : int
+        Order of the fitted polynomial, smaller than window.
+    deriv : int, optional
+        Order of the derivative to return, 0 for smoothing. Default: 0
+    delta : float, optional
+        Spacing of the sweep points, the derivative is divided by
+        delta**deriv. Default: 1.0
+
+    Attributes
+    ----------
+    kernel : numpy.ndarray
+        float32 (window,) weights of the window around an interior point.
+    head : numpy.ndarray
+        float32 (window // 2, window) weights of the first window for the
+        first window // 2 points.
+    tail : numpy.ndarray
+        float32 (window // 2, window) weights of the last window for the
+        last window // 2 points.
+    """
+
+    def __init__(self, window, order, deriv=0, delta=1.0):
+        if window < 1 or window % 2 == 0:
+            raise ValueError('window must be a positive odd number, got {}'.format(window))
+        if not deriv <= order < window:
+            raise ValueError('order must be at least deriv {} and less than window {}, got {}'.format(
+                deriv, window, order))
+
+        self.window = window
+        half = window // 2
+        positions = np.arange(-half, half + 1, dtype=np.float64)
+
+        # the fitted polynomial coefficients are pinv(vander) . data, so its
+        # derivative at t is a fixed linear combination of the data
+        fit = np.linalg.pinv(np.vander(positions, order + 1, increasing=True))
+
+        def weights(t):
+            powers = [0.0 if i < deriv else
+                      math.factorial(i) / math.factorial(i - deriv) * t ** (i - deriv)
+                      for i in range(order + 1)]
+            return np.dot(powers, fit) / delta ** deriv
+
+        self.kernel = weights(0.0).astype(np.float32)
+        self.head = np.array([weights(t) for t in positions[:half]], dtype=np.float32).reshape((half, window))
+        self.tail = np.array([weights(t) for t in positions[half + 1:]], dtype=np.float32).reshape((half, window))
+
+    def apply(self, data, out=None):
+        """
+        Filter along the last axis.
+
+        Parameters
+        ----------
+        data : array_like
+            Array with at least window points along the last axis.
+        out : numpy.ndarray, optional
+            float32 array of the same shape to write into, must not be
+            data itself.
+
+        Returns
+        -------
+        numpy.ndarray
+            Filtered float32 data.
+        """
+        data = np.asarray(data, dtype=np.float32)
+        n = data.shape[-1]
+        window = self.window
+        half = window // 2
+        if n < window:
+            raise ValueError('{} sweep points are fewer than the window of {}'.format(n, window))
+        if out is None:
+            out = np.empty(data.shape, dtype=np.float32)
+
+        interior = out[..., half:n - half]
+        interior[...] = data[..., :n - 2 * half] * self.kernel[0]
+        for j in range(1, window):
+            interior += data[..., j:n - 2 * half + j] * self.kernel[j]
+
+        if half:
+            out[..., :half] = np.dot(data[..., :window], self.head.T)
+            out[..., n - half:] = np.dot(data[..., n - window:], self.tail.T)
+
+        return out
+
+
+_filter_cache = OrderedDict()
+_filter_lock = threading.Lock()
+
+
+def savitzky_golay(window, order, deriv=0, delta=1.0):
+    """
+    Return the cached SavitzkyGolay for these arguments, computing it on
+    first use. See SavitzkyGolay for the arguments.
+    """
+    key = (window, order, deriv, float(delta))
+
+    with _filter_lock:
+        sg = _filter_cache.pop(key, None)
+        if sg is None:
+            sg = SavitzkyGolay(window, order, deriv, delta)
+        _filter_cache[key] = sg
+        while len(_filter_cache) > _CACHE_SIZE:
+            _filter_cache.popitem(last=False)
+
+    return sg
+
+
+def _sweep_spacing(sweep):
+    sweep = np.asarray(sweep, dtype=np.float64)
+    if len(sweep) < 2:
+        raise ValueError('a derivative needs at least 2 sweep points')
+    steps = np.diff(sweep)
+    if not np.allclose(steps, steps[0], rtol=1e-3, atol=0):
+        raise ValueError('sweep points are not evenly spaced')
+    return steps[0]
+
+
+def _rows(data):
+    nx, ny, nz = data.shape
+    step = max(1, _CHUNK_BYTES // max(1, ny * nz * 4))
+    return [slice(x0, min(x0 + step, nx)) for x0 in range(0, nx, step)]
+
+
+def smooth(data, window=5, order=2, out=None):
+    """
+    Savitzky-Golay smoothed spectra of a volume.
+
+    Parameters
+    ----------
+    data : array_like
+        Volume indexed [x, y, sweep]. May be memory-mapped or big endian.
+    window, order
+        See SavitzkyGolay.
+    out : numpy.ndarray, optional
+        float32 array of the same shape to write the result into.
+
+    Returns
+    -------
+    numpy.ndarray
+        float32 smoothed volume.
+    """
+    sg = savitzky_golay(window, order)
+    if out is None:
+        out = np.empty(data.shape, dtype=np.float32)
+    for rows in _rows(data):
+        sg.apply(data[rows], out=out[rows])
+    return out
+
+
+def didv(data, sweep, window=3, order=2, out=None):
+    """
+    Numerical derivative of every spectrum of a volume.
+
+    The default 3 point window with a parabola is the central difference
+    in the interior and a second order one sided difference at the ends.
+    A wider window also smooths.
+
+    Parameters
+    ----------
+    data : array_like
+        Volume indexed [x, y, sweep], e.g. the current.
+    sweep : array_like
+        Evenly spaced sweep signal, e.g. the bias.
+    window, order
+        See SavitzkyGolay.
+    out : numpy.ndarray, optional
+        float32 array of the same shape to write the result into.
+
+    Returns
+    -------
+    numpy.ndarray
+        float32 derivative, in units of data per unit of sweep.
+    """
+    sg = savitzky_golay(window, order, deriv=1, delta=_sweep_spacing(sweep))
+    if out is None:
+        out = np.empty(data.shape, dtype=np.float32)
+    for rows in _rows(data):
+        sg.apply(data[rows], out=out[rows])
+    return out
+
+
+def normalized_didv(data, sweep, window=3, order=2, broadening=0.01, out=None):
+    """
+    Normalized differential conductance (dI/dV)/(I/V) of a volume.
+
+    Dividing by I/V blows up where the current vanishes, so the division
+    is regularized: (dI/dV) (I/V) / ((I/V)^2 + c^2), with c the
+    broadening times the largest |I/V| of the spectrum. Where V is 0, I/V
+    is replaced by its limit dI/dV.
+
+    Parameters
+    ----------
+    data : array_like
+        Current volume indexed [x, y, sweep].
+    sweep : array_like
+        Evenly spaced bias.
+    window, order
+        See SavitzkyGolay.
+    broadening : float, optional
+        Relative regularization c, 0 for a plain division. Default: 0.01
+    out : numpy.ndarray, optional
+        float32 array of the same shape to write the result into.
+
+    Returns
+    -------
+    numpy.ndarray
+        float32 dimensionless normalized conductance.
+    """
+    sweep = np.asarray(sweep, dtype=np.float32)
+    sg = savitzky_golay(window, order, deriv=1, delta=_sweep_spacing(sweep))
+    if out is None:
+        out = np.empty(data.shape, dtype=np.float32)
+
+    zero = sweep == 0
+    inv_sweep = np.where(zero, 0, 1 / np.where(zero, 1, sweep)).astype(np.float32)
+    for rows in _rows(data):
+        current = np.asarray(data[rows], dtype=np.float32)
+        conductance = sg.apply(current, out=out[rows])
+        ratio = current * inv_sweep
+        ratio[..., zero] = conductance[..., zero]
+
+        limit = broadening * np.abs(ratio).max(axis=-1, keepdims=True)
+        denom = ratio * ratio + limit * limit
+        with np.errstate(invalid='ignore', divide='ignore'):
+            conductance *= ratio
+            conductance /= denom
+        conductance[denom == 0] = 0
+    return out
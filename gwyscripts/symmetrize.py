@@ -0,0 +1,238 @@
+### symmetrize
+###
+### N-fold rotational (and mirror) symmetrization of NumPy arrays.
+###
+### The image is averaged with copies of itself rotated by multiples of
+### 360/N degrees, and optionally with their mirror images, using bilinear
+### interpolation. Where a rotated copy is outside the original image it
+### is left out of the average instead of being counted as zero. Arrays
+### are indexed [x, y] as in the rest of these scripts, with angles
+### measured counterclockwise from the x axis.
+###
+### Working out where every pixel samples from is the expensive part, so
+### those sampling maps are computed once per (shape, N, center, mirror)
+### and kept in a small cache. Symmetrizing another image of the same
+### size is then just a gather and an average.
+
+
+import numpy as np
+
+from gwyscripts import sampling, transfer
+
+
+# number of different sampling maps kept around
+_CACHE_SIZE = 8
+
+
+class SymmetryMaps(object):
+
+    """
+    Precomputed bilinear sampling maps for one symmetrization, see
+    gwyscripts.sampling.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        (nx, ny) of the images to symmetrize.
+    n : int
+        Order of the rotational symmetry.
+    center : tuple of float, optional
+        (x, y) rotation center in pixel indices. Defaults to the geometric
+        center ((nx - 1)/2, (ny - 1)/2), which is what gwy.DataField
+        rotations use.
+    mirror : bool, optional
+        Also average with the mirror images about the axis through the
+        center at mirror_angle. Default: False
+    mirror_angle : float, optional
+        Angle of the mirror axis from the x axis, in radians.
+
+    Attributes
+    ----------
+    maps : list of tuple
+        (base, fx, fy) for every symmetry operation except the identity.
+        base is the flat index of the lower neighbour in the padded array,
+        fx and fy the float32 fractional offsets.
+    norm : numpy.ndarray
+        float32 (nx, ny) reciprocal of the number of operations that
+        sample inside the image at every pixel.
+    """
+
+    def __init__(self, shape, n, center=None, mirror=False, mirror_angle=0.0):
+        nx, ny = shape
+        if n < 1:
+            raise ValueError('symmetry order must be at least 1, got {}'.format(n))
+        if center is None:
+            center = ((nx - 1) / 2.0, (ny - 1) / 2.0)
+
+        self.shape = (nx, ny)
+        self.maps = []
+
+        cx, cy = center
+        x, y = np.meshgrid(np.arange(nx, dtype=np.float64) - cx,
+                           np.arange(ny, dtype=np.float64) - cy, indexing='ij')
+        count = np.ones(shape, dtype=np.float32)
+
+        for matrix in _operations(n, mirror, mirror_angle)[1:]:
+            sx = matrix[0, 0] * x + matrix[0, 1] * y + cx
+            sy = matrix[1, 0] * x + matrix[1, 1] * y + cy
+            base, fx, fy, valid = sampling.bilinear_map(sx, sy)
+            count += valid.reshape(shape)
+            self.maps.append((base, fx, fy))
+
+        self.norm = 1.0 / count
+
+    def apply(self, data, out=None):
+        """
+        Symmetrize data using the precomputed maps.
+
+        Parameters
+        ----------
+        data : array_like
+            Array of shape (nx, ny) or (nx, ny, nz). A 3d array is
+            treated as a stack of nz images that all get the same
+            symmetrization.
+        out : numpy.ndarray, optional
+            Array of the same shape to write the result into. May be data
+            itself.
+
+        Returns
+        -------
+        numpy.ndarray
+            Symmetrized data, float32 for float32 input and float64
+            otherwise.
+        """
+        data = np.asarray(data)
+        if data.shape[:2] != self.shape:
+            raise ValueError('data of shape {} does not match maps for {}'.format(data.shape, self.shape))
+
+        nx, ny = self.shape
+        stack = data.shape[2:]
+        flat = sampling.padded(data, self.shape)
+
+        # the identity operation needs no interpolation
+        acc = np.array(data, dtype=flat.dtype).reshape((-1,) + stack)
+
+        extra = (slice(None),) + (None,) * len(stack)
+        for base, fx, fy in self.maps:
+            acc += sampling.interpolate(flat, ny, base, fx, fy)
+
+        acc *= self.norm.reshape(-1)[extra]
+        acc = acc.reshape(data.shape)
+
+        if out is None:
+            return acc
+        out[...] = acc
+        return out
+
+
+def _operations(n, mirror, mirror_angle):
+    """
+    Return the 2x2 matrices of the symmetry group, identity first.
+    """
+    ops = []
+    for k in range(n):
+        angle = 2 * np.pi * k / n
+        ops.append(np.array([[np.cos(angle), -np.sin(angle)],
+                             [np.sin(angle), np.cos(angle)]]))
+
+    if mirror:
+        c, s = np.cos(2 * mirror_angle), np.sin(2 * mirror_angle)
+        reflection = np.array([[c, s], [s, -c]])
+        ops += [np.dot(rotation, reflection) for rotation in ops]
+
+    return ops
+
+
+_maps_cache = sampling.MapCache(_CACHE_SIZE)
+
+
+def symmetry_maps(shape, n, center=None, mirror=False, mirror_angle=0.0):
+    """
+    Return the cached SymmetryMaps for these arguments, computing them
+    on first use. See SymmetryMaps for the arguments.
+    """
+    key = (tuple(shape), n, None if center is None else tuple(center),
+           bool(mirror), float(mirror_angle) if mirror else 0.0)
+    return _maps_cache.get(key, lambda: SymmetryMaps(shape, n, center, mirror, mirror_angle))
+
+
+def symmetrize(data, n, center=None, mirror=False, mirror_angle=0.0):
+    """
+    Average an image with its N-fold rotations (and mirror images).
+
+    Parameters
+    ----------
+    data : array_like
+        Image indexed [x, y].
+    n : int
+        Order of the rotational symmetry.
+    center, mirror, mirror_angle
+        See SymmetryMaps.
+
+    Returns
+    -------
+    numpy.ndarray
+        Symmetrized image.
+    """
+    data = np.asarray(data)
+    return symmetry_maps(data.shape[:2], n, center, mirror, mirror_angle).apply(data)
+
+
+def symmetrize_datafield(dfield, n, center=None, mirror=False, mirror_angle=0.0):
+    """
+    Symmetrize a gwy.DataField in place.
+
+    The caller is responsible for calling data_changed() on the field.
+    See symmetrize for the arguments.
+    """
+    data = transfer.datafield_view(dfield)
+    symmetry_maps(data.shape, n, center, mirror, mirror_angle).apply(data, out=data)
+    transfer.update_datafield(dfield, data)
+
+
+def symmetrize_volume(data, n, center=None, mirror=False, mirror_angle=0.0,
+                      threads=1, out=None):
+    """
+    Apply the same symmetrization to every layer of a volume.
+
+    All layers share one set of sampling maps. They are processed in
+    blocks of layers, each block as one batched gather, so the
+    temporaries stay bounded. With threads > 1 the blocks are spread
+    over a thread pool; NumPy releases the GIL in the gathers and the
+    arithmetic.
+
+    Parameters
+    ----------
+    data : array_like
+        Volume indexed [x, y, z], symmetrized in the x-y plane.
+    n, center, mirror, mirror_angle
+        See SymmetryMaps.
+    threads : int, optional
+        Number of worker threads, None for one per CPU. Default: 1
+    out : numpy.ndarray, optional
+        Array of the same shape to write the result into. May be data
+        itself.
+
+    Returns
+    -------
+    numpy.ndarray
+        Symmetrized volume.
+    """
+    data = np.asarray(data)
+    maps = symmetry_maps(data.shape[:2], n, center, mirror, mirror_angle)
+    return sampling.apply_volume(maps, data, threads, out)
+
+
+def symmetrize_brick(brick, n, center=None, mirror=False, mirror_angle=0.0,
+                     threads=None):
+    """
+    Symmetrize every layer of a gwy.Brick in place.
+
+    Works on the Brick data directly where pygwy allows it, see
+    gwyscripts.transfer.brick_view. The caller is responsible for
+    calling data_changed() on the brick. See symmetrize_volume for the
+    arguments.
+    """
+    data = transfer.brick_view(brick)
+    symmetrize_volume(data, n, center, mirror, mirror_angle, threads, out=data)
+    transfer.update_brick(brick, data)
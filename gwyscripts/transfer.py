@@ -0,0 +1,312 @@
+### transfer
+###
+### Bulk movement of NumPy arrays into and out of Gwyddion DataField and
+### Brick objects.
+###
+### Arrays in these scripts are indexed [x, y] and [x, y, z], the same way
+### set_val(x, y) and set_val(x, y, z) are called. Gwyddion stores its data
+### row-major with x running fastest, so the array has to be transposed
+### before it is copied into the object buffer. Depending on the Gwyddion
+### version pygwy offers different ways of doing a bulk copy, each one is
+### tried in turn and the per-value set_val loop is only the last resort.
+### Where the object buffer can be wrapped as an array the data is cast
+### and transposed straight into it, no float64 copy of the whole array
+### is made on the way.
+
+
+import numpy as np
+
+
+# set_data and get_data need a Python list of every value, about 30 bytes
+# each. Larger objects are copied with set_val and get_val instead, slow
+# but without running 32 bit Gwyddion out of memory.
+_SET_DATA_LIMIT = 4 * 1024 * 1024
+
+
+def array_to_datafield(arr, dfield):
+    """
+    Copy a 2d array into a gwy.DataField in one bulk operation.
+
+    Parameters
+    ----------
+    arr : array_like
+        Data indexed as arr[x, y] with shape (xres, yres) of the field.
+        Any float dtype or byte order is accepted.
+    dfield : gwy.DataField
+        Destination field, must already have the right resolution.
+
+    Returns
+    -------
+    str
+        Name of the transfer method that was used, 'view', 'set_data'
+        or 'set_val'.
+    """
+    arr = np.asarray(arr)
+    shape = (dfield.get_xres(), dfield.get_yres())
+    if arr.shape != shape:
+        raise ValueError('array of shape {} does not fit a {} x {} DataField'.format(arr.shape, *shape))
+
+    return _transfer(arr, dfield, 'data_field_data_as_array')
+
+
+def array_to_brick(arr, brick):
+    """
+    Copy a 3d array into a gwy.Brick in one bulk operation.
+
+    Parameters
+    ----------
+    arr : array_like
+        Data indexed as arr[x, y, z] with shape (xres, yres, zres) of the
+        brick. Any float dtype or byte order is accepted.
+    brick : gwy.Brick
+        Destination brick, must already have the right resolution.
+
+    Returns
+    -------
+    str
+        Name of the transfer method that was used, 'view', 'set_data'
+        or 'set_val'.
+    """
+    arr = np.asarray(arr)
+    shape = (brick.get_xres(), brick.get_yres(), brick.get_zres())
+    if arr.shape != shape:
+        raise ValueError('array of shape {} does not fit a {} x {} x {} Brick'.format(arr.shape, *shape))
+
+    return _transfer(arr, brick, 'brick_data_as_array')
+
+
+def datafield_to_array(dfield):
+    """
+    Copy a gwy.DataField into a new 2d array in one bulk operation.
+
+    Parameters
+    ----------
+    dfield : gwy.DataField
+        Source field.
+
+    Returns
+    -------
+    numpy.ndarray
+        float64 data indexed as arr[x, y].
+    """
+    xres, yres = dfield.get_xres(), dfield.get_yres()
+    buf = _fetch(dfield, 'data_field_data_as_array', xres*yres)
+    return buf.reshape((yres, xres)).transpose()
+
+
+def brick_to_array(brick):
+    """
+    Copy a gwy.Brick into a new 3d array in one bulk operation.
+
+    Parameters
+    ----------
+    brick : gwy.Brick
+        Source brick.
+
+    Returns
+    -------
+    numpy.ndarray
+        float64 data indexed as arr[x, y, z].
+    """
+    xres, yres, zres = brick.get_xres(), brick.get_yres(), brick.get_zres()
+    buf = _fetch(brick, 'brick_data_as_array', xres*yres*zres)
+    return buf.reshape((zres, yres, xres)).transpose()
+
+
+def datafield_view(dfield):
+    """
+    Return the data of a gwy.DataField without copying it if possible.
+
+    Meant for reading the data in chunks, e.g. to stream it to a file,
+    or for changing it in place followed by update_datafield. With the
+    gwyutils helpers the result shares memory with the field, otherwise
+    it is a copy as in datafield_to_array.
+
+    Returns
+    -------
+    numpy.ndarray
+        float64 data indexed as arr[x, y].
+    """
+    xres, yres = dfield.get_xres(), dfield.get_yres()
+    buf = _buffer_view(dfield, 'data_field_data_as_array', xres*yres)
+    if buf is None:
+        buf = _fetch(dfield, 'data_field_data_as_array', xres*yres)
+    return buf.reshape((yres, xres)).transpose()
+
+
+def brick_view(brick):
+    """
+    Return the data of a gwy.Brick without copying it if possible.
+
+    See datafield_view.
+
+    Returns
+    -------
+    numpy.ndarray
+        float64 data indexed as arr[x, y, z].
+    """
+    xres, yres, zres = brick.get_xres(), brick.get_yres(), brick.get_zres()
+    buf = _buffer_view(brick, 'brick_data_as_array', xres*yres*zres)
+    if buf is None:
+        buf = _fetch(brick, 'brick_data_as_array', xres*yres*zres)
+    return buf.reshape((zres, yres, xres)).transpose()
+
+
+def update_datafield(dfield, arr):
+    """
+    Store arr, a changed result of datafield_view, in the gwy.DataField.
+
+    A view already shares memory with the field and only needs the
+    field's caches invalidated, a copy is transferred back.
+
+    Returns
+    -------
+    str
+        Name of the transfer method that was used, see
+        array_to_datafield.
+    """
+    return _update(dfield, arr, 'data_field_data_as_array')
+
+
+def update_brick(brick, arr):
+    """
+    Store arr, a changed result of brick_view, in the gwy.Brick. See
+    update_datafield.
+    """
+    return _update(brick, arr, 'brick_data_as_array')
+
+
+def _update(obj, arr, view_func):
+    view = _buffer_view(obj, view_func, arr.size)
+    if view is not None and np.may_share_memory(view, arr):
+        if hasattr(obj, 'invalidate'):
+            obj.invalidate()
+        return 'view'
+    return _transfer(arr, obj, view_func)
+
+
+def _gwy_buffer(arr):
+    """
+    Return arr as the flat, native double buffer Gwyddion expects.
+
+    Reversing the axes puts x as the fastest running index, the copy into
+    a contiguous float64 array does the byte swap of big endian data in
+    the same pass.
+    """
+    return np.ascontiguousarray(arr.transpose(), dtype=np.float64).ravel()
+
+
+def _transfer(arr, obj, view_func):
+    """
+    Write arr, indexed [x, y(, z)], into obj using the fastest available
+    method.
+    """
+    view = _buffer_view(obj, view_func, arr.size)
+    if view is not None:
+        # cast, byte swap and transpose in one pass into the buffer
+        view.reshape(arr.shape[::-1])[...] = arr.transpose()
+        if hasattr(obj, 'invalidate'):
+            obj.invalidate()
+        return 'view'
+
+    if hasattr(obj, 'set_data') and arr.size <= _SET_DATA_LIMIT:
+        try:
+            obj.set_data(_gwy_buffer(arr).tolist())
+            return 'set_data'
+        except (TypeError, ValueError, NotImplementedError):
+            pass
+
+    _set_val_fallback(arr, obj)
+    return 'set_val'
+
+
+def _fetch(obj, view_func, size):
+    """
+    Return a flat copy of the object buffer using the fastest available
+    method.
+    """
+    view = _buffer_view(obj, view_func, size)
+    if view is not None:
+        return view.copy()
+
+    if hasattr(obj, 'get_data') and size <= _SET_DATA_LIMIT:
+        try:
+            buf = np.array(obj.get_data(), dtype=np.float64)
+            if buf.size == size:
+                return buf.ravel()
+        except (TypeError, ValueError, NotImplementedError):
+            pass
+
+    return _get_val_fallback(obj, size)
+
+
+def _buffer_view(obj, view_func, size):
+    """
+    Return a flat writable array sharing memory with obj, or None.
+
+    Older pygwy installations ship gwyutils with helpers that wrap the
+    object data as a NumPy array. The wrapped array is only used when it
+    covers the whole buffer and is contiguous, otherwise a write to it
+    could silently end up in a temporary copy.
+    """
+    try:
+        import gwyutils
+    except ImportError:
+        return None
+
+    func = getattr(gwyutils, view_func, None)
+    if func is None:
+        return None
+
+    try:
+        view = np.asarray(func(obj))
+    except Exception:
+        return None
+
+    if view.size != size or view.dtype != np.float64 or not view.flags.writeable:
+        return None
+
+    if view.flags.c_contiguous:
+        return view.reshape(-1)
+    elif view.flags.f_contiguous:
+        return view.reshape(-1, order='F')
+
+    return None
+
+
+def _set_val_fallback(arr, obj):
+    """
+    Per-value copy for pygwy builds without any bulk access.
+    """
+    if arr.ndim == 3:
+        xres, yres, zres = arr.shape
+        for x in range(xres):
+            for y in range(yres):
+                for z in range(zres):
+                    obj.set_val(x, y, z, float(arr[x, y, z]))
+    else:
+        xres, yres = arr.shape
+        for x in range(xres):
+            for y in range(yres):
+                obj.set_val(x, y, float(arr[x, y]))
+
+
+def _get_val_fallback(obj, size):
+    """
+    Per-value copy out of pygwy builds without any bulk access.
+    """
+    buf = np.empty(size)
+    xres, yres = obj.get_xres(), obj.get_yres()
+    if hasattr(obj, 'get_zres'):
+        zres = obj.get_zres()
+        vol = buf.reshape((zres, yres, xres))
+        for x in range(xres):
+            for y in range(yres):
+                for z in range(zres):
+                    vol[z, y, x] = obj.get_val(x, y, z)
+    else:
+        field = buf.reshape((yres, xres))
+        for x in range(xres):
+            for y in range(yres):
+                field[y, x] = obj.get_val(x, y)
+    return buf
@@ -0,0 +1,222 @@
+### warp
+###
+### Affine and displacement field warps of NumPy images and volumes, e.g.
+### to correct thermal drift or piezo distortion of a grid.
+###
+### Every output pixel samples the input at a transformed position using
+### bilinear interpolation. Samples that fall outside the input get a fill
+### value. Arrays are indexed [x, y] (or [x, y, z], warped in the x-y
+### plane) as in the rest of these scripts, positions are in pixels.
+###
+### The sampling maps are computed once per transform and shape and kept
+### in a small cache, so that warping all layers of a volume is a batched
+### gather and an average per block of layers, spread over a few threads.
+### The machinery is shared with gwyscripts.symmetrize, see
+### gwyscripts.sampling.
+
+
+import numpy as np
+
+from gwyscripts import sampling, transfer
+
+
+# number of different sampling maps kept around
+_CACHE_SIZE = 8
+
+
+class WarpMaps(object):
+
+    """
+    Precomputed bilinear sampling map for one warp.
+
+    The output pixel at p samples the input at
+
+        matrix . (p - center) + center + offset + displacement[p]
+
+    See gwyscripts.sampling for how the data is sampled.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        (nx, ny) of the images to warp.
+    matrix : array_like, optional
+        2x2 linear part of the transform. Default: identity
+    offset : tuple of float, optional
+        (x, y) shift in pixels. Default: (0, 0)
+    center : tuple of float, optional
+        (x, y) fixed point of the linear part in pixel indices. Defaults
+        to the geometric center ((nx - 1)/2, (ny - 1)/2).
+    displacement : array_like, optional
+        (nx, ny, 2) additional x and y shift of every pixel, e.g. a drift
+        field.
+    fill : float, optional
+        Value of output pixels that sample outside the input. Default: 0.0
+
+    Attributes
+    ----------
+    base : numpy.ndarray
+        Flat index of the lower neighbour in the padded array.
+    fx, fy : numpy.ndarray
+        float32 fractional offsets of the sample points.
+    outside : numpy.ndarray
+        Flat indices of the output pixels that sample outside the input.
+    """
+
+    def __init__(self, shape, matrix=None, offset=None, center=None,
+                 displacement=None, fill=0.0):
+        nx, ny = shape
+        matrix = np.eye(2) if matrix is None else np.asarray(matrix, dtype=np.float64)
+        if matrix.shape != (2, 2):
+            raise ValueError('matrix must be 2x2, got shape {}'.format(matrix.shape))
+        tx, ty = (0.0, 0.0) if offset is None else offset
+        cx, cy = ((nx - 1) / 2.0, (ny - 1) / 2.0) if center is None else center
+
+        self.shape = (nx, ny)
+        self.fill = fill
+
+        x, y = np.meshgrid(np.arange(nx, dtype=np.float64) - cx,
+                           np.arange(ny, dtype=np.float64) - cy, indexing='ij')
+        sx = matrix[0, 0] * x + matrix[0, 1] * y + cx + tx
+        sy = matrix[1, 0] * x + matrix[1, 1] * y + cy + ty
+        if displacement is not None:
+            displacement = np.asarray(displacement, dtype=np.float64)
+            if displacement.shape != (nx, ny, 2):
+                raise ValueError('displacement of shape {} does not fit {} x {} images'.format(
+                    displacement.shape, nx, ny))
+            sx += displacement[:, :, 0]
+            sy += displacement[:, :, 1]
+
+        self.base, self.fx, self.fy, valid = sampling.bilinear_map(sx, sy)
+        self.outside = np.flatnonzero(~valid)
+
+    def apply(self, data, out=None):
+        """
+        Warp data using the precomputed map.
+
+        Parameters
+        ----------
+        data : array_like
+            Array of shape (nx, ny) or (nx, ny, nz). A 3d array is
+            treated as a stack of nz images that all get the same warp.
+        out : numpy.ndarray, optional
+            Array of the same shape to write the result into. May be data
+            itself.
+
+        Returns
+        -------
+        numpy.ndarray
+            Warped data, float32 for float32 input and float64 otherwise.
+        """
+        data = np.asarray(data)
+        if data.shape[:2] != self.shape:
+            raise ValueError('data of shape {} does not match maps for {}'.format(data.shape, self.shape))
+
+        flat = sampling.padded(data, self.shape)
+        acc = sampling.interpolate(flat, self.shape[1], self.base, self.fx, self.fy)
+        acc[self.outside] = self.fill
+        acc = acc.reshape(data.shape)
+
+        if out is None:
+            return acc
+        out[...] = acc
+        return out
+
+
+_maps_cache = sampling.MapCache(_CACHE_SIZE)
+
+
+def warp_maps(shape, matrix=None, offset=None, center=None, fill=0.0):
+    """
+    Return the cached WarpMaps of an affine warp, computing them on first
+    use. See WarpMaps for the arguments. Warps with a displacement field
+    are not cached, build a WarpMaps for those.
+    """
+    matrix = np.eye(2) if matrix is None else np.asarray(matrix, dtype=np.float64)
+    key = (tuple(shape), tuple(matrix.ravel()), None if offset is None else tuple(offset),
+           None if center is None else tuple(center), float(fill))
+    return _maps_cache.get(key, lambda: WarpMaps(shape, matrix, offset, center, fill=fill))
+
+
+def _maps_for(shape, matrix, offset, center, displacement, fill):
+    if displacement is None:
+        return warp_maps(shape, matrix, offset, center, fill)
+    return WarpMaps(shape, matrix, offset, center, displacement, fill)
+
+
+def warp(data, matrix=None, offset=None, center=None, displacement=None, fill=0.0):
+    """
+    Warp an image.
+
+    Parameters
+    ----------
+    data : array_like
+        Image indexed [x, y].
+    matrix, offset, center, displacement, fill
+        See WarpMaps.
+
+    Returns
+    -------
+    numpy.ndarray
+        Warped image.
+    """
+    data = np.asarray(data)
+    return _maps_for(data.shape[:2], matrix, offset, center, displacement, fill).apply(data)
+
+
+def warp_datafield(dfield, matrix=None, offset=None, center=None, displacement=None, fill=0.0):
+    """
+    Warp a gwy.DataField in place.
+
+    The caller is responsible for calling data_changed() on the field.
+    See warp for the arguments.
+    """
+    data = transfer.datafield_view(dfield)
+    _maps_for(data.shape, matrix, offset, center, displacement, fill).apply(data, out=data)
+    transfer.update_datafield(dfield, data)
+
+
+def warp_volume(data, matrix=None, offset=None, center=None, displacement=None,
+                fill=0.0, threads=1, out=None):
+    """
+    Apply the same warp to every layer of a volume.
+
+    All layers share one sampling map. They are processed in blocks of
+    layers, each block as one batched gather, so the temporaries stay
+    bounded. With threads > 1 the blocks are spread over a thread pool;
+    NumPy releases the GIL in the gathers and the arithmetic.
+
+    Parameters
+    ----------
+    data : array_like
+        Volume indexed [x, y, z], warped in the x-y plane.
+    matrix, offset, center, displacement, fill
+        See WarpMaps.
+    threads : int, optional
+        Number of worker threads, None for one per CPU. Default: 1
+    out : numpy.ndarray, optional
+        Array of the same shape to write the result into. May be data
+        itself.
+
+    Returns
+    -------
+    numpy.ndarray
+        Warped volume.
+    """
+    data = np.asarray(data)
+    maps = _maps_for(data.shape[:2], matrix, offset, center, displacement, fill)
+    return sampling.apply_volume(maps, data, threads, out)
+
+
+def warp_brick(brick, matrix=None, offset=None, center=None, displacement=None,
+               fill=0.0, threads=None):
+    """
+    Warp every layer of a gwy.Brick in place.
+
+    Works on the Brick data directly where pygwy allows it, see
+    gwyscripts.transfer.brick_view. The caller is responsible for
+    calling data_changed() on the brick. See warp_volume for the
+    arguments.
+    """
+    data = transfer.brick_view(brick)
+    warp_volume(data, matrix, offset, center, displacement, fill, threads, out=data)
+    transfer.update_brick(brick, data)
@@ -0,0 +1,47 @@
+### The Brick_Warp_Affine plugin with the stand-in gwy objects of
+### gwyscripts.benchmark.
+
+import unittest
+
+import numpy as np
+
+from gwyscripts import benchmark, warp
+
+
+class BrickWarpAffineTest(unittest.TestCase):
+
+    def setUp(self):
+        gwy = benchmark.stand_in_gwy()
+        self.settings = gwy.Container()
+        self.brick = gwy.Brick(6, 5, 3, 1.0, 1.0, 1.0)
+        self.brick.data[:] = np.random.RandomState(0).standard_normal(self.brick.data.size)
+        gwy.APP_BRICK = 'brick'
+        gwy.gwy_app_settings_get = lambda: self.settings
+        gwy.gwy_app_data_browser_get_current = lambda kind: self.brick
+        self.plugin = benchmark.import_plugin('Brick_Warp_Affine', gwy)
+        self.messages = []
+        self.plugin.show_message = self.messages.append
+
+    def volume(self):
+        return self.brick.data.reshape((3, 5, 6)).transpose()
+
+    def test_no_transform(self):
+        before = self.brick.data.copy()
+        self.assertFalse(self.plugin.has_transform())
+        self.plugin.run()
+        self.assertEqual(len(self.messages), 1)
+        self.assertIn('set_transform', self.messages[0])
+        np.testing.assert_array_equal(self.brick.data, before)
+
+    def test_run(self):
+        expected = warp.warp_volume(self.volume().copy(), offset=(1, -2))
+        self.plugin.set_transform([[1, 0], [0, 1]], (1, -2))
+        self.assertTrue(self.plugin.has_transform())
+        self.assertEqual(self.plugin.get_transform(), ([[1.0, 0.0], [0.0, 1.0]], (1.0, -2.0)))
+        self.plugin.run()
+        self.assertEqual(self.messages, [])
+        np.testing.assert_allclose(self.volume(), expected, atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+### Threaded decoding of big endian float32 payloads, and the decoded
+### and memory-mapped reads of a grid giving the same signals.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from gwyscripts import benchmark, decode, nanonis
+
+
+class DecodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.dir, 'payload.bin')
+        self.offset = 13
+        self.values = np.random.RandomState(0).standard_normal(1001).astype('>f4')
+        with open(self.fname, 'wb') as f:
+            f.write(b'x' * self.offset)
+            self.values.tofile(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def expected(self, count):
+        with open(self.fname, 'rb') as f:
+            f.seek(self.offset)
+            return np.fromfile(f, dtype='>f4', count=count)
+
+    def test_chunks(self):
+        # chunks that divide the payload, leave a short last chunk, hold a
+        # single value or all of it
+        for count in (1001, 1000, 7, 1):
+            for chunk_bytes in (4, 40, 4 * 7, 4 * 333, 4 * 2000):
+                for threads in (1, 3):
+                    out = decode.read_float32(self.fname, self.offset, count,
+                                              chunk_bytes=chunk_bytes, threads=threads)
+                    self.assertEqual(out.dtype, np.float32)
+                    self.assertTrue(out.dtype.isnative)
+                    np.testing.assert_array_equal(out, self.expected(count))
+
+    def test_out(self):
+        out = np.empty(1001, dtype=np.float32)
+        decode.read_float32(self.fname, self.offset, 1001, out=out, chunk_bytes=64)
+        np.testing.assert_array_equal(out, self.values)
+        self.assertRaises(ValueError, decode.read_float32, self.fname, self.offset, 1001,
+                          out=np.empty(1001))
+
+    def test_truncated(self):
+        for threads in (1, 3):
+            with self.assertRaises(ValueError) as raised:
+                decode.read_float32(self.fname, self.offset, 1002, chunk_bytes=40, threads=threads)
+            self.assertIn('expected 1002 values but found 1001', str(raised.exception))
+
+    def test_grid_paths(self):
+        fname = os.path.join(self.dir, 'grid.3ds')
+        benchmark.write_grid(fname, 7, 5, 11, 3)
+        mapped = nanonis.Grid(fname, mmap=True)
+        decoded = nanonis.Grid(fname)
+        subset = nanonis.Grid(fname, channels=['Channel 2 (A)'], sweep_range=(2, 9))
+        self.assertEqual(sorted(mapped.signals), sorted(decoded.signals))
+        for name in mapped.signals:
+            np.testing.assert_array_equal(decoded.signals[name], mapped.signals[name])
+            if decoded.signals[name].dtype.kind == 'f':
+                self.assertTrue(decoded.signals[name].dtype.isnative)
+        np.testing.assert_array_equal(subset.signals['Channel 2 (A)'],
+                                      mapped.signals['Channel 2 (A)'][:, :, 2:9])
+        np.testing.assert_array_equal(subset.signals['params'], mapped.signals['params'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+### Gap maps of synthetic spectra with known coherence peaks.
+
+import unittest
+
+import numpy as np
+
+from gwyscripts import features
+
+
+class GapMapTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        nx, ny = 6, 4
+        self.sweep = np.linspace(-1, 1, 41)
+        self.gap = rng.uniform(0.3, 0.6, (nx, ny))
+        self.positive = rng.uniform(1.5, 2.5, (nx, ny))
+        self.negative = rng.uniform(1.5, 2.5, (nx, ny))
+
+        # a parabola on either side of zero bias with its vertex on the
+        # peak, so the parabolic refinement is exact
+        bias = self.sweep[None, None, :]
+        gap = self.gap[:, :, None]
+        height = np.where(bias > 0, self.positive[:, :, None], self.negative[:, :, None])
+        self.data = (height - 4 * (np.abs(bias) - gap) ** 2).astype(np.float32)
+        self.zero_bias = self.negative - 4 * self.gap ** 2
+
+    def check(self, maps):
+        np.testing.assert_allclose(maps['gap'], self.gap, atol=1e-4)
+        np.testing.assert_allclose(maps['positive_peak'], self.gap, atol=1e-4)
+        np.testing.assert_allclose(maps['negative_peak'], -self.gap, atol=1e-4)
+        np.testing.assert_allclose(maps['positive_height'], self.positive, rtol=1e-5)
+        np.testing.assert_allclose(maps['negative_height'], self.negative, rtol=1e-5)
+        np.testing.assert_allclose(maps['zero_bias'], self.zero_bias, rtol=1e-5)
+
+    def test_gap(self):
+        # also one row of spectra per chunk
+        for chunk_bytes in (4 * 41 * 4, 1 << 24):
+            self.check(features.gap_map(self.data, self.sweep, window=(0.1, 1), chunk_bytes=chunk_bytes))
+
+    def test_decreasing(self):
+        maps = features.gap_map(self.data[:, :, ::-1].astype('>f4'), self.sweep[::-1], window=(1, 0.1))
+        self.check(maps)
+
+    def test_symmetric(self):
+        # the averaged peaks sit in the same place, at the mean height
+        maps = features.gap_map(self.data, self.sweep, symmetric=True)
+        self.positive = self.negative = 0.5 * (self.positive + self.negative)
+        self.check(maps)
+
+    def test_window(self):
+        # a window below the peaks finds its upper edge, refined by at most
+        # half a sweep step with the rising neighbour outside the window
+        maps = features.gap_map(self.data, self.sweep, window=(0.05, 0.25))
+        self.assertTrue(((maps['positive_peak'] >= 0.25) & (maps['positive_peak'] <= 0.275)).all())
+        self.assertTrue(((maps['negative_peak'] <= -0.25) & (maps['negative_peak'] >= -0.275)).all())
+
+        maps = features.gap_map(self.data, self.sweep + 2)
+        self.assertTrue(np.isnan(maps['zero_bias']).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+### Batched Fourier magnitudes of volume layers against numpy.fft.fft2 of
+### every layer.
+
+import unittest
+
+import numpy as np
+
+from gwyscripts import fourier
+
+
+class FourierTest(unittest.TestCase):
+
+    def setUp(self):
+        self.block = fourier._FFT_BLOCK
+
+    def tearDown(self):
+        fourier._FFT_BLOCK = self.block
+
+    def expected(self, data, window=None, power=False, remove_mean=False):
+        out = np.empty(data.shape)
+        win = fourier.window_2d(data.shape[:2], window).astype(np.float64)
+        for z in range(data.shape[2]):
+            layer = data[:, :, z].astype(np.float64)
+            if remove_mean:
+                layer = layer - layer.mean()
+            spec = np.abs(np.fft.fft2(layer * win))
+            out[:, :, z] = np.fft.fftshift(spec ** 2 if power else spec)
+        return out
+
+    def check(self, data, **kwargs):
+        got = fourier.power_spectrum_stack(data, **kwargs)
+        expected = self.expected(data, **kwargs)
+        np.testing.assert_allclose(got, expected, rtol=1e-4, atol=1e-4 * expected.max())
+
+    def test_shapes(self):
+        # odd and even sizes along both axes, the mirrored half differs
+        rng = np.random.RandomState(0)
+        for shape in ((8, 6, 3), (7, 5, 3), (8, 5, 2), (7, 6, 2)):
+            self.check(rng.standard_normal(shape).astype(np.float32))
+
+    def test_blocks(self):
+        # one layer per block, big endian input
+        fourier._FFT_BLOCK = 1
+        data = np.random.RandomState(1).standard_normal((7, 6, 5)).astype('>f4')
+        self.check(data, window='hann', remove_mean=True)
+        self.check(data, power=True)
+
+    def test_in_place(self):
+        data = np.random.RandomState(2).standard_normal((6, 7, 4)).astype(np.float32)
+        expected = self.expected(data, window='blackman')
+        out = fourier.power_spectrum_stack(data, window='blackman', out=data)
+        self.assertIs(out, data)
+        np.testing.assert_allclose(data, expected, rtol=1e-4, atol=1e-4 * expected.max())
+
+
+if __name__ == '__main__':
+    unittest.main()
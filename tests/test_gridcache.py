@@ -0,0 +1,76 @@
+### Reopening grids from the on-disk cache, and the cache noticing when
+### the source file changes.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from gwyscripts import benchmark, gridcache, nanonis
+
+
+class GridCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved = os.environ.get('GWYSCRIPTS_CACHE')
+        os.environ['GWYSCRIPTS_CACHE'] = os.path.join(self.dir, 'cache')
+        self.fname = os.path.join(self.dir, 'grid.3ds')
+        self.write(nx=7, seed=0, mtime=1000000000)
+
+    def tearDown(self):
+        if self.saved is None:
+            os.environ.pop('GWYSCRIPTS_CACHE', None)
+        else:
+            os.environ['GWYSCRIPTS_CACHE'] = self.saved
+        shutil.rmtree(self.dir)
+
+    def write(self, nx, seed, mtime):
+        benchmark.write_grid(self.fname, nx, 5, 11, 2, seed=seed)
+        os.utime(self.fname, (mtime, mtime))
+
+    def check(self, channels=None):
+        cached = nanonis.Grid(self.fname, cache=True, channels=channels)
+        expected = nanonis.Grid(self.fname, channels=channels)
+        self.assertEqual(sorted(cached.signals), sorted(expected.signals))
+        for name in expected.signals:
+            np.testing.assert_array_equal(cached.signals[name], expected.signals[name])
+        return cached
+
+    def entry(self):
+        return gridcache.CacheEntry(self.fname)
+
+    def test_reopen(self):
+        self.check(channels=['Channel 1 (A)'])
+        self.assertFalse(self.entry().has('channel/Channel 0 (A)'))
+        self.check()
+        self.assertTrue(self.entry().has('channel/Channel 0 (A)'))
+        self.check()
+
+    def test_rewritten(self):
+        self.check()
+        # same size, new contents and mtime
+        self.write(nx=7, seed=1, mtime=1000000100)
+        self.assertFalse(self.entry().has('params'))
+        self.check()
+
+    def test_resized(self):
+        self.check()
+        # same mtime, another size
+        self.write(nx=8, seed=0, mtime=1000000000)
+        self.assertFalse(self.entry().has('params'))
+        self.check()
+
+    def test_touched(self):
+        self.check()
+        os.utime(self.fname, (1000000200, 1000000200))
+        entry = self.entry()
+        self.assertTrue(entry.has('channel/Channel 0 (A)'))
+        self.assertEqual(entry.index['mtime'], os.stat(self.fname).st_mtime)
+        self.check()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+### Single pass statistics against NumPy on the whole array, with the
+### volume read in many small chunks.
+
+import unittest
+
+import numpy as np
+
+from gwyscripts import gridstats
+
+
+class GridStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        # values far from zero and growing along x, so the histograms
+        # have to grow their range chunk by chunk
+        self.volume = 5.0 + rng.standard_normal((40, 9, 3)) * np.linspace(1, 20, 40)[:, None, None]
+
+    def statistics(self, data):
+        # a few rows per chunk
+        return gridstats.volume_statistics(data, bins=64, chunk_bytes=3 * data.shape[1] * 8 * 3)
+
+    def check(self, stats, data, layers=None):
+        for layer in range(data.shape[2]) if layers is None else layers:
+            values = data[:, :, layer]
+            values = values[np.isfinite(values)]
+            self.assertEqual(stats['count'][layer], values.size)
+            self.assertEqual(stats['hist'][layer].sum(), values.size)
+            self.assertEqual(stats['min'][layer], values.min())
+            self.assertEqual(stats['max'][layer], values.max())
+            np.testing.assert_allclose(stats['mean'][layer], values.mean(), rtol=1e-12)
+            np.testing.assert_allclose(stats['std'][layer], values.std(), rtol=1e-12, atol=1e-12)
+
+        values = data[np.isfinite(data)]
+        self.assertEqual(stats['total_count'], values.size)
+        self.assertEqual(stats['total_nonfinite'], data.size - values.size)
+        self.assertEqual(stats['total_min'], values.min())
+        self.assertEqual(stats['total_max'], values.max())
+        np.testing.assert_allclose(stats['total_mean'], values.mean(), rtol=1e-12)
+        np.testing.assert_allclose(stats['total_std'], values.std(), rtol=1e-12)
+
+    def test_chunked(self):
+        stats = self.statistics(self.volume)
+        self.check(stats, self.volume)
+
+        # the quantiles are read off the histogram, good to a bin or two
+        edges = stats['total_hist_edges']
+        width = edges[1] - edges[0]
+        low, high = gridstats.colour_range(stats)
+        self.assertAlmostEqual(low, np.percentile(self.volume, 1), delta=2 * width)
+        self.assertAlmostEqual(high, np.percentile(self.volume, 99), delta=2 * width)
+
+        width = stats['hist_edges'][1, 1] - stats['hist_edges'][1, 0]
+        low, high = gridstats.colour_range(stats, 0.1, 0.9, layer=1)
+        self.assertAlmostEqual(low, np.percentile(self.volume[:, :, 1], 10), delta=2 * width)
+        self.assertAlmostEqual(high, np.percentile(self.volume[:, :, 1], 90), delta=2 * width)
+
+    def test_nonfinite(self):
+        data = self.volume.copy()
+        data[3:7, :, 0] = np.nan
+        data[20, 4, 1] = np.inf
+        data[:, :, 2] = np.nan
+        stats = self.statistics(data)
+        self.check(stats, data, layers=(0, 1))
+        self.assertEqual(list(stats['nonfinite']), [36, 1, data.shape[0] * data.shape[1]])
+        self.assertEqual(stats['count'][2], 0)
+        self.assertTrue(np.isnan(stats['mean'][2]))
+        self.assertTrue(np.isnan(gridstats.colour_range(stats, layer=2)).all())
+
+    def test_constant(self):
+        data = np.full((30, 4, 2), 2.5)
+        stats = self.statistics(data)
+        self.check(stats, data)
+        self.assertEqual(stats['std'][0], 0.0)
+        low, high = gridstats.colour_range(stats)
+        self.assertAlmostEqual(low, 2.5, delta=1e-5)
+        self.assertAlmostEqual(high, 2.5, delta=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
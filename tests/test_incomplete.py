@@ -0,0 +1,79 @@
+### Incomplete grids, still being written by Nanonis, refreshed as the
+### file grows.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from gwyscripts import benchmark, nanonis
+
+
+class IncompleteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        source = os.path.join(self.dir, 'full.3ds')
+        benchmark.write_grid(source, 7, 5, 11, 2)
+        self.full = nanonis.Grid(source)
+        with open(source, 'rb') as f:
+            self.payload = f.read()
+        self.pix_bytes = 4 * (self.full.header['num_parameters'] + 11 * 2)
+        self.fname = os.path.join(self.dir, 'growing.3ds')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, pixels, extra=0):
+        # whole pixels plus a few bytes of the next one
+        with open(self.fname, 'wb') as f:
+            f.write(self.payload[:self.full.byte_offset + pixels * self.pix_bytes + extra])
+
+    def check(self, grid, pixels):
+        self.assertEqual(grid.pixels_read, pixels)
+        for name in ('params', 'Channel 0 (A)', 'Channel 1 (A)'):
+            # the file holds the pixels in the order of the flattened signal
+            got = grid.signals[name].reshape((-1,) + grid.signals[name].shape[2:])
+            expected = self.full.signals[name].reshape(got.shape)
+            np.testing.assert_array_equal(got[:pixels], expected[:pixels])
+            self.assertTrue(np.isnan(got[pixels:]).all())
+
+    def test_from_empty(self):
+        self.write(0)
+        grid = nanonis.Grid(self.fname, incomplete=True)
+        self.check(grid, 0)
+        self.assertTrue(np.isnan(grid.signals['sweep_signal']).all())
+        self.assertEqual(grid.refresh(), 0)
+
+        # the sweep signal arrives with the first pixel
+        self.write(1)
+        self.assertEqual(grid.refresh(), 1)
+        self.check(grid, 1)
+        np.testing.assert_array_equal(grid.signals['sweep_signal'], self.full.signals['sweep_signal'])
+
+    def test_partial(self):
+        self.write(4, extra=9)
+        grid = nanonis.Grid(self.fname, incomplete=True)
+        self.check(grid, 4)
+
+        # views taken before a refresh see the new pixels
+        channel = grid.signals['Channel 1 (A)']
+        self.write(17, extra=self.pix_bytes - 4)
+        self.assertEqual(grid.refresh(), 13)
+        self.check(grid, 17)
+
+        self.write(35)
+        self.assertEqual(grid.refresh(), 18)
+        self.check(grid, 35)
+        np.testing.assert_array_equal(channel, self.full.signals['Channel 1 (A)'])
+        np.testing.assert_array_equal(grid.signals['topo'], self.full.signals['topo'])
+        self.assertEqual(grid.refresh(), 0)
+
+    def test_not_incomplete(self):
+        self.assertEqual(self.full.refresh(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
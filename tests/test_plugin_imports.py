@@ -0,0 +1,59 @@
+### Gwyddion imports every plugin file at startup. Importing one must not
+### pull in NumPy or the gwyscripts package, those are only imported when
+### a file is opened or a menu entry is used.
+
+import glob
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+
+_repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# generous, a plugin that only imports the standard library takes a few ms
+_MAX_IMPORT_MS = 200
+
+_SCRIPT = '''
+import json, sys, time, types
+sys.path.insert(0, {repo!r})
+sys.modules['gwy'] = types.ModuleType('gwy')
+start = time.time()
+import {module}
+seconds = time.time() - start
+print(json.dumps(dict(ms=seconds * 1000, loaded=sorted(
+    name for name in ('numpy', 'gwyscripts') if name in sys.modules))))
+'''
+
+
+def plugin_modules():
+    return sorted(os.path.splitext(os.path.basename(path))[0]
+                  for path in glob.glob(os.path.join(_repo_dir, '*.py')))
+
+
+def import_in_subprocess(module):
+    code = _SCRIPT.format(repo=_repo_dir, module=module)
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=_repo_dir)
+    return json.loads(out.decode('ascii').strip().splitlines()[-1])
+
+
+class PluginImportTest(unittest.TestCase):
+
+    def test_plugins_found(self):
+        modules = plugin_modules()
+        for module in ('Read_3ds', 'Read_bin', 'Read_sxm', 'Brick_Warp_Affine',
+                       'DataField_Symmetrize_ThreeFold', 'Brick_Symmetrize_ThreeFold'):
+            self.assertIn(module, modules)
+
+    def test_imports_are_light(self):
+        for module in plugin_modules():
+            result = import_in_subprocess(module)
+            self.assertEqual(result['loaded'], [], '{} imports {} at startup'.format(
+                module, ', '.join(result['loaded'])))
+            self.assertLess(result['ms'], _MAX_IMPORT_MS, '{} took {:.1f} ms to import'.format(
+                module, result['ms']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+### Loading and saving 3ds grids through the Read_3ds plugin with the
+### stand-in gwy objects of gwyscripts.benchmark.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from gwyscripts import benchmark, nanonis
+
+
+class Read3dsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.plugin = benchmark.import_plugin('Read_3ds', benchmark.stand_in_gwy())
+        self.dir = tempfile.mkdtemp()
+        self.saved = sys.modules.get('gwyutils')
+
+        rng = np.random.RandomState(0)
+        nx, ny, num_sweep = 6, 5, 7
+        self.header = dict(dim_px=[nx, ny], pos_xy=[3e-9, -2e-8], size_xy=[1e-8, 8e-9],
+                           angle=12.5, sweep_signal='Bias (V)',
+                           fixed_parameters=['Sweep Start', 'Sweep End'],
+                           experimental_parameters=['X (m)', 'Y (m)', 'Z (m)', 'Current (A)'],
+                           channels=['Current (A)', 'LI Demod 1 X (A)'],
+                           measure_delay=0.002, comment='round trip')
+        params = rng.standard_normal((nx, ny, 6)).astype(np.float32)
+        params[:, :, 0] = 0.5
+        params[:, :, 1] = -0.5
+        self.signals = dict(params=params)
+        for chann in self.header['channels']:
+            self.signals[chann] = rng.standard_normal((nx, ny, num_sweep)).astype(np.float32)
+        self.source = os.path.join(self.dir, 'source.3ds')
+        nanonis.write_grid(self.source, self.header, self.signals)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        if self.saved is None:
+            sys.modules.pop('gwyutils', None)
+        else:
+            sys.modules['gwyutils'] = self.saved
+
+    def round_trip(self):
+        container = self.plugin.load(self.source)
+        target = os.path.join(self.dir, 'target.3ds')
+        self.assertTrue(self.plugin.save(container, target))
+        return container, nanonis.Grid(target)
+
+    def test_grid_alias(self):
+        grid = self.plugin.Grid(self.source, channels=['Current (A)'])
+        self.assertIsInstance(grid, nanonis.Grid)
+        np.testing.assert_array_equal(grid.signals['Current (A)'], self.signals['Current (A)'])
+
+    def test_offsets(self):
+        container = self.plugin.load(self.source)
+        for key in ('/brick/0', '/brick/1', '/0/data', '/3ds/params'):
+            obj = container[key]
+            self.assertAlmostEqual(obj.get_xoffset(), -2e-9, delta=1e-20)
+            self.assertAlmostEqual(obj.get_yoffset(), -2.4e-8, delta=1e-20)
+
+    def test_round_trip(self):
+        # no gwyutils, the Bricks are fetched with get_data one at a time
+        sys.modules['gwyutils'] = None
+        container, grid = self.round_trip()
+        header = grid.header
+        self.assertEqual(header['channels'], self.header['channels'])
+        np.testing.assert_allclose(header['pos_xy'], self.header['pos_xy'], rtol=1e-6)
+        np.testing.assert_allclose(header['size_xy'], self.header['size_xy'], rtol=1e-6)
+        for key in ('angle', 'measure_delay', 'comment', 'fixed_parameters',
+                    'experimental_parameters'):
+            self.assertEqual(header[key], self.header[key])
+        np.testing.assert_array_equal(grid.signals['sweep_signal'],
+                                      nanonis.Grid(self.source).signals['sweep_signal'])
+        np.testing.assert_array_equal(grid.signals['params'], self.signals['params'])
+        for chann in self.header['channels']:
+            np.testing.assert_array_equal(grid.signals[chann], self.signals[chann])
+
+    def test_default_statistics(self):
+        # a small grid gets the colour range without asking for it
+        container = self.plugin.load(self.source)
+        self.assertIn('/0/base/min', container)
+        self.assertIn('/brick/0/meta', container)
+
+        limit = self.plugin.max_statistics_mb
+        self.plugin.max_statistics_mb = 0
+        try:
+            self.assertNotIn('/0/base/min', self.plugin.load(self.source))
+            self.assertIn('/0/base/min', self.plugin.load(self.source, statistics=True))
+        finally:
+            self.plugin.max_statistics_mb = limit
+
+    def test_fft_brick_binned(self):
+        grid = nanonis.Grid(self.source, binning=2)
+        brick = self.plugin.fft_brick(grid, 'Current (A)')
+        # 3 x 2 binned pixels of 1e-8 / 3 x 3.2e-9 m, the last row of the
+        # 5 rows in the file is dropped
+        self.assertAlmostEqual(brick.get_xreal(), 3 / 1e-8, delta=1)
+        self.assertAlmostEqual(brick.get_yreal(), 2 / 6.4e-9, delta=1)
+        self.assertAlmostEqual(brick.get_yoffset(), -1 / 6.4e-9, delta=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+### Loading and saving layer bin files through the Read_bin plugin with
+### the stand-in gwy objects of gwyscripts.benchmark.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from gwyscripts import benchmark, layerbin
+
+
+class ReadBinTest(unittest.TestCase):
+
+    def setUp(self):
+        self.plugin = benchmark.import_plugin('Read_bin', benchmark.stand_in_gwy())
+        self.dir = tempfile.mkdtemp()
+        self.data = np.random.RandomState(0).standard_normal((20, 15))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def round_trip(self, xspacing, yspacing):
+        source = os.path.join(self.dir, 'source.bin')
+        target = os.path.join(self.dir, 'target.bin')
+        layerbin.write_layer(source, self.data, xspacing, yspacing, bias=0.2, setCurrent=1e-10)
+        container = self.plugin.load(source)
+        self.assertTrue(self.plugin.save(container, target))
+        return container['/0/data'], layerbin.read_layer(target)
+
+    def test_shifted_axes(self):
+        xspacing = np.linspace(2e-8, 3e-8, 20)
+        yspacing = np.linspace(-5e-9, 5e-9, 15)
+        dfield, layer = self.round_trip(xspacing, yspacing)
+        self.assertEqual((dfield.get_xoffset(), dfield.get_yoffset()), (2e-8, -5e-9))
+        np.testing.assert_allclose(layer['xspacing'], xspacing, rtol=0, atol=1e-20)
+        np.testing.assert_allclose(layer['yspacing'], yspacing, rtol=0, atol=1e-20)
+        np.testing.assert_array_equal(layer['data'], self.data)
+        self.assertEqual((layer['bias'], layer['setCurrent']), (0.2, 1e-10))
+
+    def test_decreasing_axes(self):
+        xspacing = np.linspace(3e-8, 2e-8, 20)
+        yspacing = np.linspace(5e-9, -4e-9, 15)
+        dfield, layer = self.round_trip(xspacing, yspacing)
+        self.assertEqual((dfield.get_xoffset(), dfield.get_yoffset()), (2e-8, -4e-9))
+        np.testing.assert_allclose(layer['xspacing'], xspacing, rtol=0, atol=1e-20)
+        np.testing.assert_allclose(layer['yspacing'], yspacing, rtol=0, atol=1e-20)
+        np.testing.assert_array_equal(layer['data'], self.data)
+
+    def write_series(self, biases):
+        xspacing = np.linspace(2e-8, 3e-8, 20)
+        yspacing = np.linspace(-5e-9, 5e-9, 15)
+        for k, bias in enumerate(biases):
+            layerbin.write_layer(os.path.join(self.dir, 'layer%d.bin' % k),
+                                 self.data + k, xspacing, yspacing, bias=bias)
+        return os.path.join(self.dir, '*.bin')
+
+    def test_series(self):
+        container = self.plugin.load_series(self.write_series([0.3, -0.1, 0.1]))
+        brick = container['/brick/0']
+        self.assertEqual((brick.get_zoffset(), brick.get_zreal()), (-0.1, 0.4))
+        self.assertEqual((brick.get_xoffset(), brick.get_yoffset()), (2e-8, -5e-9))
+        volume = brick.data.reshape((3, 15, 20)).transpose()
+        for z, k in enumerate((1, 2, 0)):
+            np.testing.assert_array_equal(volume[:, :, z], self.data + k)
+
+    def test_series_uneven_bias(self):
+        self.assertRaises(ValueError, self.plugin.load_series, self.write_series([0.0, 0.1, 0.3]))
+
+    def test_series_repeated_bias(self):
+        self.assertRaises(ValueError, self.plugin.load_series, self.write_series([0.1, 0.1, 0.2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+### Binned, sweep reduced and previewed grids against NumPy reductions of
+### the full grid.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from gwyscripts import benchmark, nanonis
+
+
+def block_mean(data, k):
+    # k x k pixel blocks, the remainder rows and columns dropped
+    nx, ny = data.shape[0] // k, data.shape[1] // k
+    data = data[:nx * k, :ny * k].astype(np.float64)
+    return data.reshape((nx, k, ny, k) + data.shape[2:]).mean(axis=(1, 3))
+
+
+class ReducedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.dir, 'grid.3ds')
+        benchmark.write_grid(self.fname, 7, 5, 11, 2)
+        self.full = nanonis.Grid(self.fname)
+        self.chunk_bytes = nanonis._CHUNK_BYTES
+
+    def tearDown(self):
+        nanonis._CHUNK_BYTES = self.chunk_bytes
+        shutil.rmtree(self.dir)
+
+    def check(self, grid, reduce_pixels, reduce_sweep):
+        for name in ('Channel 0 (A)', 'Channel 1 (A)'):
+            expected = reduce_sweep(reduce_pixels(self.full.signals[name]))
+            self.assertEqual(grid.signals[name].dtype, np.float32)
+            np.testing.assert_allclose(grid.signals[name], expected, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(grid.signals['params'], reduce_pixels(self.full.signals['params']),
+                                   rtol=1e-5, atol=1e-6)
+        sweep = reduce_sweep(self.full.signals['sweep_signal'][None, None])[0, 0]
+        np.testing.assert_allclose(grid.signals['sweep_signal'], sweep, rtol=1e-5, atol=1e-6)
+        self.assertEqual(list(grid.dim_px), list(grid.signals['topo'].shape))
+
+    def test_binning(self):
+        # one binned row per chunk as well as all of them at once
+        for chunk_bytes in (1, self.chunk_bytes):
+            nanonis._CHUNK_BYTES = chunk_bytes
+            grid = nanonis.Grid(self.fname, binning=2)
+            self.assertEqual(list(grid.dim_px), [3, 2])
+            self.check(grid, lambda data: block_mean(data, 2), lambda data: data)
+
+    def test_sweep_step(self):
+        grid = nanonis.Grid(self.fname, sweep_step=3, sweep_range=(1, 11))
+        self.check(grid, lambda data: data, lambda data: data[:, :, 1:11:3])
+
+    def test_sweep_average(self):
+        # three whole groups of three in 1 .. 10, the last point dropped
+        grid = nanonis.Grid(self.fname, binning=3, sweep_step=3, sweep_average=True,
+                            sweep_range=(1, 11))
+        self.check(grid, lambda data: block_mean(data, 3),
+                   lambda data: data[:, :, 1:10].reshape(data.shape[:2] + (3, 3)).mean(axis=3))
+
+    def test_preview(self):
+        grid = nanonis.Grid(self.fname, preview=4)
+        self.check(grid, lambda data: data, lambda data: data[:, :, [0, 3, 7, 10]])
+        # more slices than the sweep holds gives every point
+        grid = nanonis.Grid(self.fname, preview=20, sweep_range=(2, 6))
+        self.check(grid, lambda data: data, lambda data: data[:, :, 2:6])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+### Reading small synthetic Nanonis sxm files, complete and truncated.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from gwyscripts import nanonis
+
+
+_HEADER = '''\
+:SCAN_PIXELS:
+       4       3
+:SCAN_RANGE:
+           1.000000E-8           1.000000E-8
+:SCAN_DIR:
+down
+:DATA_INFO:
+\tChannel\tName\tUnit\tDirection\tCalibration\tOffset
+\t14\tZ\tm\tboth\t1.000E+0\t0.000E+0
+
+:SCANIT_END:
+'''
+
+
+class ScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.dir, 'scan.sxm')
+        self.data = np.arange(2 * 3 * 4, dtype='>f4')
+        with open(self.fname, 'wb') as f:
+            f.write(_HEADER.encode('latin1') + b'\n\x1a\x04')
+            self.data.tofile(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def truncate(self, size):
+        with open(self.fname, 'rb+') as f:
+            f.truncate(size)
+
+    def test_read(self):
+        scan = nanonis.Scan(self.fname)
+        frames = self.data.reshape((2, 3, 4))
+        np.testing.assert_array_equal(scan.signals['Z']['forward'], frames[0].T)
+        np.testing.assert_array_equal(scan.signals['Z']['backward'], frames[1].T[::-1])
+
+    def test_truncated_data(self):
+        self.truncate(os.path.getsize(self.fname) - 4)
+        with self.assertRaises(ValueError) as raised:
+            nanonis.Scan(self.fname)
+        self.assertIn('expected 24 values but found 23', str(raised.exception))
+
+    def test_truncated_header(self):
+        self.truncate(len(_HEADER) // 2)
+        self.assertRaises(ValueError, nanonis.Scan, self.fname)
+
+
+if __name__ == '__main__':
+    unittest.main()
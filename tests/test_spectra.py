@@ -0,0 +1,48 @@
+### Derivatives and smoothing of grid spectra against NumPy.
+
+import unittest
+
+import numpy as np
+
+from gwyscripts import spectra
+
+
+class SpectraTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.sweep = np.linspace(-0.5, 0.7, 25)
+        self.data = rng.standard_normal((9, 4, 25)).astype(np.float32)
+        self.chunk_bytes = spectra._CHUNK_BYTES
+
+    def tearDown(self):
+        spectra._CHUNK_BYTES = self.chunk_bytes
+
+    def test_didv(self):
+        # central differences inside, second order one sided ones at the
+        # ends, also a couple of rows per chunk
+        expected = np.gradient(self.data.astype(np.float64), self.sweep, axis=2, edge_order=2)
+        for chunk_bytes in (2 * 4 * 25 * 4, self.chunk_bytes):
+            spectra._CHUNK_BYTES = chunk_bytes
+            got = spectra.didv(self.data, self.sweep)
+            self.assertEqual(got.dtype, np.float32)
+            np.testing.assert_allclose(got, expected, rtol=1e-4, atol=1e-4)
+
+        # big endian input and a decreasing sweep
+        got = spectra.didv(self.data.astype('>f4')[:, :, ::-1], self.sweep[::-1])
+        np.testing.assert_allclose(got, expected[:, :, ::-1], rtol=1e-4, atol=1e-4)
+
+    def test_polynomial(self):
+        # a wider window fits a cubic exactly, so the derivative is exact
+        sweep = self.sweep
+        data = np.tile(1 - 2 * sweep + 3 * sweep ** 3, (2, 3, 1))
+        got = spectra.didv(data, sweep, window=7, order=3)
+        np.testing.assert_allclose(got, np.tile(-2 + 9 * sweep ** 2, (2, 3, 1)), rtol=1e-4, atol=1e-4)
+        np.testing.assert_allclose(spectra.smooth(data, window=7, order=3), data, rtol=1e-5, atol=1e-5)
+
+    def test_uneven(self):
+        self.assertRaises(ValueError, spectra.didv, self.data[:, :, :3], [0.0, 0.1, 0.3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+### Symmetrizing images that already have the symmetry leaves them as
+### they are.
+
+import unittest
+
+import numpy as np
+
+from gwyscripts import symmetrize
+
+
+class SymmetrizeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image = np.random.RandomState(0).standard_normal((9, 9))
+
+    def test_fourfold(self):
+        image = sum(np.rot90(self.image, k) for k in range(4))
+        np.testing.assert_allclose(symmetrize.symmetrize(image, 4), image, atol=1e-12)
+        # a 4-fold symmetric image is also 2-fold symmetric
+        np.testing.assert_allclose(symmetrize.symmetrize(image, 2), image, atol=1e-12)
+
+    def test_twofold(self):
+        # rectangular, about the centre of an even number of rows
+        image = self.image[:, :8] + self.image[::-1, 7::-1]
+        np.testing.assert_allclose(symmetrize.symmetrize(image, 2), image, atol=1e-12)
+
+    def test_mirror(self):
+        image = self.image + self.image[:, ::-1]
+        np.testing.assert_allclose(symmetrize.symmetrize(image, 1, mirror=True), image, atol=1e-12)
+        image = image + image[::-1]
+        np.testing.assert_allclose(symmetrize.symmetrize(image, 2, mirror=True, mirror_angle=np.pi / 2),
+                                   image, atol=1e-12)
+
+    def test_identity(self):
+        np.testing.assert_array_equal(symmetrize.symmetrize(self.image, 1), self.image)
+
+    def test_volume(self):
+        # float32 layers symmetrized in place, in blocks of a few layers
+        image = sum(np.rot90(self.image, k) for k in range(4))
+        volume = (image[:, :, None] * np.arange(1, 6)).astype(np.float32)
+        expected = volume.copy()
+        out = symmetrize.symmetrize_volume(volume, 4, threads=2, out=volume)
+        self.assertIs(out, volume)
+        np.testing.assert_allclose(volume, expected, rtol=1e-5, atol=1e-5)
+
+    def test_average(self):
+        # a 2-fold symmetrized image is the mean with its half turn
+        expected = 0.5 * (self.image + self.image[::-1, ::-1])
+        np.testing.assert_allclose(symmetrize.symmetrize(self.image, 2), expected, atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+### Bulk transfer into and out of the stand-in gwy objects of
+### gwyscripts.benchmark, which keep their data in the Gwyddion layout:
+### row-major with x running fastest.
+
+import sys
+import types
+import unittest
+
+import numpy as np
+
+from gwyscripts import benchmark, transfer
+
+
+def _fake_gwyutils():
+    gwyutils = types.ModuleType('gwyutils')
+    gwyutils.data_field_data_as_array = lambda obj: obj.data
+    gwyutils.brick_data_as_array = lambda obj: obj.data
+    return gwyutils
+
+
+class TransferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.gwy = benchmark.stand_in_gwy()
+        rng = np.random.RandomState(0)
+        self.field = rng.standard_normal((5, 3)).astype('>f4')
+        self.volume = rng.standard_normal((5, 3, 4)).astype('>f4')
+        self.saved = sys.modules.get('gwyutils')
+
+    def tearDown(self):
+        if self.saved is None:
+            sys.modules.pop('gwyutils', None)
+        else:
+            sys.modules['gwyutils'] = self.saved
+
+    def check_orientation(self, dfield, brick):
+        for x, y in ((0, 0), (4, 0), (0, 2), (3, 1)):
+            self.assertEqual(dfield.get_val(x, y), self.field[x, y])
+            for z in (0, 3):
+                self.assertEqual(brick.get_val(x, y, z), self.volume[x, y, z])
+
+    def transfer_both(self):
+        dfield = self.gwy.DataField(5, 3, 1.0, 1.0)
+        brick = self.gwy.Brick(5, 3, 4, 1.0, 1.0, 1.0)
+        methods = (transfer.array_to_datafield(self.field, dfield),
+                   transfer.array_to_brick(self.volume, brick))
+        return dfield, brick, methods
+
+    def test_view(self):
+        sys.modules['gwyutils'] = _fake_gwyutils()
+        dfield, brick, methods = self.transfer_both()
+        self.assertEqual(methods, ('view', 'view'))
+        self.check_orientation(dfield, brick)
+        np.testing.assert_array_equal(transfer.datafield_to_array(dfield), self.field)
+        np.testing.assert_array_equal(transfer.brick_to_array(brick), self.volume)
+
+        # views share memory with the objects
+        transfer.brick_view(brick)[1, 2, 3] = 7.0
+        self.assertEqual(brick.get_val(1, 2, 3), 7.0)
+
+    def test_set_data(self):
+        sys.modules['gwyutils'] = None
+        dfield, brick, methods = self.transfer_both()
+        self.assertEqual(methods, ('set_data', 'set_data'))
+        self.check_orientation(dfield, brick)
+        np.testing.assert_array_equal(transfer.datafield_to_array(dfield), self.field)
+        np.testing.assert_array_equal(transfer.brick_to_array(brick), self.volume)
+
+    def test_set_val(self):
+        sys.modules['gwyutils'] = None
+
+        def unsupported(data):
+            raise NotImplementedError
+
+        dfield = self.gwy.DataField(5, 3, 1.0, 1.0)
+        brick = self.gwy.Brick(5, 3, 4, 1.0, 1.0, 1.0)
+        dfield.set_data = brick.set_data = unsupported
+        self.assertEqual(transfer.array_to_datafield(self.field, dfield), 'set_val')
+        self.assertEqual(transfer.array_to_brick(self.volume, brick), 'set_val')
+        self.check_orientation(dfield, brick)
+
+    def test_set_data_limit(self):
+        sys.modules['gwyutils'] = None
+        limit = transfer._SET_DATA_LIMIT
+        transfer._SET_DATA_LIMIT = 10
+        try:
+            dfield = self.gwy.DataField(5, 3, 1.0, 1.0)
+            brick = self.gwy.Brick(5, 3, 4, 1.0, 1.0, 1.0)
+            # too large for set_data and get_data, copied value by value
+            self.assertEqual(transfer.array_to_datafield(self.field, dfield), 'set_val')
+            self.assertEqual(transfer.array_to_brick(self.volume, brick), 'set_val')
+            self.check_orientation(dfield, brick)
+
+            def too_large():
+                raise AssertionError('get_data called above the limit')
+
+            brick.get_data = dfield.get_data = too_large
+            np.testing.assert_array_equal(transfer.datafield_to_array(dfield), self.field)
+            np.testing.assert_array_equal(transfer.brick_to_array(brick), self.volume)
+        finally:
+            transfer._SET_DATA_LIMIT = limit
+
+    def test_update(self):
+        for gwyutils, method in ((_fake_gwyutils(), 'view'), (None, 'set_data')):
+            sys.modules['gwyutils'] = gwyutils
+            dfield, brick, methods = self.transfer_both()
+            data = transfer.brick_view(brick)
+            data *= 2
+            self.assertEqual(transfer.update_brick(brick, data), method)
+            np.testing.assert_array_equal(transfer.brick_to_array(brick), 2 * self.volume)
+            data = transfer.datafield_view(dfield)
+            data += 1
+            self.assertEqual(transfer.update_datafield(dfield, data), method)
+            np.testing.assert_array_equal(transfer.datafield_to_array(dfield), self.field.astype(np.float64) + 1)
+
+    def test_shape_mismatch(self):
+        brick = self.gwy.Brick(3, 5, 4, 1.0, 1.0, 1.0)
+        self.assertRaises(ValueError, transfer.array_to_brick, self.volume, brick)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+### Affine and displacement warps that move pixels by whole steps, checked
+### against plain NumPy indexing.
+
+import unittest
+
+import numpy as np
+
+from gwyscripts import warp
+
+
+class WarpTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image = np.random.RandomState(0).standard_normal((8, 6))
+
+    def shifted(self, tx, ty, fill):
+        # output pixel (x, y) samples the input at (x + tx, y + ty)
+        nx, ny = self.image.shape
+        expected = np.full((nx, ny), fill)
+        expected[max(0, -tx):nx - max(0, tx), max(0, -ty):ny - max(0, ty)] = \
+            self.image[max(0, tx):nx + min(0, tx), max(0, ty):ny + min(0, ty)]
+        return expected
+
+    def test_identity(self):
+        np.testing.assert_array_equal(warp.warp(self.image), self.image)
+        np.testing.assert_allclose(warp.warp(self.image, matrix=np.eye(2), offset=(0, 0)),
+                                   self.image, atol=1e-12)
+
+    def test_shift(self):
+        for tx, ty in ((2, -1), (-3, 0), (0, 4)):
+            np.testing.assert_allclose(warp.warp(self.image, offset=(tx, ty), fill=-7.0),
+                                       self.shifted(tx, ty, -7.0), atol=1e-12)
+
+    def test_displacement(self):
+        # a uniform displacement field is the same as an offset
+        displacement = np.empty(self.image.shape + (2,))
+        displacement[...] = (2, -1)
+        np.testing.assert_allclose(warp.warp(self.image, displacement=displacement),
+                                   self.shifted(2, -1, 0.0), atol=1e-12)
+
+    def test_rotation(self):
+        image = self.image[:6]
+        matrix = [[0, -1], [1, 0]]
+        np.testing.assert_allclose(warp.warp(image, matrix=matrix), np.rot90(image, -1), atol=1e-12)
+
+    def test_volume(self):
+        # float32 layers warped in place, in blocks of a few layers
+        volume = (self.image[:, :, None] * np.arange(1, 6)).astype(np.float32)
+        expected = self.shifted(2, -1, 0.0)[:, :, None] * np.arange(1, 6)
+        out = warp.warp_volume(volume, offset=(2, -1), threads=2, out=volume)
+        self.assertIs(out, volume)
+        np.testing.assert_allclose(volume, expected, rtol=1e-6, atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()